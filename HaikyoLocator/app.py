@@ -1,14 +1,31 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 from scraper import HaikyoScraper
 import threading
-import queue
-import simplekml
 import os
-from constants import DEFAULT_KML_FILENAME
+from constants import DEFAULT_KML_FILENAME, DEFAULT_KMZ_FILENAME, NEGATIVE_CACHE_FILENAME
+from negative_cache import NegativeCache
+from state_store import open_state_store
+import metrics
+import tracing
+import profiling
+import kml_regions
 
 app = Flask(__name__)
-progress_queue = queue.Queue()
-current_progress = {'percent': 0, 'message': '', 'locations': []}
+# Progress of the running scrape ('progress') and its finished results ('results') live in
+# the state store, shared by every worker process
+state = open_state_store()
+IDLE_PROGRESS = {'percent': 0, 'message': '', 'locations': []}
+# Locations whose pages and blog posts had no coordinates, shared by all scrape jobs
+negative_cache = NegativeCache(NEGATIVE_CACHE_FILENAME)
+
+def update_progress(**changes):
+    """Update fields of the scrape progress"""
+    state.update('progress', lambda progress: dict(progress, **changes), IDLE_PROGRESS)
+
+def add_progress_location(location_data):
+    """Append a scraped location to the progress"""
+    state.update('progress', lambda progress: dict(progress, locations=progress['locations'] + [location_data]),
+                 IDLE_PROGRESS)
 
 @app.route('/')
 def index():
@@ -20,28 +37,28 @@ def scrape():
     num_locations = int(request.form.get('num_locations', 5))
 
     # Reset progress
-    global current_progress
-    current_progress = {'percent': 0, 'message': 'Starting scrape...', 'locations': []}
+    state.set('progress', dict(IDLE_PROGRESS, message='Starting scrape...'))
 
+    @metrics.job('scrape')
+    @tracing.record('scrape')
     def scrape_task():
         scraper = HaikyoScraper()
+        scraper.negative_cache = negative_cache
         try:
             # Update progress for initialization
-            current_progress['percent'] = 10
-            current_progress['message'] = 'Initializing scraper...'
+            update_progress(percent=10, message='Initializing scraper...')
 
             # Fetch and process locations
             html_content = scraper.fetch_page(url)
             if not html_content:
-                current_progress['message'] = 'Failed to fetch main page'
+                update_progress(message='Failed to fetch main page')
                 return
 
-            current_progress['percent'] = 20
-            current_progress['message'] = 'Fetching location links...'
+            update_progress(percent=20, message='Fetching location links...')
 
             location_links = scraper.get_location_links(html_content)
             if not location_links:
-                current_progress['message'] = 'No location links found'
+                update_progress(message='No location links found')
                 return
 
             # Limit to requested number of locations
@@ -51,7 +68,7 @@ def scrape():
 
             locations = []
             for i, link in enumerate(location_links):
-                current_progress['message'] = f'Processing location {i+1} of {total_locations}...'
+                update_progress(message=f'Processing location {i+1} of {total_locations}...')
                 location = scraper.scrape_location(link)
                 if location:
                     location_data = {
@@ -61,14 +78,14 @@ def scrape():
                         'url': link
                     }
                     locations.append(location_data)
-                    current_progress['locations'].append(location_data)
-                current_progress['percent'] = 20 + ((i + 1) * progress_per_location)
+                    add_progress_location(location_data)
+                update_progress(percent=20 + ((i + 1) * progress_per_location))
 
             # Generate KML file
             if locations:
-                current_progress['percent'] = 90
-                current_progress['message'] = 'Generating KML file...'
+                update_progress(percent=90, message='Generating KML file...')
 
+                import simplekml  # Imported on first use to keep startup fast
                 kml = simplekml.Kml()
                 for loc in locations:
                     if loc.get('coordinates'):
@@ -80,16 +97,22 @@ def scrape():
                 static_folder = 'static'
                 if not os.path.exists(static_folder):
                     os.makedirs(static_folder)
-                kml.save(os.path.join(static_folder, DEFAULT_KML_FILENAME))
+                with metrics.timed('kml_render'):
+                    kml.save(os.path.join(static_folder, DEFAULT_KML_FILENAME))
+                    # Google Earth only loads the tiles of the visible area and zoom level
+                    placemarks = [(loc['name_ja'], loc['coordinates'][0], loc['coordinates'][1],
+                                   f"{loc['name_en']}<br><a href=\"{loc['url']}\">{loc['url']}</a>")
+                                  for loc in locations if loc.get('coordinates')]
+                    kml_regions.write_kmz(kml_regions.build_tiles(placemarks),
+                                          os.path.join(static_folder, DEFAULT_KMZ_FILENAME))
 
             # Final progress update
-            current_progress['percent'] = 100
-            current_progress['message'] = 'Scraping completed'
-            progress_queue.put(locations)
+            update_progress(percent=100, message='Scraping completed')
+            state.set('results', locations)
 
         except Exception as e:
-            current_progress['message'] = f'Error: {str(e)}'
-            progress_queue.put([])
+            update_progress(message=f'Error: {str(e)}')
+            state.set('results', [])
 
     # Start scraping in a separate thread
     thread = threading.Thread(target=scrape_task)
@@ -98,15 +121,51 @@ def scrape():
 
 @app.route('/progress')
 def get_progress():
-    return jsonify(current_progress)
+    return jsonify(state.get('progress', IDLE_PROGRESS))
 
 @app.route('/results')
 def get_results():
+    # Results are handed out once, to whichever worker is polled first
+    locations = state.pop('results')
+    if locations is None:
+        return jsonify({'locations': None, 'kml_file': None, 'kmz_file': None})
+    return jsonify({'locations': locations,
+                    'kml_file': f'/download/{DEFAULT_KML_FILENAME}' if locations else None,
+                    'kmz_file': f'/download/{DEFAULT_KMZ_FILENAME}' if locations else None})
+
+@app.route('/metrics')
+def get_metrics():
+    """Expose stage latencies, cache hit ratios and job counts for Prometheus"""
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/traces')
+def list_traces():
+    """List the recorded scrape traces, newest first (recorded when HAIKYO_TRACE is set)"""
+    return jsonify({'enabled': tracing.ENABLED, 'traces': tracing.store.summaries()})
+
+@app.route('/traces/<job_id>')
+def download_trace(job_id):
+    """Download a scrape trace as trace-event JSON for chrome://tracing or Perfetto"""
+    trace = tracing.store.get(job_id)
+    if trace is None:
+        return "Trace not found", 404
+    return Response(trace.to_json(), mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename={job_id}.json'})
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread's stack for ?seconds=N and return collapsed stacks (needs HAIKYO_PROFILER=1)"""
+    if not profiling.ENABLED:
+        return jsonify({'error': 'Profiler is disabled'}), 404
     try:
-        locations = progress_queue.get_nowait()
-        return jsonify({'locations': locations, 'kml_file': f'/download/{DEFAULT_KML_FILENAME}' if locations else None})
-    except queue.Empty:
-        return jsonify({'locations': None, 'kml_file': None})
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+    try:
+        stacks = profiling.profiler.profile(seconds)
+    except profiling.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(profiling.collapse(stacks), mimetype='text/plain')
 
 @app.route('/download/<filename>')
 def download_file(filename):
@@ -115,4 +174,6 @@ def download_file(filename):
     return "File not found", 404
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    import serving
+    args = serving.parse_args(description="Haikyo Locator web app (development server)")
+    app.run(host=args.host, port=args.port, debug=args.debug)
\ No newline at end of file
@@ -10,9 +10,24 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
+# Blog posts checked for coordinates when a location page has no map section
+MAX_BLOG_POSTS = 3
+
+# Link fragments that mark a blog post worth checking
+BLOG_LINK_KEYWORDS = ['記事', 'blog', 'entry']
+
+# Bytes read per chunk when streaming blog posts
+BLOG_CHUNK_SIZE = 16 * 1024
+
+# SQLite file remembering locations without coordinates
+NEGATIVE_CACHE_FILENAME = "unresolvable.db"
+
 # Default filename for KML output
 DEFAULT_KML_FILENAME = "haikyo_locations.kml"
 
+# Regionated KMZ super-overlay for Google Earth, written next to the KML
+DEFAULT_KMZ_FILENAME = "haikyo_locations.kmz"
+
 # Default filename for text output
 DEFAULT_TEXT_FILENAME = "haikyo_locations.txt"
 
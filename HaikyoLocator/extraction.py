@@ -0,0 +1,188 @@
+"""
+Module for extracting several fields from a parsed page in one pass.
+
+Scraping a detail page used to mean one find()/find_all() call per field
+and fallback, each walking the whole tree again. Here the rules for every
+field are declared once in an ExtractionPlan, and run() visits each node
+of the tree a single time, offering it to the rules of the fields that are
+still open:
+
+    plan = ExtractionPlan(
+        Field('title',
+              Rule(tag('h1'), lambda node: node.get_text(strip=True) or None),
+              Rule(tag('title'), lambda node: node.get_text(strip=True) or None)),
+        Field('links', Rule(tag('a', href=True), lambda node: node['href']), many=True),
+    )
+    fields = plan.run(soup)
+
+The rules of a field are in order of preference. The first node a rule
+accepts wins for that rule; a field is closed as soon as its first rule
+has matched, and the walk ends once every field is closed.
+"""
+
+# Tag names whose string children are markup rather than text
+_NON_TEXT = frozenset(('Comment', 'CData', 'Doctype', 'Declaration', 'ProcessingInstruction',
+                       'Script', 'Stylesheet', 'TemplateString'))
+
+
+def tag(*names, where=None, **attrs):
+    """
+    Match elements by name and attributes.
+
+    Args:
+        *names (str): Accepted tag names; any tag if empty.
+        where (callable, optional): Extra predicate on the element.
+        **attrs: Attribute values to require; True only requires presence.
+            Use class_ for the class attribute (any of its classes matches).
+
+    Returns:
+        callable: Predicate on tree nodes.
+    """
+    names = frozenset(names)
+    if 'class_' in attrs:
+        attrs['class'] = attrs.pop('class_')
+
+    def match(node):
+        if node.name is None or (names and node.name not in names):
+            return False
+        for attr, expected in attrs.items():
+            value = node.get(attr)
+            if value is None:
+                return False
+            if expected is True:
+                continue
+            if isinstance(value, list):
+                if expected not in value:
+                    return False
+            elif value != expected:
+                return False
+        return where is None or where(node)
+    return match
+
+
+def text(pattern):
+    """
+    Match text nodes (not comments, scripts or styles) by a compiled regex.
+
+    Args:
+        pattern (re.Pattern): Pattern searched in the string.
+
+    Returns:
+        callable: Predicate on tree nodes.
+    """
+    def match(node):
+        return (node.name is None and type(node).__name__ not in _NON_TEXT
+                and pattern.search(node) is not None)
+    return match
+
+
+class Rule:
+    """
+    One way of getting a field's value from a node.
+    """
+
+    def __init__(self, match, extract=None, after=None):
+        """
+        Initialize the rule.
+
+        Args:
+            match (callable): Predicate selecting candidate nodes.
+            extract (callable, optional): Turns a candidate into the value;
+                returning None rejects it and the walk goes on. Defaults to
+                the node itself.
+            after (callable, optional): Predicate for a label node; only
+                candidates that come after the first such node are taken,
+                as with find(label).find_next(...).
+        """
+        self.match = match
+        self.extract = extract or (lambda node: node)
+        self.after = after
+
+    def apply(self, node, armed):
+        """
+        Offer a node to the rule.
+
+        Args:
+            node: The tree node.
+            armed (set): Rules whose label has been seen in this run.
+
+        Returns:
+            The extracted value, or None.
+        """
+        if self.after is not None and self not in armed:
+            if self.after(node):
+                armed.add(self)
+            return None
+        if not self.match(node):
+            return None
+        return self.extract(node)
+
+
+class Field:
+    """
+    A named value with its rules in order of preference.
+    """
+
+    def __init__(self, name, *rules, many=False):
+        """
+        Initialize the field.
+
+        Args:
+            name (str): Key of the value in the results.
+            *rules (Rule): Rules, most preferred first.
+            many (bool): Collect the values of every matching node (from any
+                rule) into a list instead of keeping the best one.
+        """
+        self.name = name
+        self.rules = rules
+        self.many = many
+
+
+class ExtractionPlan:
+    """
+    A set of fields extracted together in one walk over the tree.
+    """
+
+    def __init__(self, *fields):
+        """
+        Initialize the plan.
+
+        Args:
+            *fields (Field): The fields to extract.
+        """
+        self.fields = fields
+
+    def run(self, root):
+        """
+        Extract every field from a tree.
+
+        Args:
+            root: BeautifulSoup object or element to walk.
+
+        Returns:
+            dict: Field name -> value; fields without a match are missing,
+                'many' fields are always present as lists.
+        """
+        results = {field.name: [] for field in self.fields if field.many}
+        # Field name -> number of rules still worth trying (those preferred over the current value)
+        limits = {field.name: len(field.rules) for field in self.fields}
+        pending = list(self.fields)
+        armed = set()
+
+        for node in root.descendants:
+            for field in pending:
+                for priority, rule in enumerate(field.rules[:limits[field.name]]):
+                    value = rule.apply(node, armed)
+                    if value is None:
+                        continue
+                    if field.many:
+                        results[field.name].append(value)
+                    else:
+                        results[field.name] = value
+                        limits[field.name] = priority
+                    break
+            if any(limits[field.name] == 0 for field in pending):
+                pending = [field for field in pending if limits[field.name]]
+                if not pending:
+                    break
+        return results
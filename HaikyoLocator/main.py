@@ -1,5 +1,11 @@
 
-from app import app
+import serving
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    args = serving.parse_args(description="Haikyo Locator web app")
+    if args.production:
+        # Several worker processes sharing their state through HAIKYO_STATE
+        serving.serve("app:app", args.host, args.port, args.workers)
+    else:
+        from app import app
+        app.run(host=args.host, port=args.port, debug=args.debug)
@@ -1,14 +1,27 @@
 """
 Main scraper script for haikyo.info
 """
+from __future__ import annotations
+
 import logging
+import threading
 import requests
-from bs4 import BeautifulSoup
 import re
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin, urlparse, unquote
-from constants import BASE_URL, HEADERS, DEFAULT_TEXT_FILENAME
-from googletrans import Translator
+from constants import (BASE_URL, HEADERS, DEFAULT_TEXT_FILENAME, MAX_BLOG_POSTS,
+                       BLOG_LINK_KEYWORDS, BLOG_CHUNK_SIZE)
+from typing import TYPE_CHECKING
+import metrics
+import tracing
+from negative_cache import content_digest
+from utils import extract_spot_id
+from extraction import ExtractionPlan, Field, Rule, tag, text
+
+if TYPE_CHECKING:
+    # For annotations only; bs4 and googletrans are imported on first use to keep startup fast
+    from bs4 import BeautifulSoup
 
 # Configure logging
 logging.basicConfig(
@@ -16,35 +29,149 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+def make_soup(html: str | bytes) -> BeautifulSoup:
+    """
+    Parse HTML, importing bs4 on first use (bytes are decoded by bs4)
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
+
+def _heading_name(heading) -> str | None:
+    """
+    Location name from a non-empty heading
+    """
+    if not heading.text.strip():
+        return None
+    return heading.text.split('は')[0].strip()
+
+def _is_main_image(img) -> bool:
+    """
+    Whether an image has a main, header or hero class
+    """
+    return any('main' in c or 'header' in c or 'hero' in c for c in img.get('class', []))
+
+def _content_image_src(img) -> str | None:
+    """
+    Image source unless it looks like an icon
+    """
+    src = img['src']
+    if src and not src.endswith(('.gif', '.svg', '.ico')) and not 'icon' in src.lower():
+        return src
+    return None
+
+# Either half of ストリートビュー, which pages sometimes split across inline tags
+STREET_VIEW_PART = re.compile('ストリート|ビュー')
+
+# Everything read from a location page (and blog posts), gathered in one walk over the soup
+LOCATION_PAGE_PLAN = ExtractionPlan(
+    Field('name',
+          Rule(tag('h1', 'h2', 'h3'), _heading_name),
+          Rule(tag('meta', property='og:title', content=True),
+               lambda meta: meta['content'].split('は')[0].strip() if meta['content'] else None),
+          Rule(tag('title'), lambda title: title.text.split('は')[0].strip() if title.text else None)),
+    Field('image',
+          Rule(tag('img', src=True, where=_is_main_image), lambda img: img['src'] or None),
+          Rule(tag('img', src=True), _content_image_src)),
+    Field('street_view_strings', Rule(text(STREET_VIEW_PART)), many=True),
+    Field('links', Rule(tag('a', href=True), lambda link: link['href']), many=True),
+)
+
+# Blog posts are only searched for their Street View sections
+BLOG_POST_PLAN = ExtractionPlan(
+    Field('street_view_strings', Rule(text(STREET_VIEW_PART)), many=True),
+)
+
+def sections_containing(strings: list, phrase: str) -> list:
+    """
+    Div, section and p elements around the strings whose text contains a phrase, outermost first
+
+    The whole text of each section is searched, so a phrase split across inline tags
+    (<b>Google</b> Maps) is found as long as one of its parts is among the strings
+    """
+    sections = {}
+    for string in strings:
+        # Each new chain of ancestors starts after the previous ones, so document order is kept
+        chain = [parent for parent in string.parents if parent.name in ('div', 'section', 'p')]
+        for section in reversed(chain):
+            sections.setdefault(id(section), section)
+    return [section for section in sections.values() if phrase in section.get_text()]
+
 class HaikyoScraper:
     def __init__(self):
         self.session = requests.Session()
         self.session.headers.update(HEADERS)
-        self.translator = Translator()
+        self._translator = None  # Created on first translation
+        self._translator_lock = threading.Lock()  # Blog post threads may translate at the same time
         self.translation_cache = {}
         self.processed_urls = set()  # Cache for processed URLs
+        self._processed_lock = threading.Lock()  # Claims come from concurrent blog post threads
+        self.negative_cache = None  # Optional NegativeCache of pages whose blog posts had no coordinates
+
+    @property
+    def translator(self):
+        """
+        The googletrans Translator, imported and created on first use
+        """
+        with self._translator_lock:
+            if self._translator is None:
+                from googletrans import Translator
+                self._translator = Translator()
+            return self._translator
 
     def fetch_page(self, url: str) -> str:
         """
         Fetch a page and return its HTML content
         """
         try:
-            # Don't fetch URLs we've already processed
+            if not self._claim_url(url):
+                return None
+
+            logging.info(f"Fetching URL: {url}")
+            with metrics.timed('fetch'):
+                response = self.session.get(url, headers=HEADERS, timeout=10)  # Add timeout
+                response.raise_for_status()
+            return response.text
+        except Exception as e:
+            logging.error(f"Error fetching {url}: {str(e)}")
+            return None
+
+    def _claim_url(self, url: str) -> bool:
+        """
+        Check that a URL should be fetched and mark it as processed
+        """
+        # Only process certain domains
+        parsed_url = urlparse(url)
+        if any(domain in parsed_url.netloc for domain in ['fc2.com/signup', 'secure.', 'blog.fc2.com/']):
+            logging.debug(f"Skipping non-content URL: {url}")
+            return False
+
+        # Don't fetch URLs we've already processed; check and mark at once so only one thread claims a URL
+        with self._processed_lock:
             if url in self.processed_urls:
                 logging.debug(f"Skipping already processed URL: {url}")
-                return None
+                return False
+            self.processed_urls.add(url)  # Mark as processed
+        return True
 
-            # Only process certain domains
-            parsed_url = urlparse(url)
-            if any(domain in parsed_url.netloc for domain in ['fc2.com/signup', 'secure.', 'blog.fc2.com/']):
-                logging.debug(f"Skipping non-content URL: {url}")
+    def fetch_raw(self, url: str, stop: threading.Event) -> bytes:
+        """
+        Stream a page's raw bytes, abandoning the download once stop is set
+        """
+        try:
+            if not self._claim_url(url):
                 return None
 
             logging.info(f"Fetching URL: {url}")
-            self.processed_urls.add(url)  # Mark as processed
-            response = self.session.get(url, headers=HEADERS, timeout=10)  # Add timeout
-            response.raise_for_status()
-            return response.text
+            chunks = []
+            with metrics.timed('fetch'):
+                with self.session.get(url, headers=HEADERS, timeout=10, stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=BLOG_CHUNK_SIZE):
+                        if stop.is_set():
+                            logging.debug(f"Cancelled fetch of {url}")
+                            return None
+                        chunks.append(chunk)
+            return b"".join(chunks)
         except Exception as e:
             logging.error(f"Error fetching {url}: {str(e)}")
             return None
@@ -92,8 +219,9 @@ class HaikyoScraper:
         """
         Find coordinates in a specific section using various methods
         """
-        # Log the section HTML for debugging
-        logging.debug(f"Analyzing section HTML: {section.prettify()}")
+        # Log the section HTML for debugging (prettify is costly, so only when enabled)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Analyzing section HTML: {section.prettify()}")
 
         # Check for <gmap-frame> tags first (custom element for map embeds)
         gmap_frames = section.find_all('gmap-frame')
@@ -151,91 +279,140 @@ class HaikyoScraper:
 
         return None
 
-    def find_coordinates(self, soup: BeautifulSoup, location_name: str) -> tuple:
+    def find_coordinates(self, soup: BeautifulSoup, location_name: str, search_blogs: bool = True,
+                         fields: dict | None = None) -> tuple:
         """
         Find coordinates in sections containing location name and ストリートビュー
+
+        Blog posts linked from the page are only checked when search_blogs is set;
+        fields are the page's LOCATION_PAGE_PLAN results if already extracted
         """
+        if fields is None:
+            fields = LOCATION_PAGE_PLAN.run(soup)
+
         # Extract the main name part before any descriptive text
         base_name = location_name.split('は')[0].strip()
         if len(base_name) > 10:
             base_name = base_name[:10]  # Use first part of name to match
 
         # First try to find the specific Street View and aerial photos section
-        for section in soup.find_all(['div', 'section', 'p']):
-            if "ストリートビュー・空中写真" in section.get_text():
-                logging.info(f"Found Street View and aerial photos section")
-                coords = self.find_coordinates_in_section(section)
-                if coords:
-                    return coords
+        for section in sections_containing(fields['street_view_strings'], "ストリートビュー・空中写真"):
+            logging.info(f"Found Street View and aerial photos section")
+            coords = self.find_coordinates_in_section(section)
+            if coords:
+                return self._coordinates_found('street_view_section', coords)
 
         # If not found, try sections containing both location name and Street View
-        for section in soup.find_all(['div', 'section', 'p']):
-            text = section.get_text()
-            if base_name in text and "ストリートビュー" in text:
+        for section in sections_containing(fields['street_view_strings'], "ストリートビュー"):
+            if base_name in section.get_text():
                 logging.info(f"Found section with location name and Street View for: {base_name}")
                 coords = self.find_coordinates_in_section(section)
                 if coords:
-                    return coords
+                    return self._coordinates_found('named_section', coords)
 
         # Try blog posts as a last resort
-        blog_posts_checked = 0
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if blog_posts_checked >= 3:  # Limit to 3 blog posts
-                break
-
-            # Check if this is a relevant blog post link
-            if (any(keyword in href for keyword in ['記事', 'blog', 'entry']) and 
-                href not in self.processed_urls):  # Skip already processed URLs
-
-                blog_posts_checked += 1
-                logging.info(f"Checking blog post ({blog_posts_checked}/3): {href}")
-
-                blog_html = self.fetch_page(urljoin(BASE_URL, href))
-                if blog_html:
-                    blog_soup = BeautifulSoup(blog_html, 'html.parser')
-                    # Look for Street View section in blog post
-                    for section in blog_soup.find_all(['div', 'section', 'p']):
-                        if "ストリートビュー" in section.get_text():
-                            coords = self.find_coordinates_in_section(section)
-                            if coords:
-                                return coords
+        if not search_blogs:
+            return self._coordinates_found('known_unresolvable', None)
+        coords = self.find_coordinates_in_blog_posts(self.get_blog_links(soup, fields))
+        if coords:
+            return self._coordinates_found('blog', coords)
+
+        return self._coordinates_found('none', None)
+
+    def get_blog_links(self, soup: BeautifulSoup, fields: dict | None = None) -> list:
+        """
+        Get up to MAX_BLOG_POSTS unprocessed blog post URLs linked from a page
+        """
+        if fields is None:
+            fields = LOCATION_PAGE_PLAN.run(soup)
+        urls = []
+        for href in fields['links']:
+            # Check if this is a relevant blog post link, skipping already processed URLs
+            if any(keyword in href for keyword in BLOG_LINK_KEYWORDS) and href not in self.processed_urls:
+                url = urljoin(BASE_URL, href)
+                if url not in urls:
+                    urls.append(url)
+                if len(urls) >= MAX_BLOG_POSTS:
+                    break
+        return urls
+
+    def find_coordinates_in_blog_posts(self, urls: list) -> tuple:
+        """
+        Fetch blog posts concurrently and return the first coordinates found
+
+        The remaining downloads are abandoned as soon as one post yields coordinates.
+        """
+        if not urls:
+            return None
 
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=len(urls))
+        scan = tracing.propagate(self._scan_blog_post)
+        try:
+            futures = [pool.submit(scan, url, stop) for url in urls]
+            for future in as_completed(futures):
+                coords = future.result()
+                if coords:
+                    return coords
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
         return None
 
-    def get_location_name(self, soup: BeautifulSoup) -> str:
+    def _scan_blog_post(self, url: str, stop: threading.Event) -> tuple:
         """
-        Extract location name from the page
+        Look for coordinates in the Street View section of one blog post
         """
-        # Try article title first
-        for title_elem in soup.find_all(['h1', 'h2', 'h3']):
-            if title_elem.text.strip():
-                name = title_elem.text.split('は')[0].strip()
-                return name
+        logging.info(f"Checking blog post: {url}")
+        raw = self.fetch_raw(url, stop)
+        if not raw or stop.is_set():
+            return None
 
-        # Try meta title
-        meta_title = soup.find('meta', property='og:title')
-        if meta_title and meta_title.get('content'):
-            name = meta_title['content'].split('は')[0].strip()
-            return name
+        # Every extraction method needs a Google Maps URL, so skip parsing posts without one
+        if b'google.com/maps' not in raw:
+            logging.debug(f"No Google Maps URL in blog post: {url}")
+            return None
 
-        # Try page title
-        title = soup.find('title')
-        if title and title.text:
-            name = title.text.split('は')[0].strip()
-            return name
+        with metrics.timed('parse'):
+            blog_soup = make_soup(raw)
+        with metrics.timed('extract'):
+            fields = BLOG_POST_PLAN.run(blog_soup)
+        # Look for Street View section in blog post
+        for section in sections_containing(fields['street_view_strings'], "ストリートビュー"):
+            if stop.is_set():
+                return None
+            coords = self.find_coordinates_in_section(section)
+            if coords:
+                return coords
+        return None
 
-        return "不明な場所"
+    def _coordinates_found(self, method: str, coords):
+        """
+        Count the method that found the coordinates and return them
+        """
+        metrics.coordinate_method(method)
+        return coords
+
+    def get_location_name(self, soup: BeautifulSoup, fields: dict | None = None) -> str:
+        """
+        Extract location name from the page: a heading, else og:title, else the page title
+        """
+        if fields is None:
+            fields = LOCATION_PAGE_PLAN.run(soup)
+        return fields.get('name', "不明な場所")
 
     def translate_name(self, name: str) -> str:
         """
         Translate Japanese text to English with caching
         """
-        if name in self.translation_cache:
+        hit = name in self.translation_cache
+        metrics.cache_lookup('translation', hit)
+        if hit:
             return self.translation_cache[name]
 
         try:
-            translation = self.translator.translate(name, src='ja', dest='en')
+            with metrics.timed('translate'):
+                translation = self.translator.translate(name, src='ja', dest='en')
             if translation and translation.text:
                 translated_text = translation.text.strip()
                 self.translation_cache[name] = translated_text
@@ -249,7 +426,7 @@ class HaikyoScraper:
         """
         Extract links to individual location pages
         """
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = make_soup(html)
         links = []
 
         # Find all article elements that contain location links
@@ -263,51 +440,60 @@ class HaikyoScraper:
         logging.info(f"Found {len(links)} location links")
         return links
 
-    def extract_main_image(self, soup: BeautifulSoup) -> str:
+    def extract_main_image(self, soup: BeautifulSoup, fields: dict | None = None) -> str:
         """
         Extract the URL of the main image from the location page
         """
-        # Try to find the main image in various ways
-        # First check for large images in the header or main content
-        for img in soup.find_all('img', class_=lambda c: c and ('main' in c or 'header' in c or 'hero' in c)):
-            if img.get('src'):
-                img_url = img['src']
-                if not img_url.startswith(('http://', 'https://')):
-                    img_url = urljoin(BASE_URL, img_url)
-                logging.info(f"Found main image: {img_url}")
-                return img_url
-                
-        # Try the first large image
-        for img in soup.find_all('img'):
-            src = img.get('src')
-            if src and not src.endswith(('.gif', '.svg', '.ico')) and not 'icon' in src.lower():
-                if not src.startswith(('http://', 'https://')):
-                    src = urljoin(BASE_URL, src)
-                logging.info(f"Using first image: {src}")
-                return src
-                
-        # If no suitable image found
-        return None
+        if fields is None:
+            fields = LOCATION_PAGE_PLAN.run(soup)
+        # An image marked as main, header or hero, else the first one that is not an icon
+        img_url = fields.get('image')
+        if not img_url:
+            return None
+        if not img_url.startswith(('http://', 'https://')):
+            img_url = urljoin(BASE_URL, img_url)
+        logging.info(f"Found main image: {img_url}")
+        return img_url
     
     def scrape_location(self, url: str) -> dict:
         """
         Scrape a single location page
         """
+        with tracing.span('scrape_location', url=url):
+            return self._scrape_location(url)
+
+    def _scrape_location(self, url: str) -> dict:
+        """
+        Scrape a single location page without tracing it
+        """
         html = self.fetch_page(url)
         if not html:
             return None
 
-        soup = BeautifulSoup(html, 'html.parser')
+        with metrics.timed('parse'):
+            soup = make_soup(html)
+
+        # Everything below reads from one walk over the page
+        with metrics.timed('extract'):
+            fields = LOCATION_PAGE_PLAN.run(soup)
 
         # Get the name of the location
-        ja_name = self.get_location_name(soup)
+        ja_name = self.get_location_name(soup, fields)
         en_name = self.translate_name(ja_name)
 
-        # Find coordinates
-        coordinates = self.find_coordinates(soup, ja_name)
+        # Find coordinates, skipping the blog-post crawl for unchanged pages that had none before;
+        # pages are remembered by spot id, so other URLs of the same spot share the entry
+        negative_key = extract_spot_id(url) or url
+        digest = content_digest(html) if self.negative_cache is not None else None
+        known_unresolvable = digest is not None and self.negative_cache.is_unresolvable(negative_key, digest)
+        with metrics.timed('coordinates'):
+            coordinates = self.find_coordinates(soup, ja_name, search_blogs=not known_unresolvable,
+                                                fields=fields)
+        if coordinates is None and digest is not None and not known_unresolvable:
+            self.negative_cache.mark_unresolvable(negative_key, digest)
         
         # Extract main image
-        image_url = self.extract_main_image(soup)
+        image_url = self.extract_main_image(soup, fields)
 
         return {
             'ja': ja_name,
@@ -0,0 +1,28 @@
+"""
+Tests for the one-pass field extraction.
+"""
+
+import re
+
+from bs4 import BeautifulSoup
+
+from extraction import ExtractionPlan, Field, Rule, tag, text
+
+
+def test_text_rules_skip_scripts_and_styles():
+    """Strings inside script, style and template elements are not page text."""
+    soup = BeautifulSoup('<script>var a = "兵庫県神戸市";</script><style>.x:after {content: "兵庫県神戸市"}</style>'
+                         '<template>兵庫県神戸市</template><!-- 兵庫県神戸市 --><p>兵庫県神戸市灘区</p>',
+                         'html.parser')
+    plan = ExtractionPlan(Field('address', Rule(text(re.compile('県.*市')), str), many=True))
+
+    assert plan.run(soup) == {'address': ['兵庫県神戸市灘区']}
+
+
+def test_labelled_rules_take_the_node_after_the_label():
+    """A rule with a label only considers nodes that come after the label."""
+    soup = BeautifulSoup('<span>ホテル</span><p>カテゴリ</p><span>遊園地</span>', 'html.parser')
+    plan = ExtractionPlan(Field('category', Rule(tag('span'), lambda span: span.get_text(),
+                                                 after=text(re.compile('カテゴリ')))))
+
+    assert plan.run(soup) == {'category': '遊園地'}
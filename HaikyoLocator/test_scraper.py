@@ -0,0 +1,33 @@
+"""
+Tests for finding the sections around Street View links and claiming URLs.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scraper import BLOG_POST_PLAN, HaikyoScraper, make_soup, sections_containing
+
+
+def test_sections_match_phrases_split_across_tags():
+    """A phrase split by inline tags is found in the text of the section around it."""
+    soup = make_soup('<div id="outer"><p id="split"><b>ストリート</b>ビュー・空中写真</p>'
+                     '<p id="review">レビュー</p></div>')
+    strings = BLOG_POST_PLAN.run(soup)['street_view_strings']
+
+    assert [section.get('id') for section in sections_containing(strings, 'ストリートビュー・空中写真')] == \
+        ['outer', 'split']
+
+
+def test_each_url_is_claimed_once_across_threads():
+    """Concurrent blog post workers never both claim the same URL."""
+    scraper = HaikyoScraper()
+    barrier = threading.Barrier(8)
+
+    def claim(url):
+        barrier.wait()
+        return scraper._claim_url(url)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        claims = list(pool.map(claim, ['https://example.fc2.com/blog-entry-1.html'] * 8))
+
+    assert claims.count(True) == 1
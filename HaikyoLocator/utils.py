@@ -81,4 +81,13 @@ def format_coordinates(lat: float, lon: float) -> str:
     """
     Format coordinates for text output
     """
-    return f"{lat:.6f}, {lon:.6f}"
\ No newline at end of file
+    return f"{lat:.6f}, {lon:.6f}"
+
+def extract_spot_id(url: str) -> str:
+    """
+    Numeric haikyo.info spot id of a spot URL, or an empty string if it is not a spot page
+    """
+    if not url:
+        return ""
+    match = re.search(r'/s/(\d+)\.html', url) or re.search(r'/explorer/(\d+)/', url)
+    return match.group(1) if match else ""
@@ -4,59 +4,256 @@ This provides a web interface for searching, scraping, and generating KML files.
 """
 
 import os
+import re
 import json
 import time
 import threading
-from flask import Flask, render_template, request, jsonify, send_file, session, flash, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, session, flash, redirect, url_for, Response
+from flask.sessions import SecureCookieSessionInterface
 from flask_bootstrap import Bootstrap
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField
+from wtforms import StringField, SubmitField, BooleanField
 from wtforms.validators import DataRequired
 from werkzeug.utils import secure_filename
 
 from scraper import HaikyoScraper
 from kml_generator import KMLGenerator
+from kml_updates import PlacemarkFeed
+from image_cache import ImageCache
+from location import Location, LocationBatch
+from journal import CrawlJournal
+from progress import ProgressReporter
+import metrics
+import tracing
+import profiling
+from search_index import SearchIndex
+from negative_cache import NegativeCache
+from sweep import SweepStore, STATUS_OK
+from state_store import open_state_store
 from utils import sanitize_filename
 
 # Initialize Flask app
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
+# Without HAIKYO_SECRET_KEY, the key is read from the state store on the first request
+app.config['SECRET_KEY'] = os.environ.get('HAIKYO_SECRET_KEY')
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload size
+app.config['JOURNAL_FOLDER'] = 'journals'
+app.config['IMAGE_CACHE_FOLDER'] = 'image_cache'
+app.config['SPOT_STORE'] = 'spots.db'
+app.config['NEGATIVE_CACHE'] = 'unresolvable.db'
+# Optional archive of every fetched spot page, for re-extraction with cli.py --replay
+app.config['PAGE_ARCHIVE'] = os.environ.get('HAIKYO_ARCHIVE') or None
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+class SharedKeySessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions whose key comes from the state store unless HAIKYO_SECRET_KEY is set."""
+
+    def open_session(self, app, request):
+        # Workers share one key, so a form rendered by one worker validates in another
+        if not app.config['SECRET_KEY']:
+            app.config['SECRET_KEY'] = get_state().update('secret_key', lambda key: key or os.urandom(24).hex())
+        return super().open_session(app, request)
+
+app.session_interface = SharedKeySessionInterface()
 
 # Initialize Bootstrap
 bootstrap = Bootstrap(app)
 
-# Global variables for tracking status
-search_results = []
-locations = []
-progress_data = {
-    'progress': 0,
-    'message': 'Ready',
-    'status': 'ready'  # ready, searching, scraping, generating
-}
-lock = threading.Lock()
+# Job state, results and progress, shared by every worker process (see state_store).
+# Search results and location records of the current job are kept in the state
+# store under 'search_results' and 'locations'
+state = None
+# Latest-value progress state; status is one of ready, searching, scraping, generating
+progress_reporter = None
+
+# The state store, scraper, KML generator, image cache and spot store are created
+# on first use to keep startup fast
+scraper = None
+kml_generator = None
+image_cache = None
+spot_store = None
+components_lock = threading.RLock()
 
-# Initialize scraper and KML generator
-scraper = HaikyoScraper()
-kml_generator = KMLGenerator()
+# Placemarks of the latest KML export, served incrementally at /live.kml;
+# reloaded from the state store when another worker exported since
+live_feed = PlacemarkFeed()
+live_feed_lock = threading.Lock()
+KML_MIMETYPE = 'application/vnd.google-earth.kml+xml'
+
+# Every scraped location is kept in the spot store and indexed for local search;
+# each worker indexes the spots the others saved at most every SEARCH_INDEX_REFRESH seconds
+search_index = None
+search_index_synced = 0.0
+search_index_lock = threading.Lock()
+SEARCH_INDEX_REFRESH = 5
+# Indexed locations in columnar form; search hits are row numbers of this batch
+spot_rows = LocationBatch()
+spot_row_ids = {}
 
 # Form for search
 class SearchForm(FlaskForm):
     search_term = StringField('Search Term', validators=[DataRequired()])
+    local_first = BooleanField('Search scraped locations first')
+    # Narrow searches of scraped locations; haikyo.info searches ignore them
+    prefecture = StringField('Prefecture')
+    category = StringField('Category')
     submit = SubmitField('Search')
 
+def index_fields(record):
+    """Map a scraped location record to search index fields, prefecture and category."""
+    location = Location.from_dict(record)
+    fields = {
+        'title': location.title,
+        'address': location.address,
+        'description': location.description,
+        'translated_title': location.translated_title,
+        'translated_address': location.translated_address,
+        'translated_description': location.translated_description
+    }
+    prefecture = location.prefecture
+    if not prefecture and location.address:
+        match = re.search(r'(.+?)[都道府県]', location.address)
+        prefecture = match.group(0) if match else ""
+    return fields, prefecture, location.category
+
+def get_state():
+    """Get the state store, opening it on first use."""
+    global state
+    with components_lock:
+        if state is None:
+            state = open_state_store()
+        return state
+
+def get_progress_reporter():
+    """Get the progress reporter, which publishes to the state store."""
+    global progress_reporter
+    with components_lock:
+        if progress_reporter is None:
+            progress_reporter = ProgressReporter(store=get_state())
+        return progress_reporter
+
+def get_spot_store():
+    """Get the store of every scraped location, opening it on first use."""
+    global spot_store
+    with components_lock:
+        if spot_store is None:
+            spot_store = SweepStore(app.config['SPOT_STORE'])
+        return spot_store
+
+def get_scraper():
+    """Get the shared scraper, creating it on first use."""
+    global scraper
+    with components_lock:
+        if scraper is None:
+            scraper = HaikyoScraper()
+            scraper.reporter = get_progress_reporter()
+            # Spots without coordinates skip the extraction fallbacks on later runs
+            scraper.negative_cache = NegativeCache(app.config['NEGATIVE_CACHE'])
+            if app.config['PAGE_ARCHIVE']:
+                from page_archive import PageArchive
+                scraper.archive = PageArchive(app.config['PAGE_ARCHIVE'])
+        return scraper
+
+def get_kml_generator():
+    """Get the shared KML generator, creating it on first use."""
+    global kml_generator
+    with components_lock:
+        if kml_generator is None:
+            kml_generator = KMLGenerator()
+        return kml_generator
+
+def get_image_cache():
+    """Get the shared image cache, loading its index on first use."""
+    global image_cache
+    with components_lock:
+        if image_cache is None:
+            image_cache = ImageCache(app.config['IMAGE_CACHE_FOLDER'])
+        return image_cache
+
+def get_search_index():
+    """Get the local search index, built from the spot store and kept up to date with it."""
+    global search_index, search_index_synced
+    with search_index_lock:
+        now = time.time()
+        if search_index is None:
+            index = SearchIndex(index_fields)
+            for record in get_spot_store().locations():
+                add_to_index(index, record)
+            search_index = index
+        elif now - search_index_synced >= SEARCH_INDEX_REFRESH:
+            # Overlap the last read, so saves that were still committing then are not missed
+            for record in get_spot_store().locations(since=search_index_synced - SEARCH_INDEX_REFRESH):
+                add_to_index(search_index, record)
+        else:
+            return search_index
+        search_index_synced = now
+        return search_index
+
+def add_to_index(index, record):
+    """Index a scraped location, keeping it as a row of spot_rows rather than a dictionary."""
+    location = Location.from_master(record)
+    with components_lock:
+        row = spot_row_ids.get(location.url)
+        if row is None:
+            row = spot_row_ids[location.url] = len(spot_rows)
+            spot_rows.append(location)
+        else:
+            spot_rows[row] = location
+    fields, prefecture, category = index_fields(location)
+    index.add(location.url, fields, prefecture, category, row)
+
 def update_progress(progress, message, status=None):
     """Update progress information for status tracking."""
-    global progress_data
-    with lock:
-        progress_data['progress'] = progress
-        progress_data['message'] = message
-        if status:
-            progress_data['status'] = status
+    get_progress_reporter().update(progress, message, status)
+
+def placeholder_results(urls):
+    """Search results and location records for URLs that have not been scraped yet."""
+    search_results = []
+    locations = []
+    for i, url in enumerate(urls):
+        # Extract basic info from URL
+        title = url.split('/')[-1].replace('.html', '').title()
+        search_results.append({
+            'id': i,
+            'title': title,
+            'url': url,
+            'address': "Click 'Scrape' for details",
+            'coordinates': "Click 'Scrape' to get coordinates"
+        })
+        locations.append({
+            'title': title,
+            'url': url,
+            'address': "",
+            'coordinates': None,
+            'description': "",
+            'images': [],
+            'translated_title': title,
+            'translated_address': "",
+            'translated_description': ""
+        })
+    return search_results, locations
+
+def set_results(search_results, locations):
+    """Replace the search results and location records of the current job."""
+    get_state().set('search_results', search_results)
+    get_state().set('locations', locations)
+
+def get_live_feed():
+    """Get the live feed, reloading it if another worker synced a newer version."""
+    with live_feed_lock:
+        if get_state().get('live_feed_version', 0) != live_feed.version:
+            live_feed.load(get_state().get('live_feed'))
+    return live_feed
+
+def sync_live_feed(locations):
+    """Sync the shared live feed with exported locations."""
+    def sync(saved):
+        feed = PlacemarkFeed()
+        if saved is not None:
+            feed.load(saved)
+        feed.sync(locations)
+        return feed.dump()
+    get_state().set('live_feed_version', get_state().update('live_feed', sync)['version'])
 
 @app.route('/')
 def index():
@@ -70,57 +267,52 @@ def search():
     if form.validate_on_submit():
         search_term = form.search_term.data
         # Start search in a background thread
-        threading.Thread(target=search_task, args=(search_term,), daemon=True).start()
+        threading.Thread(target=search_task,
+                         args=(search_term, form.local_first.data, (form.prefecture.data or "").strip(),
+                               (form.category.data or "").strip()),
+                         daemon=True).start()
         return jsonify({'status': 'success'})
     return jsonify({'status': 'error', 'message': 'Invalid form submission'})
 
-def search_task(search_term):
-    """Perform the search task in a background thread."""
-    global search_results, locations
-    
+@metrics.job('search')
+@tracing.record('search')
+def search_task(search_term, local_first=False, prefecture="", category=""):
+    """Perform the search task in a background thread; prefecture and category filter local hits."""
     try:
         update_progress(0, f"Searching for '{search_term}'...", 'searching')
         
         # Clear previous results
-        search_results = []
-        locations = []
+        set_results([], [])
+        
+        # Answer from already scraped locations without touching the network
+        if local_first:
+            hits = get_search_index().search(search_term, limit=500, prefecture=prefecture or None,
+                                             category=category or None)
+            if hits:
+                search_results = []
+                locations = []
+                for i, (score, row) in enumerate(hits):
+                    record = spot_rows[row].to_master()
+                    coordinates = record.get('coordinates') or {}
+                    search_results.append({
+                        'id': i,
+                        'title': record.get('title', ""),
+                        'url': record['url'],
+                        'address': record.get('address', ""),
+                        'coordinates': f"{coordinates.get('lat')}, {coordinates.get('lng')}"
+                    })
+                    locations.append(record)
+                set_results(search_results, locations)
+                update_progress(100, f"Found {len(hits)} scraped locations in the local index", 'ready')
+                return
         
         # Perform the search
-        urls = scraper.search_locations(search_term, 
+        urls = get_scraper().search_locations(search_term, 
                                         lambda p, m: update_progress(p, m, 'searching'))
         
         # Process URLs to extract basic information
-        for i, url in enumerate(urls):
-            progress = (i + 1) / len(urls) * 100
-            update_progress(progress, f"Processing search result {i+1} of {len(urls)}", 'searching')
-            
-            # Extract basic info from URL
-            title = url.split('/')[-1].replace('.html', '').title()
-            
-            # Add to results
-            search_results.append({
-                'id': i,
-                'title': title,
-                'url': url,
-                'address': "Click 'Scrape' for details",
-                'coordinates': "Click 'Scrape' to get coordinates"
-            })
-            
-            # Add to locations list
-            locations.append({
-                'title': title,
-                'url': url,
-                'address': "",
-                'coordinates': None,
-                'description': "",
-                'images': [],
-                'translated_title': title,
-                'translated_address': "",
-                'translated_description': ""
-            })
-            
-            # Pause briefly to prevent overwhelming the server
-            time.sleep(0.1)
+        update_progress(100, f"Processing {len(urls)} search results", 'searching')
+        set_results(*placeholder_results(urls))
         
         # Update status
         if len(urls) > 0:
@@ -134,13 +326,46 @@ def search_task(search_term):
 @app.route('/get_progress')
 def get_progress():
     """Return the current progress data."""
-    with lock:
-        return jsonify(progress_data)
+    return jsonify(get_progress_reporter().snapshot())
+
+@app.route('/metrics')
+def get_metrics():
+    """Expose pipeline metrics in the Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/traces')
+def list_traces():
+    """List the recorded job traces, newest first (recorded when HAIKYO_TRACE is set)."""
+    return jsonify({'enabled': tracing.ENABLED, 'traces': tracing.store.summaries()})
+
+@app.route('/traces/<job_id>')
+def download_trace(job_id):
+    """Download a job trace as trace-event JSON for chrome://tracing or Perfetto."""
+    trace = tracing.store.get(job_id)
+    if trace is None:
+        return jsonify({'status': 'error', 'message': 'Trace not found'}), 404
+    return Response(trace.to_json(), mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename={job_id}.json'})
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread's stack for ?seconds=N and return collapsed stacks (needs HAIKYO_PROFILER=1)."""
+    if not profiling.ENABLED:
+        return jsonify({'status': 'error', 'message': 'Profiler is disabled'}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'seconds must be a number'}), 400
+    try:
+        stacks = profiling.profiler.profile(seconds)
+    except profiling.ProfilerBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 409
+    return Response(profiling.collapse(stacks), mimetype='text/plain')
 
 @app.route('/get_results')
 def get_results():
     """Return the current search results."""
-    return jsonify({'results': search_results})
+    return jsonify({'results': get_state().get('search_results', [])})
 
 @app.route('/scrape', methods=['POST'])
 def scrape():
@@ -160,13 +385,14 @@ def scrape():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
+@metrics.job('scrape')
+@tracing.record('scrape')
 def scrape_task(selected_ids):
     """Perform the scraping task in a background thread."""
-    global search_results, locations
-    
     try:
-        update_progress(0, "Scraping selected locations...", 'scraping')
+        get_progress_reporter().reset("Scraping selected locations...", 'scraping')
         
+        search_results = get_state().get('search_results', [])
         selected_urls = []
         selected_indices = []
         
@@ -177,20 +403,49 @@ def scrape_task(selected_ids):
                 selected_urls.append(search_results[item_id]['url'])
                 selected_indices.append(item_id)
         
+        # Journal completed pages so the job can resume after a restart
+        journal = CrawlJournal.for_job(app.config['JOURNAL_FOLDER'], "\n".join(selected_urls),
+                                       {'urls': selected_urls})
+        if len(journal) > 0:
+            update_progress(0, f"Resuming job: {len(journal)} locations already scraped", 'scraping')
+        
         # Scrape location details
-        scraped_locations = scraper.scrape_batch(selected_urls, 
-                                               lambda p, m: update_progress(p, m, 'scraping'))
+        try:
+            scraped_locations = get_scraper().scrape_batch(selected_urls, 
+                                                   lambda p, m: update_progress(p, m, 'scraping'),
+                                                   journal=journal)
+        except Exception:
+            journal.close()
+            raise
+        journal.finish()
+        
+        # Keep successfully scraped locations for local searches
+        spot_index = get_search_index()
+        for location_data in scraped_locations:
+            if location_data.get('title') != "Error":
+                get_spot_store().save(location_data['url'], STATUS_OK, location_data)
+                add_to_index(spot_index, location_data)
+        
+        # Update locations and search results with scraped data, unless a new search replaced them
+        scraped = {index: location_data for index, location_data in zip(selected_indices, scraped_locations)}
         
-        # Update locations and search results with scraped data
-        for i, location_data in enumerate(scraped_locations):
-            index = selected_indices[i]
-            locations[index] = location_data
-            
-            # Update the search results
-            coords_text = f"{location_data['coordinates']['lat']}, {location_data['coordinates']['lng']}"
-            search_results[index]['title'] = location_data['title']
-            search_results[index]['address'] = location_data.get('address', "")
-            search_results[index]['coordinates'] = coords_text
+        def update_locations(locations):
+            for index, location_data in scraped.items():
+                if index < len(locations) and locations[index]['url'] == location_data['url']:
+                    locations[index] = location_data
+            return locations
+        
+        def update_search_results(search_results):
+            for index, location_data in scraped.items():
+                if index < len(search_results) and search_results[index]['url'] == location_data['url']:
+                    coords_text = f"{location_data['coordinates']['lat']}, {location_data['coordinates']['lng']}"
+                    search_results[index]['title'] = location_data['title']
+                    search_results[index]['address'] = location_data.get('address', "")
+                    search_results[index]['coordinates'] = coords_text
+            return search_results
+        
+        get_state().update('locations', update_locations, [])
+        get_state().update('search_results', update_search_results, [])
         
         # Update status
         update_progress(100, f"Scraped {len(scraped_locations)} locations", 'ready')
@@ -198,13 +453,44 @@ def scrape_task(selected_ids):
     except Exception as e:
         update_progress(0, f"Error during scraping: {str(e)}", 'ready')
 
+@app.route('/jobs/unfinished')
+def unfinished_jobs():
+    """List scrape jobs that were interrupted before they finished."""
+    jobs = []
+    for path in CrawlJournal.unfinished(app.config['JOURNAL_FOLDER']):
+        journal = CrawlJournal(path)
+        jobs.append({
+            'job_id': os.path.basename(path).replace('.jsonl', ''),
+            'total': len(journal.job.get('urls', [])),
+            'completed': len(journal)
+        })
+        journal.close()
+    return jsonify({'jobs': jobs})
+
+@app.route('/jobs/resume/<job_id>', methods=['POST'])
+def resume_job(job_id):
+    """Resume an interrupted scrape job from its journal."""
+    path = os.path.join(app.config['JOURNAL_FOLDER'], secure_filename(job_id) + '.jsonl')
+    if not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'Job not found'})
+    
+    journal = CrawlJournal(path)
+    urls = journal.job.get('urls', [])
+    journal.close()
+    
+    # Rebuild the result list for the job, then scrape whatever is left
+    set_results(*placeholder_results(urls))
+    
+    threading.Thread(target=scrape_task, args=(list(range(len(urls))),), daemon=True).start()
+    return jsonify({'status': 'success', 'total': len(urls)})
+
 @app.route('/generate_kml', methods=['POST'])
 def generate_kml():
     """Handle KML generation request."""
     try:
         # Check if we have locations with coordinates
-        valid_locations = [loc for loc in locations if loc['coordinates'] and 
-                           (loc['coordinates']['lat'] != 0 or loc['coordinates']['lng'] != 0)]
+        valid_locations = [loc for loc in get_state().get('locations', [])
+                           if Location.from_master(loc).has_coordinates]
         
         if not valid_locations:
             return jsonify({
@@ -212,15 +498,21 @@ def generate_kml():
                 'message': 'No locations with valid coordinates to export. Please scrape locations first.'
             })
         
+        # KMZ output bundles thumbnails of the popup images for offline use;
+        # regionated output is a KMZ split into tiles for Google Earth
+        data = request.get_json(silent=True) or {}
+        regionated = data.get('format') == 'regionated'
+        extension = 'kmz' if data.get('format') in ('kmz', 'regionated') else 'kml'
+        
         # Generate a filename based on timestamp
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"haikyo_locations_{timestamp}.kml"
+        filename = f"haikyo_locations_{timestamp}.{extension}"
         output_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         # Start KML generation in a background thread
         thread = threading.Thread(
             target=generate_kml_task, 
-            args=(output_path, filename),
+            args=(output_path, filename, regionated),
             daemon=True
         )
         thread.start()
@@ -230,22 +522,31 @@ def generate_kml():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
-def generate_kml_task(output_path, filename):
+@metrics.job('generate_kml')
+def generate_kml_task(output_path, filename, regionated=False):
     """Generate KML file in a background thread."""
     try:
         update_progress(0, "Generating KML file...", 'generating')
+        locations = get_state().get('locations', [])
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
         # Generate KML file
-        success = kml_generator.generate_kml(
+        generate = (get_kml_generator().generate_regionated_kmz if regionated
+                    else get_kml_generator().generate_kml)
+        success = generate(
             locations, 
             output_path, 
-            lambda p, m: update_progress(p, m, 'generating')
+            lambda p, m: update_progress(p, m, 'generating'),
+            image_cache=get_image_cache()
         )
         
         if success:
+            # Clients of the live link only fetch the placemarks this export changed
+            sync_live_feed(locations)
             update_progress(
                 100, 
-                f"KML file generated successfully. <a href='/download/{filename}' class='btn btn-success btn-sm'>Download KML</a>", 
+                f"KML file generated successfully. <a href='/download/{filename}' class='btn btn-success btn-sm'>Download KML</a> "
+                f"<a href='/live.kml' class='btn btn-outline-success btn-sm'>Google Earth live link</a>", 
                 'ready'
             )
         else:
@@ -254,6 +555,27 @@ def generate_kml_task(output_path, filename):
     except Exception as e:
         update_progress(0, f"Error generating KML file: {str(e)}", 'ready')
 
+@app.route('/live.kml')
+def live_root():
+    """Root KML for Google Earth that stays up to date through incremental updates."""
+    kml = get_live_feed().root_document(url_for('live_document', _external=True))
+    return Response(kml, mimetype=KML_MIMETYPE,
+                    headers={'Content-Disposition': 'attachment; filename=haikyo_live.kml'})
+
+@app.route('/live/doc.kml')
+def live_document():
+    """All current placemarks, with a link polling for changes."""
+    return Response(get_live_feed().full_document(url_for('live_update', _external=True)), mimetype=KML_MIMETYPE)
+
+@app.route('/live/update.kml')
+def live_update():
+    """Placemarks created, changed or deleted since the client's version cookie."""
+    # Google Earth appends the cookie to the link's query, so version can appear twice
+    versions = [int(value) for value in request.args.getlist('version') if value.isdigit()]
+    since = max(versions) if versions else 0
+    kml = get_live_feed().update_document(since, url_for('live_document', _external=True))
+    return Response(kml, mimetype=KML_MIMETYPE)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Download the generated KML file."""
@@ -267,9 +589,12 @@ def download_file(filename):
 @app.route('/location_details/<int:location_id>')
 def location_details(location_id):
     """Get details for a specific location."""
+    locations = get_state().get('locations', [])
     if 0 <= location_id < len(locations):
         return jsonify({'status': 'success', 'location': locations[location_id]})
     return jsonify({'status': 'error', 'message': 'Location not found'})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    import serving
+    args = serving.parse_args(description="Haikyo Locator web app (development server)")
+    app.run(host=args.host, port=args.port, debug=args.debug)
\ No newline at end of file
@@ -0,0 +1,603 @@
+"""
+Headless batch mode for the Haikyo Locator.
+
+Runs searches and scrapes from the command line, without the web or Tk
+interface, so jobs can be scheduled from cron:
+
+    python cli.py --search 病院 --prefecture 北海道 -o hospitals.geojson
+    python cli.py --input urls.txt --workers 8 --no-translate -o spots.ndjson
+    python cli.py --search 学校 --format ndjson -o - | jq .title
+    python cli.py --input urls.txt --archive pages.db -o spots.ndjson
+    python cli.py --replay pages.db --workers 8 -o spots.geojson
+    python cli.py --sweep 1-50000 --workers 8 --store spots.db -o spots.geojson
+    python cli.py --crawl-ids 1- --workers 8 --store spots.db -o spots.geojson
+
+Location pages are scraped concurrently. NDJSON and GeoJSON output is
+streamed as locations finish; KML and KMZ files are written at the end.
+Progress lines and a timing report go to stderr. With --replay, the
+pages stored by --archive are re-extracted offline across worker
+processes instead of being fetched. With --sweep, every spot page in an
+id range is fetched by worker processes into a SQLite store, resuming
+where an earlier sweep into the same store stopped, and the store's
+locations are written out at the end. --crawl-ids does the same with
+threads, skipping runs of missing ids; without a last id it stops once
+no more spots are found.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from scraper import HaikyoScraper
+from location import Location
+from negative_cache import NegativeCache
+
+# Output formats, by file extension
+FORMATS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.geojson': 'geojson',
+    '.kml': 'kml',
+    '.kmz': 'kmz',
+}
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def read_inputs(search_terms, prefectures, urls, input_path=None):
+    """
+    Combine the search terms and location URLs given on the command line and in a file.
+
+    Lines of the input file that start with http are location URLs; other
+    non-empty lines that are not comments (#) are search terms.
+
+    Args:
+        search_terms (list): Search terms.
+        prefectures (list): Prefecture names, searched like terms.
+        urls (list): Location URLs.
+        input_path (str, optional): File with one term or URL per line, '-' for stdin.
+
+    Returns:
+        tuple: (search terms, location URLs), each without duplicates.
+    """
+    terms = list(search_terms) + list(prefectures)
+    urls = list(urls)
+    if input_path:
+        stream = sys.stdin if input_path == '-' else open(input_path, encoding='utf-8')
+        try:
+            for line in stream:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith(('http://', 'https://')):
+                    urls.append(line)
+                else:
+                    terms.append(line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    return list(dict.fromkeys(terms)), list(dict.fromkeys(urls))
+
+
+def location_feature(data):
+    """
+    Convert a scraped location to a GeoJSON feature.
+
+    Args:
+        data (dict): Location dictionary from HaikyoScraper.
+
+    Returns:
+        dict: The feature; geometry is null without coordinates.
+    """
+    location = Location.from_master(data)
+    geometry = None
+    if location.has_coordinates:
+        geometry = {'type': 'Point', 'coordinates': [location.lng, location.lat]}
+    return {
+        'type': 'Feature',
+        'geometry': geometry,
+        'properties': {
+            'title': location.title,
+            'translated_title': location.translated_title,
+            'url': location.url,
+            'spot_id': location.spot_id,
+            'address': location.address,
+            'translated_address': location.translated_address,
+            'description': location.description,
+            'translated_description': location.translated_description,
+            'images': list(location.images),
+        },
+    }
+
+
+class NDJSONWriter:
+    """Writes each location as one JSON line as soon as it is scraped."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        self.stream.write(json.dumps(data, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class GeoJSONWriter:
+    """Streams locations into a GeoJSON FeatureCollection."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        self.stream.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, data):
+        separator = ",\n" if self.count else ""
+        self.stream.write(separator + json.dumps(location_feature(data), ensure_ascii=False))
+        self.stream.flush()
+        self.count += 1
+
+    def close(self):
+        self.stream.write("\n]}\n")
+        self.stream.flush()
+
+
+class KMLWriter:
+    """Collects locations and writes a KML, KMZ or regionated KMZ file when closed."""
+
+    def __init__(self, path, image_cache_dir=None, regionated=False):
+        self.path = path
+        self.image_cache_dir = image_cache_dir
+        self.regionated = regionated
+        self.locations = []
+
+    def write(self, data):
+        self.locations.append(data)
+
+    def close(self):
+        from kml_generator import KMLGenerator
+        from image_cache import ImageCache
+
+        image_cache = None
+        if self.path.lower().endswith('.kmz'):
+            image_cache = ImageCache(self.image_cache_dir or 'image_cache')
+        generator = KMLGenerator()
+        generate = generator.generate_regionated_kmz if self.regionated else generator.generate_kml
+        if not generate(self.locations, self.path, image_cache=image_cache):
+            raise RuntimeError(f"Could not write {self.path}")
+
+
+class ProgressPrinter:
+    """Prints a progress line to stderr at most every few seconds."""
+
+    def __init__(self, total, stream=None, interval=PROGRESS_INTERVAL, quiet=False):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.quiet = quiet
+        self.done = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def update(self, ok):
+        """Count one finished location."""
+        self.done += 1
+        if not ok:
+            self.errors += 1
+        now = time.monotonic()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            self.print_line()
+
+    def print_line(self):
+        if self.quiet:
+            return
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(f"[{self.done}/{self.total}] {self.errors} errors, {rate:.2f} locations/s, "
+              f"~{remaining:.0f}s left", file=self.stream)
+
+
+def open_writer(path, output_format, image_cache_dir=None, regionated=False):
+    """
+    Create the output writer for a path and format.
+
+    Returns:
+        tuple: (writer, stream to close or None)
+    """
+    if regionated and output_format != 'kmz':
+        raise ValueError("Regionated output is a KMZ file")
+    if output_format in ('kml', 'kmz'):
+        if path == '-':
+            raise ValueError(f"{output_format.upper()} output needs a file path")
+        if (output_format == 'kmz') != path.lower().endswith('.kmz'):
+            raise ValueError("KMZ output needs a .kmz file name and KML output a .kml one")
+        return KMLWriter(path, image_cache_dir, regionated), None
+
+    stream = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+    writer = GeoJSONWriter(stream) if output_format == 'geojson' else NDJSONWriter(stream)
+    return writer, (None if stream is sys.stdout else stream)
+
+
+def scrape_one(scraper, url, translate):
+    """
+    Scrape one location page.
+
+    Returns:
+        tuple: (url, location dictionary or None, error message or None)
+    """
+    try:
+        if translate:
+            data = scraper.scrape_location_details(url)
+        else:
+            response, html = scraper.fetch_spot_page(url)
+            response.raise_for_status()
+            data = scraper.parse_location_page(html, url, translate=False)
+    except Exception as e:
+        return url, None, str(e)
+    if data.get('title') == "Error":
+        return url, None, data.get('description', "Scrape failed")
+    return url, data, None
+
+
+def print_report(timings, total, errors, failed, stream=None):
+    """Print phase timings, throughput and per-stage latencies."""
+    stream = stream or sys.stderr
+    print("\nTiming report", file=stream)
+    for phase, seconds in timings.items():
+        print(f"  {phase:<10} {seconds:8.2f}s", file=stream)
+    scrape_seconds = timings.get('scrape', 0)
+    if scrape_seconds:
+        print(f"  {total} locations, {errors} errors, {total / scrape_seconds:.2f} locations/s",
+              file=stream)
+    stages = metrics.STAGE_SECONDS.totals()
+    if stages:
+        print("  Stages:", file=stream)
+        for (stage,), (count, seconds) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            print(f"    {stage:<12} {count:6d} calls {seconds:8.2f}s total "
+                  f"{seconds / count * 1000:8.1f}ms mean", file=stream)
+    for url, error in failed[:10]:
+        print(f"  failed: {url}: {error}", file=stream)
+    if len(failed) > 10:
+        print(f"  ... and {len(failed) - 10} more failures", file=stream)
+
+
+def parse_id_range(text, open_ended=False):
+    """
+    Parse a spot id range such as 1-50000, or 100 for a single id.
+
+    Args:
+        text (str): The range.
+        open_ended (bool): Accept ranges without a last id, such as 100-.
+
+    Returns:
+        tuple: (first id, last id), both inclusive; the last id is None
+            for an open-ended range.
+
+    Raises:
+        argparse.ArgumentTypeError: If the range is malformed.
+    """
+    first, dash, last = text.partition('-')
+    try:
+        first = int(first)
+        if open_ended and dash and not last:
+            last = None
+        else:
+            last = int(last or first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid spot id range '{text}'; use e.g. 1-50000")
+    if first < 1 or (last is not None and last < first):
+        raise argparse.ArgumentTypeError(f"invalid spot id range '{text}'")
+    return first, last
+
+
+def write_stored(args, store_path):
+    """
+    Write every location in a sweep store to the output.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+        store_path (str): Path to the SweepStore.
+
+    Returns:
+        int: Number of locations written.
+    """
+    from sweep import SweepStore
+
+    output_format = args.format or FORMATS.get(os.path.splitext(args.output)[1].lower(), 'ndjson')
+    writer, stream = open_writer(args.output, output_format, args.image_cache, args.regionate)
+    store = SweepStore(store_path)
+    count = 0
+    try:
+        for data in store.locations():
+            writer.write(data)
+            count += 1
+        writer.close()
+    finally:
+        store.close()
+        if stream is not None:
+            stream.close()
+    return count
+
+
+def run_sweep(args):
+    """
+    Sweep every spot page in an id range across worker processes.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        int: Exit status; 1 if pages still failed after all retries.
+    """
+    from sweep import SiteSweeper
+
+    log = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr))
+    start_id, end_id = args.sweep
+    sweeper = SiteSweeper(args.store, workers=args.workers, shard_size=args.shard_size,
+                          translate=not args.no_translate, archive_path=args.archive)
+    started = time.monotonic()
+    summary = sweeper.sweep_range(start_id, end_id, resume=not args.restart,
+                                  callback=lambda progress, message: log(f"{progress:5.1f}% {message}"))
+    timings = {'scrape': time.monotonic() - started}
+
+    export_started = time.monotonic()
+    written = write_stored(args, args.store)
+    timings['export'] = time.monotonic() - export_started
+    timings['total'] = time.monotonic() - started
+
+    for error in summary['shard_errors']:
+        print(f"Sweep shard failed: {error}", file=sys.stderr)
+    log(f"Swept spots {start_id}-{end_id}: {summary['ok']} found, {summary['missing']} missing, "
+        f"{summary['skipped']} already in {args.store}; wrote {written} locations")
+    if not args.quiet:
+        print_report(timings, end_id - start_id + 1, len(summary['failed']),
+                     [(url, "failed after retries") for url in summary['failed']])
+    return 1 if summary['failed'] else 0
+
+
+def run_crawl(args):
+    """
+    Crawl spot ids upwards, skipping runs of missing ids.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        int: Exit status; 1 if pages could not be fetched.
+    """
+    from id_crawler import SpotIdCrawler
+
+    log = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr))
+    start_id, end_id = args.crawl_ids
+    scraper = HaikyoScraper()
+    if args.archive:
+        from page_archive import PageArchive
+        scraper.archive = PageArchive(args.archive)
+    crawler = SpotIdCrawler(scraper, args.store, concurrency=args.workers, translate=not args.no_translate)
+    started = time.monotonic()
+    summary = crawler.crawl(start_id, end_id, resume=not args.restart,
+                            callback=lambda progress, message: log(message))
+    timings = {'scrape': time.monotonic() - started}
+
+    export_started = time.monotonic()
+    written = write_stored(args, args.store)
+    timings['export'] = time.monotonic() - export_started
+    timings['total'] = time.monotonic() - started
+
+    log(f"Crawled spots {start_id}-{summary['next_id'] - 1}: {summary['found']} found, "
+        f"{summary['missing']} missing, {summary['skipped']} skipped, {summary['errors']} errors; "
+        f"wrote {written} locations")
+    if not args.quiet:
+        print_report(timings, summary['found'] + summary['missing'] + summary['errors'], summary['errors'], [])
+    return 1 if summary['errors'] else 0
+
+
+def run(args):
+    """
+    Run a batch job.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        int: Exit status; 1 if nothing was scraped successfully.
+    """
+    if args.replay:
+        return run_replay(args)
+    if args.sweep:
+        return run_sweep(args)
+    if args.crawl_ids:
+        return run_crawl(args)
+
+    log = (lambda message: None) if args.quiet else (lambda message: print(message, file=sys.stderr))
+    terms, urls = read_inputs(args.search, args.prefecture, args.url, args.input)
+    if not terms and not urls:
+        print("Nothing to do: give --search, --prefecture, --url or --input", file=sys.stderr)
+        return 2
+
+    output_format = args.format or FORMATS.get(os.path.splitext(args.output)[1].lower(), 'ndjson')
+    scraper = HaikyoScraper()
+    if args.negative_cache:
+        scraper.negative_cache = NegativeCache(args.negative_cache)
+    if args.archive:
+        from page_archive import PageArchive
+        scraper.archive = PageArchive(args.archive)
+    timings = {}
+    started = time.monotonic()
+
+    # Expand the search terms into location URLs
+    for term in terms:
+        found = scraper.search_locations(term, max_pages=args.max_pages)
+        log(f"Search '{term}': {len(found)} locations")
+        urls.extend(found)
+    urls = list(dict.fromkeys(urls))
+    if args.limit:
+        urls = urls[:args.limit]
+    timings['search'] = time.monotonic() - started
+
+    writer, stream = open_writer(args.output, output_format, args.image_cache, args.regionate)
+    progress = ProgressPrinter(len(urls), quiet=args.quiet)
+    failed = []
+    ok_count = 0
+    log(f"Scraping {len(urls)} locations with {args.workers} workers")
+    scrape_started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(scrape_one, scraper, url, not args.no_translate) for url in urls]
+            for future in as_completed(futures):
+                url, data, error = future.result()
+                if data is None:
+                    failed.append((url, error))
+                else:
+                    writer.write(data)
+                    ok_count += 1
+                progress.update(data is not None)
+        timings['scrape'] = time.monotonic() - scrape_started
+
+        export_started = time.monotonic()
+        writer.close()
+        timings['export'] = time.monotonic() - export_started
+    finally:
+        if stream is not None:
+            stream.close()
+    timings['total'] = time.monotonic() - started
+
+    if not args.quiet:
+        print_report(timings, len(urls), len(failed), failed)
+    return 0 if ok_count or not urls else 1
+
+
+def run_replay(args):
+    """
+    Re-extract the pages of an archive with the current extractors.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+
+    Returns:
+        int: Exit status; 1 if no page could be extracted.
+    """
+    from page_archive import PageArchive, replay
+
+    if not os.path.exists(args.replay):
+        raise ValueError(f"No archive at {args.replay}")
+    archive = PageArchive(args.replay, train_after=0)
+    try:
+        total = len(archive.latest_fetches())
+    finally:
+        archive.close()
+
+    output_format = args.format or FORMATS.get(os.path.splitext(args.output)[1].lower(), 'ndjson')
+    writer, stream = open_writer(args.output, output_format, args.image_cache, args.regionate)
+    progress = ProgressPrinter(total, quiet=args.quiet)
+    failed = []
+    timings = {}
+    started = time.monotonic()
+    results = replay(args.replay, workers=args.workers)
+    try:
+        for url, fetched, data, error in results:
+            if args.limit and progress.done >= args.limit:
+                break
+            if data is None:
+                failed.append((url, error))
+            else:
+                writer.write(data)
+            progress.update(data is not None)
+        timings['scrape'] = time.monotonic() - started
+
+        export_started = time.monotonic()
+        writer.close()
+        timings['export'] = time.monotonic() - export_started
+    finally:
+        # Stops the workers without parsing the pages past --limit
+        results.close()
+        if stream is not None:
+            stream.close()
+    timings['total'] = time.monotonic() - started
+
+    if not args.quiet:
+        print_report(timings, progress.done, len(failed), failed)
+    return 0 if progress.done > len(failed) or not total else 1
+
+
+def parse_args(argv=None):
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Search and scrape haikyo.info without the web interface.")
+    parser.add_argument('-s', '--search', action='append', default=[], metavar='TERM',
+                        help="search term (repeatable)")
+    parser.add_argument('-p', '--prefecture', action='append', default=[], metavar='NAME',
+                        help="prefecture to search, e.g. 北海道 (repeatable)")
+    parser.add_argument('-u', '--url', action='append', default=[],
+                        help="location page URL (repeatable)")
+    parser.add_argument('-i', '--input', metavar='FILE',
+                        help="file with one search term or URL per line ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, '-' for stdout (default)")
+    parser.add_argument('-f', '--format', choices=sorted(set(FORMATS.values())),
+                        help="output format (default: from the output extension, else ndjson)")
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help="locations scraped at once (default: 4)")
+    parser.add_argument('--max-pages', type=int, default=None,
+                        help="maximum result pages per search")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="maximum number of locations to scrape")
+    parser.add_argument('--no-translate', action='store_true',
+                        help="skip translating titles, addresses and descriptions")
+    parser.add_argument('--image-cache', metavar='DIR',
+                        help="thumbnail cache directory for KMZ output (default: image_cache)")
+    parser.add_argument('--regionate', action='store_true',
+                        help="split KMZ output into a quadtree of Region/Lod tiles for Google Earth")
+    parser.add_argument('--negative-cache', metavar='FILE',
+                        help="SQLite file remembering spots without coordinates, so later runs "
+                             "skip their extraction fallbacks")
+    parser.add_argument('--archive', metavar='FILE',
+                        help="SQLite archive to store every fetched page in, for --replay")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="re-extract the pages of an archive instead of fetching; "
+                             "--workers sets the number of processes")
+    parser.add_argument('--sweep', type=parse_id_range, metavar='FIRST-LAST',
+                        help="fetch every spot page in an id range with worker processes; "
+                             "--workers sets the number of processes")
+    parser.add_argument('--crawl-ids', type=lambda text: parse_id_range(text, open_ended=True),
+                        metavar='FIRST-[LAST]',
+                        help="enumerate spot ids from FIRST, skipping gaps; without LAST, stop "
+                             "when no more spots are found. --workers sets the requests in flight")
+    parser.add_argument('--store', default='spots.db', metavar='FILE',
+                        help="SQLite store that --sweep and --crawl-ids write to and resume from "
+                             "(default: spots.db)")
+    parser.add_argument('--shard-size', type=int, default=50,
+                        help="pages handed to a sweep worker at a time (default: 50)")
+    parser.add_argument('--restart', action='store_true',
+                        help="fetch pages again even if the store already has them")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="only print errors")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    return args
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    args = parse_args(argv)
+    try:
+        return run(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Module for harvesting haikyo.info spots by enumerating spot ids.
+
+Spot pages live at sequential URLs (/s/<id>.html), so instead of paging
+through search results the crawler walks the id space directly. Runs of
+missing ids are detected and skipped with widening probes, progress is
+checkpointed into the sweep store, and requests are issued concurrently
+with a bounded thread pool.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sweep import SweepStore, STATUS_OK, STATUS_MISSING, STATUS_ERROR
+
+CHECKPOINT_KEY = 'id_crawler'
+
+
+def checkpoint_key(start_id, end_id):
+    """Store metadata key of the checkpoint of a crawl over one id range."""
+    return f"{CHECKPOINT_KEY}:{start_id}-{'' if end_id is None else end_id}"
+
+
+class SpotIdCrawler:
+    """
+    Crawler that enumerates /s/<id>.html pages with adaptive gap detection.
+
+    While pages are being found, ids are fetched densely. Once ``gap_threshold``
+    consecutive ids are missing, the crawler switches to probing every
+    ``stride`` ids, doubling the stride up to ``max_stride``. When a probe hits,
+    it backfills the ids just before the hit and resumes dense crawling.
+    """
+
+    def __init__(self, scraper, store, concurrency=4, gap_threshold=20, max_stride=64,
+                 max_empty_rounds=3, translate=False):
+        """
+        Initialize the crawler.
+
+        Args:
+            scraper (HaikyoScraper): Scraper used to fetch and parse spot pages.
+            store (SweepStore or str): Result store, or a path to one.
+            concurrency (int): Maximum number of requests in flight.
+            gap_threshold (int): Consecutive missing ids before probing starts.
+            max_stride (int): Largest distance between probes.
+            max_empty_rounds (int): Probe rounds at max_stride without a hit
+                before an open-ended crawl stops.
+            translate (bool): Whether to translate the scraped text.
+        """
+        self.scraper = scraper
+        self.store = SweepStore(store) if isinstance(store, str) else store
+        self.concurrency = concurrency
+        self.gap_threshold = gap_threshold
+        self.max_stride = max_stride
+        self.max_empty_rounds = max_empty_rounds
+        self.translate = translate
+
+    def _fetch(self, spot_id):
+        """
+        Fetch and parse a single spot page.
+
+        Args:
+            spot_id (int): The spot id.
+
+        Returns:
+            tuple: (url, status, data, error)
+        """
+        url = self.scraper.spot_url(spot_id)
+        try:
+            response, html = self.scraper.fetch_spot_page(url)
+            if response.status_code == 404:
+                return url, STATUS_MISSING, None, ""
+            response.raise_for_status()
+            data = self.scraper.parse_location_page(html, url, translate=self.translate)
+            return url, STATUS_OK, data, ""
+        except Exception as e:
+            return url, STATUS_ERROR, None, str(e)
+
+    def _fetch_many(self, pool, spot_ids, state, done):
+        """
+        Fetch several ids concurrently and record the results.
+
+        Ids that are already completed in the store are not fetched again,
+        but their stored status is still reported for gap detection.
+
+        Args:
+            pool (ThreadPoolExecutor): The executor to use.
+            spot_ids (list): Ids to fetch.
+            state (dict): Crawl state whose counters are updated.
+            done (dict): Mapping of completed URL to status.
+
+        Returns:
+            dict: Mapping of spot id to status, in id order.
+        """
+        statuses = {}
+        todo = []
+        for spot_id in spot_ids:
+            url = self.scraper.spot_url(spot_id)
+            if url in done:
+                statuses[spot_id] = done[url]
+            else:
+                todo.append(spot_id)
+
+        for spot_id, (url, status, data, error) in zip(todo, pool.map(self._fetch, todo)):
+            self.store.save(url, status, data, error)
+            statuses[spot_id] = status
+            if status == STATUS_OK:
+                state['found'] += 1
+            elif status == STATUS_MISSING:
+                state['missing'] += 1
+            else:
+                state['errors'] += 1
+                continue
+            done[url] = status
+
+        return dict(sorted(statuses.items()))
+
+    def crawl(self, start_id=1, end_id=None, callback=None, resume=True):
+        """
+        Crawl spot pages from start_id upwards.
+
+        Args:
+            start_id (int): First spot id to fetch.
+            end_id (int, optional): Last spot id to fetch. If omitted, the crawl
+                stops after max_empty_rounds probe rounds find nothing.
+            callback (function, optional): Callback function for progress updates.
+            resume (bool): Continue from the checkpoint an earlier crawl over
+                the same range left in the store.
+
+        Returns:
+            dict: Summary with 'found', 'missing', 'errors', 'skipped' counts,
+                the 'next_id' to resume from and 'elapsed' seconds.
+        """
+        started = time.time()
+        state = {
+            'next_id': start_id, 'stride': 1, 'misses': 0, 'empty_rounds': 0,
+            'found': 0, 'missing': 0, 'errors': 0, 'skipped': 0
+        }
+        # Each range has its own checkpoint, so crawls over other ranges never resume from it
+        key = checkpoint_key(start_id, end_id)
+        if resume:
+            state.update(self.store.get_meta(key, {}))
+        done = self.store.completed_urls()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while end_id is None or state['next_id'] <= end_id:
+                if state['stride'] == 1:
+                    self._dense_round(pool, state, end_id, done)
+                elif not self._probe_round(pool, state, end_id, done):
+                    if end_id is None and state['empty_rounds'] >= self.max_empty_rounds:
+                        break
+
+                self.store.set_meta(key, state)
+                if callback:
+                    if end_id:
+                        progress = min(100, (state['next_id'] - start_id) / (end_id - start_id + 1) * 100)
+                    else:
+                        progress = 0
+                    callback(progress, f"Crawled up to spot {state['next_id'] - 1}: "
+                                       f"{state['found']} found, {state['skipped']} skipped")
+
+        summary = {key: state[key] for key in ('found', 'missing', 'errors', 'skipped', 'next_id')}
+        summary['elapsed'] = time.time() - started
+        if callback:
+            callback(100, f"Crawl finished: {summary['found']} spots found")
+        return summary
+
+    def _dense_round(self, pool, state, end_id, done):
+        """Fetch the next block of consecutive ids."""
+        first = state['next_id']
+        last = first + self.concurrency * 2 - 1
+        if end_id is not None:
+            last = min(last, end_id)
+
+        statuses = self._fetch_many(pool, list(range(first, last + 1)), state, done)
+        for status in statuses.values():
+            if status == STATUS_MISSING:
+                state['misses'] += 1
+            elif status == STATUS_OK:
+                state['misses'] = 0
+
+        state['next_id'] = last + 1
+        if state['misses'] >= self.gap_threshold:
+            state['stride'] = 2
+
+    def _probe_round(self, pool, state, end_id, done):
+        """
+        Probe ahead with the current stride.
+
+        Returns:
+            bool: True if a probe found a spot.
+        """
+        stride = state['stride']
+        probes = [state['next_id'] + stride * (k + 1) - 1 for k in range(self.concurrency)]
+        if end_id is not None:
+            probes = [spot_id for spot_id in probes if spot_id <= end_id] or [end_id]
+
+        statuses = self._fetch_many(pool, probes, state, done)
+        hits = [spot_id for spot_id, status in statuses.items() if status == STATUS_OK]
+
+        if not hits:
+            state['skipped'] += (probes[-1] - state['next_id'] + 1) - len(probes)
+            state['next_id'] = probes[-1] + 1
+            if stride < self.max_stride:
+                state['stride'] = min(stride * 2, self.max_stride)
+            else:
+                state['empty_rounds'] += 1
+            return False
+
+        # Backfill the ids just before the first hit, which belong to the
+        # same cluster of pages, then resume dense crawling after it.
+        first_hit = hits[0]
+        visited = {spot_id for spot_id in probes if spot_id < first_hit}
+        visited |= self._backfill(pool, state, first_hit, done)
+        state['skipped'] += (first_hit - state['next_id']) - len(visited)
+        state.update(next_id=first_hit + 1, stride=1, misses=0, empty_rounds=0)
+        return True
+
+    def _backfill(self, pool, state, first_hit, done):
+        """
+        Scan backwards from a probe hit until a run of missing ids is found.
+
+        Returns:
+            set: The ids that were visited.
+        """
+        lower = state['next_id']
+        spot_id = first_hit - 1
+        misses = 0
+        visited = set()
+        while spot_id >= lower and misses < self.gap_threshold:
+            batch = list(range(max(lower, spot_id - self.concurrency + 1), spot_id + 1))
+            statuses = self._fetch_many(pool, batch, state, done)
+            visited.update(batch)
+            for status in reversed(list(statuses.values())):
+                misses = 0 if status == STATUS_OK else misses + 1
+            spot_id = batch[0] - 1
+        return visited
@@ -0,0 +1,271 @@
+"""
+Module for downloading, deduplicating and thumbnailing location images.
+
+Images are fetched concurrently, stored once per content hash as small
+thumbnails and remembered by URL in an index on disk, so placemark popups
+can show local files instead of hotlinking the full-size originals.
+Worker processes sharing a cache directory merge their entries into the
+index when they save it.
+"""
+
+import io
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metrics
+import tracing
+import file_lock
+from rate_control import rate_controller
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional; without it images are cached at their original size
+    Image = None
+
+# Bounding box for thumbnails shown in popups
+THUMBNAIL_SIZE = (240, 180)
+
+# Leading bytes of the image formats served by haikyo.info
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG', '.png'),
+    (b'GIF8', '.gif'),
+)
+
+
+def guess_extension(data):
+    """
+    Guess an image file extension from its content.
+
+    Args:
+        data (bytes): The image data.
+
+    Returns:
+        str: File extension including the dot, '.img' if unknown.
+    """
+    for signature, extension in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return '.img'
+
+
+class ImageCache:
+    """
+    Disk cache of image thumbnails keyed by URL and deduplicated by content.
+    """
+
+    def __init__(self, cache_dir='image_cache', size=THUMBNAIL_SIZE, workers=8, timeout=20,
+                 max_bytes=10 * 1024 * 1024, session=None, controller=None):
+        """
+        Initialize the cache, loading the URL index if it exists.
+
+        Args:
+            cache_dir (str): Directory holding the thumbnails and index.
+            size (tuple): Maximum (width, height) of thumbnails.
+            workers (int): Number of concurrent downloads.
+            timeout (int): Request timeout in seconds.
+            max_bytes (int): Images larger than this are not cached.
+            session (requests.Session, optional): Session used for downloads.
+            controller (RateController, optional): Rate controller for downloads;
+                defaults to the process-wide one.
+        """
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.workers = workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = session or requests.Session()
+        self.controller = controller or rate_controller
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        """
+        Read the URL index saved on disk.
+
+        Returns:
+            dict: Mapping of URL to file name; empty if there is no readable index.
+        """
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def file_path(self, name):
+        """
+        Get the path of a cached file.
+
+        Args:
+            name (str): File name as returned by filename() or cache_many().
+
+        Returns:
+            str: Path inside the cache directory.
+        """
+        return os.path.join(self.cache_dir, name)
+
+    def filename(self, url):
+        """
+        Get the cached file name for an image URL.
+
+        Args:
+            url (str): The image URL.
+
+        Returns:
+            str: The file name, or None if the image is not cached.
+        """
+        name = self.index.get(url)
+        if name and os.path.exists(self.file_path(name)):
+            return name
+        return None
+
+    def _thumbnail(self, data):
+        """
+        Shrink an image to the thumbnail size.
+
+        Returns:
+            tuple: (bytes, extension). The original data is returned when Pillow
+                is not installed or the data cannot be decoded.
+        """
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    image.thumbnail(self.size)
+                    output = io.BytesIO()
+                    image.convert('RGB').save(output, 'JPEG', quality=80, optimize=True)
+                    return output.getvalue(), '.jpg'
+            except Exception as e:
+                print(f"Could not create thumbnail: {e}")
+        return data, guess_extension(data)
+
+    def _store(self, data):
+        """
+        Store an image once per content hash.
+
+        Returns:
+            str: The file name of the stored thumbnail.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        # The thumbnail depends only on the content and size, so identical
+        # images downloaded from different URLs map to the same file
+        suffix = f"_{self.size[0]}x{self.size[1]}" if Image is not None else ""
+        for extension in ('.jpg', '.png', '.gif', '.webp', '.img'):
+            name = f"{digest}{suffix}{extension}"
+            if os.path.exists(self.file_path(name)):
+                return name
+
+        thumbnail, extension = self._thumbnail(data)
+        name = f"{digest}{suffix}{extension}"
+        temp_path = self.file_path(f"{name}.{threading.get_ident()}.tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(thumbnail)
+        os.replace(temp_path, self.file_path(name))
+        return name
+
+    def _read_limited(self, response):
+        """
+        Read a streamed response body, giving up once it exceeds max_bytes.
+
+        Returns:
+            bytes: The body, or None if it is too large.
+        """
+        length = response.headers.get('Content-Length', "")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return None
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > self.max_bytes:
+                return None
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _download(self, url):
+        """
+        Download and store one image.
+
+        Returns:
+            tuple: (url, file name or None)
+        """
+        try:
+            # The host's slot is held while the body downloads; a missing image is no reason to back off
+            with metrics.timed('image_fetch'):
+                with self.controller.stream(self.session, url, timeout=self.timeout) as response:
+                    data = self._read_limited(response) if response.status_code < 400 else None
+            response.raise_for_status()
+            if data is None:
+                print(f"Skipping oversized image {url} (over {self.max_bytes} bytes)")
+                return url, None
+            with metrics.timed('thumbnail'):
+                name = self._store(data)
+            with self._lock:
+                self.index[url] = name
+            return url, name
+        except Exception as e:
+            print(f"Error downloading image {url}: {e}")
+            return url, None
+
+    def cache_many(self, urls, callback=None):
+        """
+        Make sure a set of images is cached, downloading missing ones concurrently.
+
+        Args:
+            urls (iterable): Image URLs.
+            callback (function, optional): Callback function for progress updates.
+
+        Returns:
+            dict: Mapping of URL to cached file name for every available image.
+        """
+        urls = [url for url in dict.fromkeys(urls) if url]
+        if any(url not in self.index for url in urls):
+            # Another worker process may have cached them meanwhile
+            saved = self._read_index()
+            with self._lock:
+                for url, name in saved.items():
+                    self.index.setdefault(url, name)
+        cached = {}
+        missing = []
+        for url in urls:
+            name = self.filename(url)
+            metrics.cache_lookup('image', bool(name))
+            if name:
+                cached[url] = name
+            else:
+                missing.append(url)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for i, (url, name) in enumerate(pool.map(tracing.propagate(self._download), missing)):
+                    if name:
+                        cached[url] = name
+                    if callback:
+                        progress = (i + 1) / len(missing) * 100
+                        callback(progress, f"Cached image {i + 1} of {len(missing)}")
+            self.save()
+
+        return cached
+
+    def save(self):
+        """Write the URL index to disk, keeping the entries other processes saved meanwhile."""
+        with file_lock.locked(self.index_path):
+            saved = self._read_index()
+            with self._lock:
+                for url, name in saved.items():
+                    self.index.setdefault(url, name)
+                data = json.dumps(self.index, ensure_ascii=False)
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.index_path)
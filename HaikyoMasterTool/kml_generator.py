@@ -3,7 +3,15 @@ Module for generating KML files from location data.
 """
 
 import os
-import simplekml
+import zipfile
+
+import metrics
+import kml_regions
+from location import LocationBatch
+from image_cache import ImageCache
+
+# Images shown per placemark popup
+MAX_POPUP_IMAGES = 3
 
 class KMLGenerator:
     """
@@ -16,20 +24,38 @@ class KMLGenerator:
         """
         pass
     
-    def generate_kml(self, locations, output_path, callback=None):
+    def generate_kml(self, locations, output_path, callback=None, image_cache=None):
         """
         Generate a KML file from a list of locations.
         
+        If output_path ends with .kmz, popup images are downloaded as thumbnails
+        and bundled into the KMZ archive so the popups work offline.
+        
         Args:
-            locations (list): A list of location dictionaries.
-            output_path (str): Path to save the KML file.
+            locations (list): A list of Location objects or location dictionaries.
+            output_path (str): Path to save the KML or KMZ file.
             callback (function, optional): Callback function for progress updates.
+            image_cache (ImageCache, optional): Thumbnail cache used for KMZ output.
             
         Returns:
             bool: True if successful, False otherwise.
         """
         try:
-            # Create a new KML document
+            # Columnar rows; each Location only exists while it is written
+            locations = LocationBatch(locations)
+            
+            # Fetch thumbnails for the popups that will be bundled
+            bundled_images = {}
+            kmz = output_path.lower().endswith('.kmz')
+            if kmz:
+                image_cache = image_cache or ImageCache()
+                image_urls = [url for location in locations if location.has_coordinates
+                              for url in location.images[:MAX_POPUP_IMAGES]]
+                bundled_images = image_cache.cache_many(
+                    image_urls, (lambda p, m: callback(p / 2, m)) if callback else None)
+            
+            # Create a new KML document (simplekml is imported on first use)
+            import simplekml
             kml = simplekml.Kml()
             
             # Set document name and description
@@ -41,18 +67,17 @@ class KMLGenerator:
             
             for i, location in enumerate(locations):
                 # Skip locations without valid coordinates
-                if not location['coordinates'] or \
-                   location['coordinates']['lat'] == 0 and location['coordinates']['lng'] == 0:
+                if not location.has_coordinates:
                     if callback:
-                        progress = (i + 1) / total_locations * 100
-                        callback(progress, f"Skipping location without coordinates: {location['title']}")
+                        progress = self._progress(i, total_locations, kmz)
+                        callback(progress, f"Skipping location without coordinates: {location.title}")
                     continue
                 
                 # Create a placemark for the location
                 placemark = kml.newpoint(
-                    name=location['title'],
-                    description=self._format_description(location),
-                    coords=[(location['coordinates']['lng'], location['coordinates']['lat'])]
+                    name=location.title,
+                    description=self._format_description(location, bundled_images),
+                    coords=[(location.lng, location.lat)]
                 )
                 
                 # Set placemark style (optional customization)
@@ -62,11 +87,15 @@ class KMLGenerator:
                 valid_locations += 1
                 
                 if callback:
-                    progress = (i + 1) / total_locations * 100
-                    callback(progress, f"Added location to KML: {location['title']}")
+                    progress = self._progress(i, total_locations, kmz)
+                    callback(progress, f"Added location to KML: {location.title}")
             
-            # Save the KML file
-            kml.save(output_path)
+            # Save the KML file, or the KMZ archive with its images
+            with metrics.timed('kml_render'):
+                if kmz:
+                    self._save_kmz(kml, output_path, image_cache, bundled_images.values())
+                else:
+                    kml.save(output_path)
             
             if callback:
                 callback(100, f"KML file generated with {valid_locations} locations")
@@ -78,28 +107,102 @@ class KMLGenerator:
                 callback(0, f"Error generating KML file: {str(e)}")
             return False
     
-    def _format_description(self, location):
+    def generate_regionated_kmz(self, locations, output_path, callback=None, image_cache=None,
+                                max_per_tile=kml_regions.MAX_PER_TILE):
+        """
+        Generate a regionated KMZ super-overlay from a list of locations.
+        
+        Placemarks are split into a quadtree of KML tiles linked by
+        NetworkLinks with Region/Lod, so Google Earth only loads and draws
+        the placemarks of the visible area and zoom level. Popup images are
+        bundled as thumbnails, as with generate_kml's KMZ output.
+        
+        Args:
+            locations (list): A list of Location objects or location dictionaries.
+            output_path (str): Path to save the KMZ file.
+            callback (function, optional): Callback function for progress updates.
+            image_cache (ImageCache, optional): Thumbnail cache for the popup images.
+            max_per_tile (int): Placemarks drawn per tile.
+            
+        Returns:
+            bool: True if successful, False otherwise.
+        """
+        try:
+            located = LocationBatch(locations).filter(with_coordinates=True)
+            
+            image_cache = image_cache or ImageCache()
+            image_urls = [url for location in located for url in location.images[:MAX_POPUP_IMAGES]]
+            bundled_images = image_cache.cache_many(
+                image_urls, (lambda p, m: callback(p * 0.8, m)) if callback else None)
+            
+            if callback:
+                callback(80, f"Building regionated tiles for {len(located)} locations...")
+            with metrics.timed('kml_render'):
+                placemarks = [(location.title, location.lat, location.lng,
+                               self._format_description(location, bundled_images))
+                              for location in located]
+                tiles = kml_regions.build_tiles(placemarks, max_per_tile=max_per_tile)
+                files = [(image_cache.file_path(name), f"files/{name}")
+                         for name in sorted(set(bundled_images.values()))]
+                kml_regions.write_kmz(tiles, output_path, files)
+            
+            if callback:
+                callback(100, f"Regionated KMZ generated with {len(located)} locations in {len(tiles)} tiles")
+            return True
+        
+        except Exception as e:
+            if callback:
+                callback(0, f"Error generating regionated KMZ file: {str(e)}")
+            return False
+    
+    def _progress(self, index, total, kmz):
+        """Map a placemark index to overall progress; KMZ output spends the first half on images."""
+        progress = (index + 1) / total * 100
+        return 50 + progress / 2 if kmz else progress
+    
+    def _save_kmz(self, kml, output_path, image_cache, image_names):
+        """
+        Write a KMZ archive containing the KML document and the bundled images.
+        
+        Args:
+            kml (simplekml.Kml): The KML document.
+            output_path (str): Path to save the KMZ file.
+            image_cache (ImageCache): Cache holding the images.
+            image_names (iterable): Cached file names referenced by the popups.
+        """
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as kmz:
+            kmz.writestr('doc.kml', kml.kml())
+            for name in sorted(set(image_names)):
+                # Images are already compressed
+                kmz.write(image_cache.file_path(name), f"files/{name}", compress_type=zipfile.ZIP_STORED)
+    
+    def _format_description(self, location, bundled_images=None):
         """
         Format the description for a KML placemark.
         
         Args:
-            location (dict): Location dictionary with details.
+            location (Location): Location with details.
+            bundled_images (dict, optional): Mapping of image URL to the file name
+                bundled in the KMZ archive; other images are linked remotely.
             
         Returns:
             str: HTML-formatted description for the KML placemark.
         """
         description = f"""
         <![CDATA[
-        <h3>{location['title']}</h3>
-        {f"<p><strong>Address:</strong> {location['address']}</p>" if location.get('address') else ""}
-        <p>{location['description'][:200]}{'...' if len(location['description']) > 200 else ''}</p>
-        <p><a href="{location['url']}" target="_blank">View on haikyo.info</a></p>
+        <h3>{location.title}</h3>
+        {f"<p><strong>Address:</strong> {location.address}</p>" if location.address else ""}
+        <p>{location.description[:200]}{'...' if len(location.description) > 200 else ''}</p>
+        <p><a href="{location.url}" target="_blank">View on haikyo.info</a></p>
         """
         
         # Add images if available (limit to 3 to keep KML file size reasonable)
-        if location['images'] and len(location['images']) > 0:
+        if location.images:
+            bundled_images = bundled_images or {}
             description += "<div style='display: flex; flex-wrap: wrap;'>"
-            for img_url in location['images'][:3]:
+            for img_url in location.images[:MAX_POPUP_IMAGES]:
+                if img_url in bundled_images:
+                    img_url = f"files/{bundled_images[img_url]}"
                 description += f"<img src='{img_url}' style='max-width: 200px; margin: 5px;' />"
             description += "</div>"
         
@@ -0,0 +1,172 @@
+"""
+Module for writing regionated KML super-overlays.
+
+A flat KML document makes Google Earth load and draw every placemark at
+once, which is unusable for a nationwide dataset. A super-overlay splits
+the placemarks into a quadtree of small KML files: each tile shows a
+spread-out sample of its placemarks and links to its four child tiles
+through NetworkLinks with a Region and Lod, so Google Earth only fetches
+a child when its area is on screen and large enough, and only draws the
+placemarks of the area and zoom level being looked at.
+
+Tiles are packaged with a root doc.kml into a KMZ:
+
+    tiles = build_tiles([(name, lat, lng, description_html), ...])
+    write_kmz(tiles, 'haikyo.kmz')
+"""
+
+import zipfile
+from xml.sax.saxutils import escape
+
+# Placemarks drawn per tile before the rest are pushed down into child tiles
+MAX_PER_TILE = 100
+
+# Deepest tile level; tiles at this level keep all their placemarks
+MAX_DEPTH = 12
+
+# On-screen size in pixels at which a child tile is loaded
+MIN_LOD_PIXELS = 256
+
+DEFAULT_ICON = 'http://maps.google.com/mapfiles/kml/shapes/shopping.png'
+
+
+def _cdata(description):
+    """Wrap an HTML description in CDATA unless it already is."""
+    description = description or ""
+    if description.strip().startswith('<![CDATA['):
+        return description.strip()
+    return '<![CDATA[' + description.replace(']]>', ']]]]><![CDATA[>') + ']]>'
+
+
+def _region(bounds, min_lod_pixels):
+    """KML Region for tile bounds (south, west, north, east)."""
+    south, west, north, east = bounds
+    return (f'<Region><LatLonAltBox><north>{north}</north><south>{south}</south>'
+            f'<east>{east}</east><west>{west}</west></LatLonAltBox>'
+            f'<Lod><minLodPixels>{min_lod_pixels}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod>'
+            f'</Region>')
+
+
+def _quadrant(bounds, lat, lng):
+    """Index 0-3 of the quadrant of bounds that contains a point."""
+    south, west, north, east = bounds
+    return (2 if lat >= (south + north) / 2 else 0) + (1 if lng >= (west + east) / 2 else 0)
+
+
+def _child_bounds(bounds, quadrant):
+    """Bounds of one quadrant."""
+    south, west, north, east = bounds
+    middle_lat, middle_lng = (south + north) / 2, (west + east) / 2
+    south, north = (middle_lat, north) if quadrant >= 2 else (south, middle_lat)
+    west, east = (middle_lng, east) if quadrant % 2 else (west, middle_lng)
+    return south, west, north, east
+
+
+def _square_bounds(placemarks):
+    """Square bounds (in degrees) around all placemarks, so tiles stay square."""
+    lats = [placemark[1] for placemark in placemarks]
+    lngs = [placemark[2] for placemark in placemarks]
+    size = max(max(lats) - min(lats), max(lngs) - min(lngs), 0.01) / 2 * 1.001
+    middle_lat, middle_lng = (max(lats) + min(lats)) / 2, (max(lngs) + min(lngs)) / 2
+    return middle_lat - size, middle_lng - size, middle_lat + size, middle_lng + size
+
+
+def _tile_kml(name, placemarks, children, region, icon):
+    """Render one tile: its placemarks plus NetworkLinks to its children."""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">\n<Document>\n',
+             f'<name>{escape(name)}</name>\n']
+    if region:
+        parts.append(region + '\n')
+    parts.append(f'<Style id="spot"><IconStyle><scale>1.0</scale><Icon><href>{escape(icon)}</href>'
+                 f'</Icon></IconStyle></Style>\n')
+    for child_name, href, child_region in children:
+        parts.append(f'<NetworkLink><name>{escape(child_name)}</name>{child_region}'
+                     f'<Link><href>{escape(href)}</href><viewRefreshMode>onRegion</viewRefreshMode></Link>'
+                     f'</NetworkLink>\n')
+    for title, lat, lng, description in placemarks:
+        parts.append(f'<Placemark><name>{escape(title or "")}</name>'
+                     f'<description>{_cdata(description)}</description><styleUrl>#spot</styleUrl>'
+                     f'<Point><coordinates>{lng},{lat},0</coordinates></Point></Placemark>\n')
+    parts.append('</Document>\n</kml>\n')
+    return ''.join(parts)
+
+
+def build_tiles(placemarks, name="Haikyo Locations", max_per_tile=MAX_PER_TILE,
+                max_depth=MAX_DEPTH, icon=DEFAULT_ICON):
+    """
+    Partition placemarks into a quadtree of regionated KML tiles.
+
+    Each tile keeps up to max_per_tile placemarks, taken in turn from its
+    four quadrants so they are spread over its area; the remaining ones go
+    to the child tiles. A placemark appears in exactly one tile.
+
+    Args:
+        placemarks (iterable): (name, lat, lng, description HTML) tuples.
+        name (str): Document name.
+        max_per_tile (int): Placemarks drawn per tile.
+        max_depth (int): Deepest tile level.
+        icon (str): Placemark icon URL.
+
+    Returns:
+        dict: File name in the KMZ -> KML text; 'doc.kml' is the root tile.
+    """
+    placemarks = list(placemarks)
+    tiles = {}
+    if not placemarks:
+        tiles['doc.kml'] = _tile_kml(name, [], [], None, icon)
+        return tiles
+
+    # Tiles to render: (key, bounds, placemarks); the key is the quadrant path from the root
+    pending = [('', _square_bounds(placemarks), placemarks)]
+    while pending:
+        key, bounds, members = pending.pop()
+        quadrants = [[], [], [], []]
+        for placemark in members:
+            quadrants[_quadrant(bounds, placemark[1], placemark[2])].append(placemark)
+
+        if len(members) <= max_per_tile or len(key) >= max_depth:
+            shown, quadrants = members, [[], [], [], []]
+        else:
+            # Take placemarks round-robin from the quadrants; the rest go into child tiles
+            shown = []
+            while len(shown) < max_per_tile:
+                for quadrant in quadrants:
+                    if quadrant and len(shown) < max_per_tile:
+                        shown.append(quadrant.pop(0))
+
+        children = []
+        for index, quadrant in enumerate(quadrants):
+            if not quadrant:
+                continue
+            child_key = key + str(index)
+            child_bounds = _child_bounds(bounds, index)
+            children.append((f"Tile {child_key}", f"tile_{child_key}.kml",
+                             _region(child_bounds, MIN_LOD_PIXELS)))
+            pending.append((child_key, child_bounds, quadrant))
+
+        if key:
+            tiles[f"tile_{key}.kml"] = _tile_kml(f"Tile {key}", shown, children,
+                                                 _region(bounds, MIN_LOD_PIXELS), icon)
+        else:
+            tiles['doc.kml'] = _tile_kml(name, shown, children, None, icon)
+    return tiles
+
+
+def write_kmz(tiles, output_path, files=()):
+    """
+    Package tiles (and optional extra files) into a KMZ archive.
+
+    Args:
+        tiles (dict): File name -> KML text, from build_tiles().
+        output_path (str or file): Path of the KMZ file, or a binary file object.
+        files (iterable): (path on disk, name in the archive) pairs, e.g.
+            popup images; stored without recompression.
+    """
+    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as kmz:
+        # Google Earth opens the first KML file in the archive
+        kmz.writestr('doc.kml', tiles['doc.kml'])
+        for tile_name in sorted(tiles):
+            if tile_name != 'doc.kml':
+                kmz.writestr(tile_name, tiles[tile_name])
+        for path, name in files:
+            kmz.write(path, name, compress_type=zipfile.ZIP_STORED)
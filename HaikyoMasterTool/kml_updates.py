@@ -0,0 +1,216 @@
+"""
+Module for serving live KML that clients update incrementally.
+
+Instead of re-downloading a complete KML file after every crawl, Google
+Earth opens a small root file once. It network-links to the full document
+(doc.kml), which in turn polls an update link. Each update response is a
+NetworkLinkControl with an <Update> holding only the placemarks created,
+changed or deleted since the version the client last saw, plus a cookie
+with the new version that Google Earth sends back on its next poll:
+
+    /live.kml                  root: NetworkLink to doc.kml
+    /live/doc.kml              all placemarks + NetworkLink to update.kml?version=N
+    /live/update.kml?version=N Delete/Create for spots that changed after N
+
+Placemarks are keyed by spot id, so a re-scraped spot replaces its old
+placemark rather than adding a duplicate.
+"""
+
+import hashlib
+import threading
+from xml.sax.saxutils import escape, quoteattr
+
+from location import Location
+
+# Seconds between update polls
+REFRESH_INTERVAL = 60
+
+# id of the Document that holds the placemarks, targeted by Create
+DOCUMENT_ID = 'haikyo'
+
+ICON = 'http://maps.google.com/mapfiles/kml/shapes/shopping.png'
+
+KML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+
+
+def placemark_id(key):
+    """KML id of the placemark for a spot."""
+    return f"spot-{key}"
+
+
+def describe(location):
+    """Popup HTML of a placemark: address, start of the description and a link."""
+    html = f"<h3>{escape(location.title)}</h3>"
+    if location.address:
+        html += f"<p><strong>Address:</strong> {escape(location.address)}</p>"
+    if location.description:
+        html += f"<p>{escape(location.description[:200])}{'...' if len(location.description) > 200 else ''}</p>"
+    return html + f'<p><a href="{escape(location.url)}" target="_blank">View on haikyo.info</a></p>'
+
+
+class PlacemarkFeed:
+    """
+    Versioned set of placemarks keyed by spot id, thread-safe.
+    """
+
+    def __init__(self, describe=describe):
+        """
+        Initialize an empty feed.
+
+        Args:
+            describe (callable, optional): Returns the popup HTML of a Location.
+        """
+        self.describe = describe
+        self.version = 0
+        self._lock = threading.Lock()
+        # Spot key -> (version last changed, version first created, content hash, placemark KML)
+        self._placemarks = {}
+        # Spot key -> (version deleted, version first created)
+        self._deleted = {}
+
+    def _placemark(self, key, location):
+        """Render the placemark KML of a location."""
+        return (f'<Placemark id={quoteattr(placemark_id(key))}><name>{escape(location.title)}</name>'
+                f'<description><![CDATA[{self.describe(location).replace("]]>", "]]]]><![CDATA[>")}]]>'
+                f'</description>'
+                f'<styleUrl>#spot</styleUrl>'
+                f'<Point><coordinates>{location.lng},{location.lat},0</coordinates></Point></Placemark>')
+
+    def sync(self, locations):
+        """
+        Make the feed match a list of locations.
+
+        Locations without coordinates are left out; placemarks whose spot is
+        no longer in the list are deleted. Only actual changes bump the version.
+
+        Args:
+            locations (list): Location objects or location dictionaries.
+
+        Returns:
+            int: The feed version after the sync.
+        """
+        current = {}
+        for location in locations:
+            location = Location.from_dict(location)
+            if location.has_coordinates:
+                current[location.spot_id or location.url] = self._placemark(location.spot_id or location.url,
+                                                                            location)
+
+        with self._lock:
+            version = self.version + 1
+            changed = False
+            for key, kml in current.items():
+                digest = hashlib.sha1(kml.encode('utf-8')).hexdigest()
+                existing = self._placemarks.get(key)
+                if existing and existing[2] == digest:
+                    continue
+                created = existing[1] if existing else self._deleted.pop(key, (None, version))[1]
+                self._placemarks[key] = (version, created, digest, kml)
+                changed = True
+            for key in [key for key in self._placemarks if key not in current]:
+                created = self._placemarks.pop(key)[1]
+                self._deleted[key] = (version, created)
+                changed = True
+            if changed:
+                self.version = version
+            return self.version
+
+    def dump(self):
+        """
+        Get the feed's state, so another process can load it.
+
+        Returns:
+            dict: JSON-serializable state.
+        """
+        with self._lock:
+            return {'version': self.version,
+                    'placemarks': {key: list(entry) for key, entry in self._placemarks.items()},
+                    'deleted': {key: list(entry) for key, entry in self._deleted.items()}}
+
+    def load(self, state):
+        """
+        Replace the feed's state with one from dump().
+
+        Args:
+            state (dict): The state.
+        """
+        with self._lock:
+            self.version = state['version']
+            self._placemarks = {key: tuple(entry) for key, entry in state['placemarks'].items()}
+            self._deleted = {key: tuple(entry) for key, entry in state['deleted'].items()}
+
+    def root_document(self, doc_url):
+        """
+        Render the root file users open once.
+
+        Args:
+            doc_url (str): Absolute URL of the full document.
+
+        Returns:
+            str: KML text.
+        """
+        return (KML_HEADER + '<Document><name>Haikyo Locations (live)</name>\n'
+                f'<NetworkLink><name>Haikyo Locations</name><Link><href>{escape(doc_url)}</href></Link>'
+                '</NetworkLink>\n</Document>\n</kml>\n')
+
+    def full_document(self, update_url):
+        """
+        Render every placemark plus the link that polls for updates.
+
+        Args:
+            update_url (str): Absolute URL of the update document, without query.
+
+        Returns:
+            str: KML text.
+        """
+        with self._lock:
+            version = self.version
+            placemarks = [entry[3] for entry in self._placemarks.values()]
+        return (KML_HEADER + f'<Document id="{DOCUMENT_ID}"><name>Haikyo Locations</name>\n'
+                f'<Style id="spot"><IconStyle><Icon><href>{ICON}</href></Icon></IconStyle></Style>\n'
+                f'<NetworkLink><name>Updates</name><Link><href>{escape(update_url)}?version={version}</href>'
+                f'<refreshMode>onInterval</refreshMode><refreshInterval>{REFRESH_INTERVAL}</refreshInterval>'
+                '</Link></NetworkLink>\n'
+                + '\n'.join(placemarks) + '\n</Document>\n</kml>\n')
+
+    def update_document(self, since, doc_url):
+        """
+        Render the changes after a version as a NetworkLinkControl Update.
+
+        Changed placemarks are deleted and created again, which replaces
+        their geometry, style and popup in one step.
+
+        Args:
+            since (int): The version the client has.
+            doc_url (str): Absolute URL of the full document (the Update target).
+
+        Returns:
+            str: KML text; carries a cookie with the current version.
+        """
+        with self._lock:
+            version = self.version
+            if since > version:
+                # The client saw a version from before a restart; replace everything it has
+                upserts = list(self._placemarks.items())
+                deletes = list(self._deleted) + [key for key, entry in upserts]
+            else:
+                upserts = [(key, entry) for key, entry in self._placemarks.items() if entry[0] > since]
+                deletes = [key for key, (deleted, created) in self._deleted.items()
+                           if deleted > since and created <= since]
+                # Spots the client already had are removed before their new placemark is created
+                deletes += [key for key, entry in upserts if entry[1] <= since]
+
+        parts = [KML_HEADER, '<NetworkLinkControl>',
+                 f'<cookie>version={version}</cookie>',
+                 f'<minRefreshPeriod>{REFRESH_INTERVAL // 2}</minRefreshPeriod>']
+        if upserts or deletes:
+            parts.append(f'<Update><targetHref>{escape(doc_url)}</targetHref>')
+            if deletes:
+                parts.append('<Delete>' + ''.join(f'<Placemark targetId={quoteattr(placemark_id(key))}/>'
+                                                  for key in deletes) + '</Delete>')
+            if upserts:
+                parts.append(f'<Create><Document targetId="{DOCUMENT_ID}">'
+                             + ''.join(entry[3] for key, entry in upserts) + '</Document></Create>')
+            parts.append('</Update>')
+        parts.append('</NetworkLinkControl>\n</kml>\n')
+        return ''.join(parts)
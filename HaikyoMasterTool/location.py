@@ -0,0 +1,367 @@
+"""
+Module defining a compact, normalized location record.
+
+The three Haikyo tools each produce a differently shaped dictionary for a
+spot. This module provides a single slotted ``Location`` type with adapters
+for all of them, and a columnar ``LocationBatch`` for holding large numbers
+of spots in memory.
+"""
+
+import math
+import sys
+from array import array
+from dataclasses import dataclass, fields
+
+from utils import extract_spot_id
+
+
+def _intern(value):
+    """Intern short, highly repeated strings such as prefectures and categories."""
+    return sys.intern(value) if value else ""
+
+
+def _to_float(value):
+    """Convert a coordinate to float, returning None if it is missing or invalid."""
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+@dataclass(slots=True)
+class Location:
+    """
+    A normalized abandoned location.
+
+    Coordinates are stored as plain floats (None when unknown) and the
+    prefecture and category strings are interned, so many records share
+    the same string objects.
+    """
+    url: str = ""
+    title: str = ""
+    spot_id: str = ""
+    lat: float | None = None
+    lng: float | None = None
+    address: str = ""
+    prefecture: str = ""
+    category: str = ""
+    description: str = ""
+    images: tuple = ()
+    translated_title: str = ""
+    translated_address: str = ""
+    translated_description: str = ""
+
+    def __post_init__(self):
+        self.prefecture = _intern(self.prefecture)
+        self.category = _intern(self.category)
+        self.lat = _to_float(self.lat)
+        self.lng = _to_float(self.lng)
+        self.images = tuple(self.images or ())
+        if not self.spot_id:
+            self.spot_id = extract_spot_id(self.url)
+
+    @property
+    def has_coordinates(self):
+        """bool: True if the location has usable (non-zero) coordinates."""
+        return (self.lat is not None and self.lng is not None and
+                (self.lat != 0 or self.lng != 0))
+
+    @property
+    def image_url(self):
+        """str: The first image URL, or an empty string."""
+        return self.images[0] if self.images else ""
+
+    @classmethod
+    def from_master(cls, data):
+        """
+        Build a Location from a HaikyoMasterTool scraper dictionary.
+
+        Args:
+            data (dict): Dictionary with 'title', 'url' and 'coordinates' as
+                {'lat': ..., 'lng': ...} or None.
+
+        Returns:
+            Location: The normalized location.
+        """
+        coordinates = data.get('coordinates') or {}
+        return cls(
+            url=data.get('url', ""),
+            title=data.get('title', ""),
+            lat=coordinates.get('lat') if isinstance(coordinates, dict) else None,
+            lng=coordinates.get('lng') if isinstance(coordinates, dict) else None,
+            address=data.get('address', ""),
+            description=data.get('description', ""),
+            images=data.get('images') or (),
+            translated_title=data.get('translated_title', ""),
+            translated_address=data.get('translated_address', ""),
+            translated_description=data.get('translated_description', "")
+        )
+
+    @classmethod
+    def from_locator(cls, data):
+        """
+        Build a Location from a HaikyoLocator scraper dictionary.
+
+        Accepts both the scraper shape ('ja'/'en') and the Flask app shape
+        ('name_ja'/'name_en'). Coordinates are a (lat, lng) tuple or None.
+
+        Args:
+            data (dict): HaikyoLocator location dictionary.
+
+        Returns:
+            Location: The normalized location.
+        """
+        coordinates = data.get('coordinates') or (None, None)
+        image_url = data.get('image_url')
+        return cls(
+            url=data.get('url', ""),
+            title=data.get('ja') or data.get('name_ja', ""),
+            translated_title=data.get('en') or data.get('name_en', ""),
+            lat=coordinates[0],
+            lng=coordinates[1],
+            images=(image_url,) if image_url else ()
+        )
+
+    @classmethod
+    def from_scanner(cls, data):
+        """
+        Build a Location from a HaikyoScanner scraper dictionary.
+
+        Args:
+            data (dict): Dictionary with 'name', 'latitude' and 'longitude'.
+
+        Returns:
+            Location: The normalized location.
+        """
+        image_url = data.get('image_url')
+        return cls(
+            url=data.get('url', ""),
+            title=data.get('name', ""),
+            spot_id=str(data.get('id') or ""),
+            lat=data.get('latitude'),
+            lng=data.get('longitude'),
+            address=data.get('address', ""),
+            prefecture=data.get('prefecture', ""),
+            category=data.get('category', ""),
+            description=data.get('description', ""),
+            images=(image_url,) if image_url else ()
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a Location from any of the known dictionary shapes.
+
+        Args:
+            data (dict or Location): A location in any supported shape.
+
+        Returns:
+            Location: The normalized location.
+        """
+        if isinstance(data, cls):
+            return data
+        if 'ja' in data or 'name_ja' in data:
+            return cls.from_locator(data)
+        if 'name' in data or 'latitude' in data:
+            return cls.from_scanner(data)
+        return cls.from_master(data)
+
+    def to_master(self):
+        """
+        Convert to the HaikyoMasterTool dictionary shape.
+
+        Returns:
+            dict: Location dictionary as produced by HaikyoScraper.
+        """
+        return {
+            'title': self.title,
+            'url': self.url,
+            'address': self.address,
+            'coordinates': ({'lat': self.lat, 'lng': self.lng}
+                            if self.lat is not None and self.lng is not None else None),
+            'description': self.description,
+            'images': list(self.images),
+            'translated_title': self.translated_title,
+            'translated_address': self.translated_address,
+            'translated_description': self.translated_description
+        }
+
+    def to_scanner(self):
+        """
+        Convert to the HaikyoScanner dictionary shape.
+
+        Returns:
+            dict: Location dictionary as produced by the HaikyoScanner Scraper.
+        """
+        data = {
+            'id': self.spot_id,
+            'name': self.title,
+            'image_url': self.image_url,
+            'url': self.url,
+            'description': self.description,
+            'address': self.address,
+            'prefecture': self.prefecture,
+            'category': self.category
+        }
+        if self.lat is not None and self.lng is not None:
+            data['latitude'] = self.lat
+            data['longitude'] = self.lng
+        return data
+
+    def to_locator(self):
+        """
+        Convert to the HaikyoLocator scraper dictionary shape.
+
+        Returns:
+            dict: Location dictionary as produced by HaikyoLocator.
+        """
+        return {
+            'ja': self.title,
+            'en': self.translated_title,
+            'coordinates': (self.lat, self.lng) if self.has_coordinates else None,
+            'image_url': self.image_url or None,
+            'url': self.url
+        }
+
+
+_STRING_COLUMNS = tuple(f.name for f in fields(Location) if f.name not in ('lat', 'lng', 'images'))
+
+
+class LocationBatch:
+    """
+    Columnar container for many locations.
+
+    Each field is stored in its own column: coordinates in ``array('d')``
+    (NaN marks a missing value) and strings in plain lists, which avoids
+    the per-record dictionary overhead when holding large archives.
+    """
+
+    def __init__(self, locations=None):
+        """
+        Initialize the batch.
+
+        Args:
+            locations (iterable, optional): Locations or location dictionaries to add.
+        """
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.images = []
+        for name in _STRING_COLUMNS:
+            setattr(self, name, [])
+        if locations:
+            self.extend(locations)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        lat = self.lats[index]
+        lng = self.lngs[index]
+        values = {name: getattr(self, name)[index] for name in _STRING_COLUMNS}
+        return Location(
+            lat=None if math.isnan(lat) else lat,
+            lng=None if math.isnan(lng) else lng,
+            images=self.images[index],
+            **values
+        )
+
+    def __setitem__(self, index, location):
+        location = Location.from_dict(location)
+        self.lats[index] = math.nan if location.lat is None else location.lat
+        self.lngs[index] = math.nan if location.lng is None else location.lng
+        self.images[index] = location.images
+        for name in _STRING_COLUMNS:
+            getattr(self, name)[index] = getattr(location, name)
+
+    def append(self, location):
+        """
+        Append a location to the batch.
+
+        Args:
+            location (Location or dict): The location to add.
+        """
+        location = Location.from_dict(location)
+        self.lats.append(math.nan if location.lat is None else location.lat)
+        self.lngs.append(math.nan if location.lng is None else location.lng)
+        self.images.append(location.images)
+        for name in _STRING_COLUMNS:
+            getattr(self, name).append(getattr(location, name))
+
+    def extend(self, locations):
+        """
+        Append several locations to the batch.
+
+        Args:
+            locations (iterable): Locations or location dictionaries to add.
+        """
+        for location in locations:
+            self.append(location)
+
+    def indices_with_coordinates(self):
+        """
+        Get the indices of locations with usable coordinates.
+
+        Returns:
+            list: Indices into the batch.
+        """
+        return [i for i, (lat, lng) in enumerate(zip(self.lats, self.lngs))
+                if not math.isnan(lat) and not math.isnan(lng) and (lat != 0 or lng != 0)]
+
+    def take(self, indices):
+        """
+        Create a new batch containing only the given rows.
+
+        Args:
+            indices (iterable): Row indices to copy.
+
+        Returns:
+            LocationBatch: The new batch.
+        """
+        batch = LocationBatch()
+        for i in indices:
+            batch.lats.append(self.lats[i])
+            batch.lngs.append(self.lngs[i])
+            batch.images.append(self.images[i])
+            for name in _STRING_COLUMNS:
+                getattr(batch, name).append(getattr(self, name)[i])
+        return batch
+
+    def filter(self, prefecture=None, category=None, with_coordinates=False):
+        """
+        Filter the batch by prefecture, category and coordinate availability.
+
+        Args:
+            prefecture (str, optional): Only keep locations in this prefecture.
+            category (str, optional): Only keep locations in this category.
+            with_coordinates (bool): Only keep locations with usable coordinates.
+
+        Returns:
+            LocationBatch: A new batch with the matching rows.
+        """
+        indices = self.indices_with_coordinates() if with_coordinates else range(len(self))
+        if prefecture:
+            indices = [i for i in indices if self.prefecture[i] == prefecture]
+        if category:
+            indices = [i for i in indices if self.category[i] == category]
+        return self.take(indices)
+
+    def bounds(self):
+        """
+        Get the bounding box of all locations with coordinates.
+
+        Returns:
+            tuple: (south, west, north, east), or None if no location has coordinates.
+        """
+        indices = self.indices_with_coordinates()
+        if not indices:
+            return None
+        lats = [self.lats[i] for i in indices]
+        lngs = [self.lngs[i] for i in indices]
+        return (min(lats), min(lngs), max(lats), max(lngs))
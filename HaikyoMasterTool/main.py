@@ -4,9 +4,16 @@ This application scrapes abandoned location data from haikyo.info and
 generates KML files for mapping.
 
 This version uses a Flask web interface to make it compatible with Replit.
+With --production it is served by several gunicorn worker processes that
+share their state through HAIKYO_STATE (see serving and state_store).
 """
 
-from app import app
+import serving
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    args = serving.parse_args(description="Haikyo Locator web app")
+    if args.production:
+        serving.serve('app:app', args.host, args.port, args.workers)
+    else:
+        from app import app
+        app.run(host=args.host, port=args.port, debug=args.debug)
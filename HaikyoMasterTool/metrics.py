@@ -0,0 +1,282 @@
+"""
+Module for in-process metrics in the Prometheus text format.
+
+Pipeline stages record their latency in histograms, caches count hits
+and misses, and background jobs are tracked in a gauge. The Flask app
+exposes everything at /metrics.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+import tracing
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, from cache hits to slow remote calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    """Escape a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    """Format a label set, e.g. {stage="fetch",le="0.5"}."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    """Format a sample value."""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class for metrics with a fixed set of label names."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+    def render(self):
+        """
+        Render the metric in the text format.
+
+        Returns:
+            list: Output lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """
+        Increase the counter.
+
+        Args:
+            *labels: Label values, in the order of the label names.
+            amount (float): Amount to add.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        """Increase the gauge."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        """Decrease the gauge."""
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        """Set the gauge."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        """
+        Record an observation.
+
+        Args:
+            value (float): The observed value, e.g. seconds.
+            *labels: Label values, in the order of the label names.
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def totals(self):
+        """
+        Get the number and sum of observations per label set.
+
+        Returns:
+            dict: Label values tuple -> (count, sum).
+        """
+        with self._lock:
+            return {labels: (state[2], state[1]) for labels, state in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create (or get) a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Create (or get) a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create (or get) a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        with self._lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the whole process
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'haikyo_stage_duration_seconds', 'Time spent in each pipeline stage.', ['stage'])
+STAGE_FAILURES = registry.counter(
+    'haikyo_stage_failures_total', 'Pipeline stage calls that raised an exception.', ['stage'])
+CACHE_LOOKUPS = registry.counter(
+    'haikyo_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result'])
+COORDINATE_METHODS = registry.counter(
+    'haikyo_coordinate_method_total', 'Coordinate extraction method that produced the result.', ['method'])
+JOBS_IN_FLIGHT = registry.gauge(
+    'haikyo_jobs_in_flight', 'Background jobs currently running.', ['job'])
+JOBS_TOTAL = registry.counter(
+    'haikyo_jobs_total', 'Background jobs started.', ['job'])
+
+
+@contextmanager
+def timed(stage):
+    """
+    Time a pipeline stage; exceptions are counted as failures and re-raised.
+
+    The stage is also added as a span to the trace being recorded, if any.
+
+    Args:
+        stage (str): Stage name, e.g. 'fetch', 'parse', 'translate'.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.inc(stage)
+        raise
+    finally:
+        ended = time.perf_counter()
+        STAGE_SECONDS.observe(ended - started, stage)
+        tracing.add_span(stage, started, ended)
+
+
+@contextmanager
+def job(kind):
+    """
+    Track a running background job. Also usable as a function decorator.
+
+    Args:
+        kind (str): Job kind, e.g. 'search' or 'scrape'.
+    """
+    JOBS_TOTAL.inc(kind)
+    JOBS_IN_FLIGHT.inc(kind)
+    try:
+        yield
+    finally:
+        JOBS_IN_FLIGHT.dec(kind)
+
+
+def cache_lookup(cache, hit):
+    """
+    Count a cache lookup.
+
+    Args:
+        cache (str): Cache name.
+        hit (bool): Whether the lookup was a hit.
+    """
+    CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss')
+
+
+def coordinate_method(method):
+    """
+    Count the coordinate extraction method that found a location's coordinates.
+
+    Args:
+        method (str): Method name, or 'none' if nothing was found.
+    """
+    COORDINATE_METHODS.inc(method)
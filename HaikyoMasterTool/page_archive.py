@@ -0,0 +1,384 @@
+"""
+Module for archiving fetched pages and re-extracting them offline.
+
+Every fetched spot page can be stored in a compressed, content-addressed
+SQLite archive: identical pages are kept once, and an index records which
+URL returned which content when. Spot pages share most of their markup,
+so after the first pages the archive trains a compression dictionary from
+them; later pages compress against it to a fraction of their size.
+
+When an extractor improves, replay() runs the current parse_location_page
+over the archived pages across all CPU cores instead of crawling the site
+again:
+
+    python cli.py --replay pages.db -o spots.geojson
+
+zstandard is used when it is installed (with a trained zstd dictionary),
+otherwise zlib with a preset dictionary built from the most common lines.
+zstandard is not a dependency of the app, so zlib is what ships; install
+it (pip install zstandard) for smaller archives.
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from utils import logger
+
+try:
+    import zstandard
+except ImportError:
+    # zstandard is optional; without it pages are compressed with zlib
+    zstandard = None
+
+# Pages stored before a compression dictionary is trained from them
+TRAIN_AFTER = 100
+
+# Dictionary size; zlib only uses the last 32 KB of a preset dictionary
+ZSTD_DICTIONARY_SIZE = 112 * 1024
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+
+# Pages handed to a replay worker at a time
+REPLAY_CHUNK_SIZE = 100
+
+# Chunks queued per replay worker, so a consumer that stops early leaves little work behind
+REPLAY_CHUNKS_PER_WORKER = 2
+
+
+def page_digest(content):
+    """
+    Content address of a page.
+
+    Args:
+        content (bytes): The raw page.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def train_zlib_dictionary(samples, size=ZLIB_DICTIONARY_SIZE):
+    """
+    Build a zlib preset dictionary from the lines most pages share.
+
+    Lines found in at least half of the samples are kept, the most common
+    last, since zlib matches best against the end of the dictionary.
+
+    Args:
+        samples (list): Raw pages.
+        size (int): Maximum dictionary size in bytes.
+
+    Returns:
+        bytes: The dictionary (empty if the samples share nothing).
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line.strip() for line in sample.splitlines() if len(line.strip()) > 8))
+    common = [line for line, count in counts.most_common() if count * 2 >= len(samples)]
+    dictionary = b""
+    for line in common:
+        if len(dictionary) + len(line) + 1 > size:
+            break
+        dictionary = line + b"\n" + dictionary
+    return dictionary
+
+
+class PageArchive:
+    """
+    Thread-safe, compressed, content-addressed store of fetched pages.
+    """
+
+    def __init__(self, path, codec=None, train_after=TRAIN_AFTER):
+        """
+        Open (and create if needed) the archive.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            codec (str, optional): 'zstd' or 'zlib' for new pages; defaults
+                to zstd when zstandard is installed.
+            train_after (int): Pages to collect before training a dictionary;
+                0 disables dictionaries.
+        """
+        if codec == 'zstd' and zstandard is None:
+            raise RuntimeError("The zstd codec needs the zstandard package")
+        self.path = path
+        self.codec = codec or ('zstd' if zstandard is not None else 'zlib')
+        self.train_after = train_after
+        self._lock = threading.Lock()
+        self._samples = []
+        self._dictionaries = {}
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dictionaries (
+                id INTEGER PRIMARY KEY,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                dictionary INTEGER,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fetches (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                fetched REAL NOT NULL,
+                status INTEGER NOT NULL,
+                digest TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS fetches_url ON fetches (url, fetched);
+            CREATE INDEX IF NOT EXISTS fetches_fetched ON fetches (fetched);
+        """)
+        self.conn.commit()
+        row = self.conn.execute('SELECT id FROM dictionaries WHERE codec = ? ORDER BY id DESC LIMIT 1',
+                                (self.codec,)).fetchone()
+        self._current = row[0] if row else None
+
+    def _dictionary(self, dictionary_id):
+        """Load a dictionary by id (cached)."""
+        if dictionary_id not in self._dictionaries:
+            row = self.conn.execute('SELECT data FROM dictionaries WHERE id = ?',
+                                    (dictionary_id,)).fetchone()
+            self._dictionaries[dictionary_id] = bytes(row[0])
+        return self._dictionaries[dictionary_id]
+
+    def _compress(self, content):
+        """Compress a page with the current codec and dictionary."""
+        dictionary = self._dictionary(self._current) if self._current is not None else None
+        if self.codec == 'zstd':
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=10, dict_data=dict_data).compress(content)
+        if dictionary:
+            compressor = zlib.compressobj(9, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(9)
+        return compressor.compress(content) + compressor.flush()
+
+    def _decompress(self, codec, dictionary_id, data):
+        """Decompress a stored page."""
+        dictionary = self._dictionary(dictionary_id) if dictionary_id is not None else None
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("This archive holds zstd pages; install zstandard to read them")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def _train(self):
+        """Train a dictionary from the collected samples and use it for new pages."""
+        samples, self._samples = self._samples, []
+        try:
+            if self.codec == 'zstd':
+                dictionary = zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+            else:
+                dictionary = train_zlib_dictionary(samples)
+        except Exception as e:
+            # Too few or too similar samples; keep compressing without a dictionary
+            logger.warning("Could not train a page dictionary: %s", e)
+            return
+        if not dictionary:
+            return
+        with self.conn:
+            self._current = self.conn.execute(
+                'INSERT INTO dictionaries (codec, data, created) VALUES (?, ?, ?)',
+                (self.codec, dictionary, time.time())).lastrowid
+        self._dictionaries[self._current] = dictionary
+
+    def put(self, url, content, status=200, fetched=None):
+        """
+        Archive a fetched page.
+
+        Args:
+            url (str): The page URL.
+            content (bytes or str): The page; str is stored as UTF-8.
+            status (int): HTTP status of the response.
+            fetched (float, optional): Fetch time; defaults to now.
+
+        Returns:
+            str: The page's digest.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = page_digest(content)
+        with self._lock, self.conn:
+            known = self.conn.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if not known:
+                if self._current is None and self.train_after:
+                    self._samples.append(content)
+                    if len(self._samples) >= self.train_after:
+                        self._train()
+                self.conn.execute(
+                    'INSERT INTO blobs (digest, codec, dictionary, size, data) VALUES (?, ?, ?, ?, ?)',
+                    (digest, self.codec, self._current, len(content), self._compress(content)))
+            self.conn.execute('INSERT INTO fetches (url, fetched, status, digest) VALUES (?, ?, ?, ?)',
+                              (url, fetched or time.time(), status, digest))
+        return digest
+
+    def get(self, digest):
+        """
+        Get a page by its digest.
+
+        Args:
+            digest (str): The page digest.
+
+        Returns:
+            bytes: The page, or None if it is not archived.
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT codec, dictionary, data FROM blobs WHERE digest = ?',
+                                    (digest,)).fetchone()
+            if row is None:
+                return None
+            return self._decompress(row[0], row[1], bytes(row[2]))
+
+    def latest(self, url):
+        """
+        Get the most recently archived version of a URL.
+
+        Args:
+            url (str): The page URL.
+
+        Returns:
+            tuple: (fetch time, status, page bytes), or None if never archived.
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT fetched, status, digest FROM fetches WHERE url = ? '
+                                    'ORDER BY fetched DESC LIMIT 1', (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], self.get(row[2])
+
+    def history(self, url):
+        """
+        List every archived fetch of a URL, oldest first.
+
+        Args:
+            url (str): The page URL.
+
+        Returns:
+            list: (fetch time, status, digest) tuples.
+        """
+        with self._lock:
+            return self.conn.execute('SELECT fetched, status, digest FROM fetches WHERE url = ? '
+                                     'ORDER BY fetched', (url,)).fetchall()
+
+    def latest_fetches(self, since=None):
+        """
+        List the latest successful fetch of every URL.
+
+        Args:
+            since (float, optional): Only URLs last fetched at or after this time.
+
+        Returns:
+            list: (url, fetch time, digest) tuples, ordered by URL.
+        """
+        with self._lock:
+            return self.conn.execute("""
+                SELECT url, MAX(fetched), digest FROM fetches
+                WHERE status < 400 GROUP BY url HAVING MAX(fetched) >= ? ORDER BY url
+            """, (since or 0,)).fetchall()
+
+    def stats(self):
+        """
+        Summarize the archive.
+
+        Returns:
+            dict: Counts of 'fetches', 'urls' and 'pages', and the 'raw_bytes'
+                and 'stored_bytes' of the distinct pages.
+        """
+        with self._lock:
+            fetches, urls = self.conn.execute('SELECT COUNT(*), COUNT(DISTINCT url) FROM fetches').fetchone()
+            pages, raw, stored = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return {'fetches': fetches, 'urls': urls, 'pages': pages, 'raw_bytes': raw, 'stored_bytes': stored}
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+
+# Per-process replay state, set up by _init_replay_worker
+_worker = {}
+
+
+def _init_replay_worker(archive_path):
+    """Open the archive and create the scraper used by a replay worker process."""
+    from scraper import HaikyoScraper
+    _worker['archive'] = PageArchive(archive_path, train_after=0)
+    _worker['scraper'] = HaikyoScraper()
+
+
+def _replay_chunk(rows):
+    """
+    Re-extract one chunk of archived pages inside a worker process.
+
+    Args:
+        rows (list): (url, fetch time, digest) tuples.
+
+    Returns:
+        list: (url, fetch time, location dictionary or None, error or None) tuples.
+    """
+    results = []
+    for url, fetched, digest in rows:
+        try:
+            html = _worker['archive'].get(digest).decode('utf-8', errors='replace')
+            data = _worker['scraper'].parse_location_page(html, url, translate=False)
+            results.append((url, fetched, data, None))
+        except Exception as e:
+            results.append((url, fetched, None, str(e)))
+    return results
+
+
+def replay(archive_path, workers=None, since=None, chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Run the current extractors over the latest archived version of every page.
+
+    Pages are parsed in a pool of worker processes, so re-extraction scales
+    with the number of CPU cores. Nothing is fetched; translation is skipped.
+
+    Args:
+        archive_path (str): Path to the archive.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        since (float, optional): Only pages last fetched at or after this time.
+        chunk_size (int): Pages handed to a worker at a time.
+
+    Yields:
+        tuple: (url, fetch time, location dictionary or None, error or None),
+            in completion order.
+    """
+    archive = PageArchive(archive_path, train_after=0)
+    try:
+        rows = archive.latest_fetches(since)
+    finally:
+        archive.close()
+    chunks = (rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size))
+    workers = workers or os.cpu_count() or 1
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_replay_worker,
+                               initargs=(archive_path,))
+    try:
+        # Chunks are submitted as results come back; closing the generator drops the rest
+        pending = {pool.submit(_replay_chunk, chunk)
+                   for chunk in itertools.islice(chunks, workers * REPLAY_CHUNKS_PER_WORKER)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.add(pool.submit(_replay_chunk, chunk))
+                yield from future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
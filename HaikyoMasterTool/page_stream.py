@@ -0,0 +1,197 @@
+"""
+Module for reading spot pages only as far as needed.
+
+A spot page carries everything parse_location_page uses (title, address,
+description, main images and an embedded map or spot_info object) well
+before its long comment and gallery sections. SpotPageWatcher is fed the
+page as it downloads and reports when every field has fully arrived, so
+the download can stop there and only that prefix is parsed.
+
+Fields are detected with cheap incremental scans: elements are found by
+class name and considered complete once their closing tag has been seen;
+coordinates by the markers _extract_coordinates reads first. A page that
+lacks one of the fields is read to the end (or to the byte limit), so the
+usual fallbacks still see the whole page.
+"""
+
+import re
+import codecs
+import functools
+
+import metrics
+
+# Hard cap on the bytes read from one page
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+
+# Bytes read per chunk
+CHUNK_SIZE = 16 * 1024
+
+# Characters re-scanned before new text, so markers split across chunks are found
+OVERLAP = 4096
+
+# Field -> class of the element that holds it
+ELEMENT_FIELDS = {
+    'title': 'spot_title',
+    'address': 'spot_address',
+    'description': 'spot_descr',
+    'images': 'spot_image',
+}
+
+# Markers of the coordinate sources that _extract_coordinates tries first
+COORDINATE_MARKERS = re.compile(
+    r'window\.spot_info\s*=\s*\{[^;]*?\blat\b[^;]*?\};'
+    r'|<div[^>]*\bspot_map\b[^>]*\bdata-lat="[^"]+"[^>]*>'
+    r'|<div[^>]*\bdata-lat="[^"]+"[^>]*\bspot_map\b[^>]*>'
+    r'|<iframe[^>]*\bsrc="[^"]*(?:google\.com/maps|maps\.google)[^"]*(?:!2d[\d.-]+!3d|q=[\d.-]+,)',
+    re.DOTALL)
+
+PAGE_STREAMS = metrics.registry.counter(
+    'haikyo_page_stream_total', 'Streamed spot pages by how reading ended.', ['end'])
+PAGE_STREAM_BYTES = metrics.registry.counter(
+    'haikyo_page_stream_bytes_total', 'Bytes read from streamed spot pages.')
+
+
+def _start_tag(cls):
+    """Pattern for the opening tag of an element with a class."""
+    return re.compile(r'<([a-zA-Z][\w-]*)\b[^>]*\bclass="[^"]*\b' + cls + r'\b[^"]*"[^>]*>')
+
+
+# Field -> pattern of the opening tag of its element
+START_TAGS = {field: _start_tag(cls) for field, cls in ELEMENT_FIELDS.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _nested_tags(tag):
+    """Pattern for opening and closing tags of an element name."""
+    return re.compile(r'<(/?)' + re.escape(tag) + r'\b[^>]*>', re.IGNORECASE)
+
+
+class SpotPageWatcher:
+    """
+    Tracks which fields of a spot page have arrived while it is streamed in.
+    """
+
+    def __init__(self, fields=None):
+        """
+        Initialize the watcher.
+
+        Args:
+            fields (iterable, optional): Fields to wait for; defaults to the
+                element fields plus 'coordinates'.
+        """
+        self.fields = set(fields or (*ELEMENT_FIELDS, 'coordinates'))
+        self.found = set()
+        self._chunks = []
+        self._length = 0
+        self._scanned = 0
+        # Text still to be scanned (new text, the overlap and open elements) and its offset in the page
+        self._window = ""
+        self._window_start = 0
+        # Field -> (nested tag pattern, resume position, nesting depth) once the start tag is seen
+        self._open = {}
+        self._starts = {field: START_TAGS[field] for field in self.fields if field in ELEMENT_FIELDS}
+
+    @property
+    def text(self):
+        """str: The page text fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def complete(self):
+        """bool: True once every field has arrived."""
+        return self.found >= self.fields
+
+    def feed(self, text):
+        """
+        Add the next piece of the page.
+
+        Args:
+            text (str): Decoded page text.
+
+        Returns:
+            bool: True once every field has arrived.
+        """
+        self._chunks.append(text)
+        self._length += len(text)
+        self._window += text
+        offset = self._window_start
+        start = max(0, self._scanned - OVERLAP) - offset
+        self._scanned = self._length
+
+        if 'coordinates' in self.fields and 'coordinates' not in self.found:
+            if COORDINATE_MARKERS.search(self._window, start):
+                self.found.add('coordinates')
+
+        for field, pattern in self._starts.items():
+            if field in self.found:
+                continue
+            if field not in self._open:
+                match = pattern.search(self._window, start)
+                if not match:
+                    continue
+                self._open[field] = (_nested_tags(match.group(1).lower()), offset + match.end(), 1)
+            if self._element_closed(field):
+                self.found.add(field)
+                del self._open[field]
+
+        # Drop text that no later scan will look at again
+        keep = min([self._scanned - OVERLAP] + [position for _, position, _ in self._open.values()])
+        if keep > self._window_start:
+            self._window = self._window[keep - self._window_start:]
+            self._window_start = keep
+        return self.complete
+
+    def _element_closed(self, field):
+        """Continue matching nested tags of an open element; True once it is closed."""
+        pattern, position, depth = self._open[field]
+        # Resume after the last complete tag, so a tag split across chunks is matched next time
+        offset = self._window_start
+        for match in pattern.finditer(self._window, position - offset):
+            depth += -1 if match.group(1) else 1
+            if depth == 0:
+                return True
+            position = offset + match.end()
+        self._open[field] = (pattern, position, depth)
+        return False
+
+
+def read_page(response, watcher=None, max_bytes=DEFAULT_MAX_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    Read a streamed response until the watcher is satisfied or the byte limit is hit.
+
+    Args:
+        response (requests.Response): Response opened with stream=True.
+        watcher (SpotPageWatcher, optional): Decides when to stop; defaults to
+            waiting for all spot page fields.
+        max_bytes (int): Maximum number of bytes to read.
+        chunk_size (int): Bytes read per chunk.
+
+    Returns:
+        str: The page text read, possibly only a prefix of the page.
+    """
+    watcher = watcher or SpotPageWatcher()
+    content_type = response.headers.get('content-type', '').lower()
+    # Without an explicit charset requests would assume ISO-8859-1; haikyo.info is UTF-8
+    encoding = response.encoding if 'charset=' in content_type else 'utf-8'
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+
+    received = 0
+    end = 'eof'
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received += len(chunk)
+            if watcher.feed(decoder.decode(chunk)):
+                end = 'complete'
+                break
+            if received >= max_bytes:
+                end = 'max_bytes'
+                break
+        else:
+            watcher.feed(decoder.decode(b"", final=True))
+    finally:
+        response.close()
+    PAGE_STREAMS.inc(end)
+    PAGE_STREAM_BYTES.inc(amount=received)
+    return watcher.text
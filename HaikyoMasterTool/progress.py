@@ -0,0 +1,199 @@
+"""
+Module for coalesced progress reporting.
+
+Workers report progress as often as they like; the reporter only keeps
+the latest value. Consumers (the Tk UI, the Flask progress endpoint)
+read a consistent snapshot at their own pace, so a flood of updates
+never turns into a flood of UI events.
+
+With a state store attached, the state is also published to the store
+and snapshots are read from it, so a web app served by several worker
+processes reports the same progress whichever worker is polled. Changes
+are only recorded in memory; a timer thread publishes the latest state
+at most every PUBLISH_INTERVAL seconds, so a burst of updates costs one
+store write.
+"""
+
+import time
+import threading
+from itertools import count
+
+# Pipeline stages counted by the reporter
+STAGES = ('fetched', 'parsed', 'translated', 'geocoded')
+
+# Seconds between writes of the state to the store
+PUBLISH_INTERVAL = 0.1
+
+
+class ProgressReporter:
+    """
+    Latest-value-wins progress state with per-stage counters.
+    """
+
+    def __init__(self, message="Ready", status='ready', store=None, key='progress',
+                 publish_interval=PUBLISH_INTERVAL):
+        """
+        Initialize the reporter.
+
+        Args:
+            message (str): Initial status message.
+            status (str): Initial status (ready, searching, scraping, generating).
+            store (StateStore, optional): Store the state is published to.
+            key (str): Key of the state in the store.
+            publish_interval (float): Seconds between writes to the store.
+        """
+        self._lock = threading.Lock()
+        self._ticker = count(1)
+        # (progress, message, status), replaced as a whole so readers never see a mix
+        self._latest = (0, message, status)
+        self._counters = dict.fromkeys(STAGES, 0)
+        self._version = 0
+        self.store = store
+        self.key = key
+        self.publish_interval = publish_interval
+        # Pending publish timer and monotonic time of the last publish
+        self._publish_lock = threading.Lock()
+        self._timer = None
+        self._published = float('-inf')
+
+    def _publish(self):
+        """Have the timer publish the state, unless a publish is already pending."""
+        if self.store is None:
+            return
+        with self._publish_lock:
+            if self._timer is not None:
+                return
+            delay = max(0.0, self._published + self.publish_interval - time.monotonic())
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write the latest state to the store now, with a version counted across processes."""
+        if self.store is None:
+            return
+        with self._publish_lock:
+            # Changes from here on schedule another publish
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._published = time.monotonic()
+        # Read inside the update, so the last write to the store carries the latest state
+        self.store.update(self.key, lambda saved: dict(
+            self._local_snapshot(), version=(saved or {}).get('version', 0) + 1))
+
+    def update(self, progress, message, status=None):
+        """
+        Record the latest progress. Cheap enough to call for every event.
+
+        The state is replaced under a lock that is only held for the
+        assignment, so a concurrent reset() is never undone by an update
+        that read the old status; with a store, at most a timer is started.
+
+        Args:
+            progress (float): Progress value (0-100).
+            message (str): Status message.
+            status (str, optional): New status, if it changed.
+        """
+        with self._lock:
+            self._latest = (progress, message, status or self._latest[2])
+            self._version = next(self._ticker)
+        self._publish()
+
+    def callback(self, status=None):
+        """
+        Get a (progress, message) callback for the scraper and KML generator.
+
+        Args:
+            status (str, optional): Status to set with each update.
+
+        Returns:
+            function: The callback.
+        """
+        return lambda progress, message: self.update(progress, message, status)
+
+    def increment(self, stage, amount=1):
+        """
+        Count items that completed a pipeline stage.
+
+        Args:
+            stage (str): One of STAGES.
+            amount (int): Number of items.
+        """
+        with self._lock:
+            self._counters[stage] = self._counters.get(stage, 0) + amount
+            self._version = next(self._ticker)
+        self._publish()
+
+    def reset(self, message="Ready", status='ready'):
+        """
+        Reset progress and counters for a new job.
+
+        Args:
+            message (str): Status message.
+            status (str): Status.
+        """
+        with self._lock:
+            self._latest = (0, message, status)
+            self._counters = dict.fromkeys(STAGES, 0)
+            self._version = next(self._ticker)
+        self._publish()
+
+    @property
+    def version(self):
+        """int: Increases with every change; lets consumers skip unchanged state."""
+        return self._version
+
+    def snapshot(self):
+        """
+        Get a consistent copy of the current state.
+
+        With a store, this is the state last published by any process,
+        which trails the latest changes by up to publish_interval seconds.
+
+        Returns:
+            dict: 'progress', 'message', 'status', 'stages' and 'version'.
+        """
+        if self.store is not None:
+            state = self.store.get(self.key)
+            if state is not None:
+                return state
+        return self._local_snapshot()
+
+    def _local_snapshot(self):
+        """Consistent copy of the state of this process."""
+        with self._lock:
+            version = self._version
+            progress, message, status = self._latest
+            stages = dict(self._counters)
+        return {
+            'progress': progress,
+            'message': message,
+            'status': status,
+            'stages': stages,
+            'version': version
+        }
+
+    def attach_tk(self, root, render, fps=10):
+        """
+        Render the state in a Tk UI at a fixed frame rate.
+
+        The render function runs on the Tk thread at most ``fps`` times per
+        second, and only when something changed since the last frame.
+
+        Args:
+            root (tk.Tk): The Tk root window.
+            render (function): Called with a snapshot dict.
+            fps (int): Maximum frames per second.
+        """
+        interval = max(1, int(1000 / fps))
+        last_version = [None]
+
+        def tick():
+            if self._version != last_version[0]:
+                snapshot = self.snapshot()
+                last_version[0] = snapshot['version']
+                render(snapshot)
+            root.after(interval, tick)
+
+        root.after(interval, tick)
@@ -0,0 +1,313 @@
+"""
+Module for adaptive, per-host request rate control.
+
+Each remote host gets a limiter that follows an AIMD scheme: concurrency
+grows additively while latency stays stable, and is halved (with a longer
+gap between requests) when the host answers 429/503, times out or
+fails. Retry-After headers are honored.
+
+The limits apply per process. Code that fetches from several processes
+at once (the sweep's worker pool) calls RateController.share() in each
+of them so that together they stay within one process's budget.
+"""
+
+import time
+import inspect
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Statuses that mean "slow down" rather than "this request is broken"
+THROTTLE_STATUSES = (429, 503)
+
+# Smallest gap in seconds between request starts, so a host that keeps
+# answering quickly is never hit back to back
+MIN_DELAY = 0.25
+
+# Per-host overrides. Nominatim's usage policy allows one request per second.
+DEFAULT_HOST_SETTINGS = {
+    'nominatim.openstreetmap.org': {'max_limit': 1, 'min_delay': 1.0, 'initial_delay': 1.0},
+}
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header value.
+
+    Args:
+        value (str): Either a number of seconds or an HTTP date.
+
+    Returns:
+        float: Seconds to wait, or None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """
+    AIMD concurrency and spacing limiter for a single host.
+    """
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=16, initial_delay=0.5,
+                 min_delay=MIN_DELAY, max_delay=60.0, latency_factor=2.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial_limit (int): Starting number of concurrent requests.
+            min_limit (int): Lowest concurrency after backing off.
+            max_limit (int): Highest concurrency the limiter will grow to.
+            initial_delay (float): Starting gap in seconds between request starts.
+            min_delay (float): Smallest gap between request starts.
+            max_delay (float): Largest gap between request starts.
+            latency_factor (float): Growth stops while the smoothed latency is
+                more than this multiple of the best latency seen.
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self._next_start = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free request slot.
+
+        Returns:
+            float: The monotonic start time, to be passed to release().
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                has_slot = self.in_flight < max(1, int(self.limit))
+                if has_slot and now >= self._next_start:
+                    self.in_flight += 1
+                    self._next_start = now + self.delay
+                    return now
+                self._cond.wait(self._next_start - now if has_slot else None)
+
+    def release(self, started, outcome=None, retry_after=None):
+        """
+        Release a slot and adapt the limits to the request's outcome.
+
+        Args:
+            started (float): The value returned by acquire().
+            outcome (str, optional): None for success, 'throttled' for 429/503
+                responses or 'failed' for timeouts and errors.
+            retry_after (float, optional): Seconds the host asked us to wait.
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if outcome:
+                # Multiplicative decrease
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.delay = min(self.max_delay, max(self.delay * 2, self.min_delay, MIN_DELAY))
+                wait = retry_after if retry_after is not None else self.delay
+                self._next_start = max(self._next_start, now + wait)
+            else:
+                latency = now - started
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                # Let the baseline drift up slowly so a permanently slower host can still grow
+                self.baseline = self.latency if self.baseline is None else min(self.latency, self.baseline * 1.05)
+                if self.latency <= self.baseline * self.latency_factor:
+                    # Additive increase: about one extra slot per window of successful requests
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self.delay = max(self.min_delay, self.delay * 0.9)
+            self._cond.notify_all()
+
+
+class _Slot:
+    """A request slot handed out by RateController.slot()."""
+
+    def __init__(self, started):
+        self.started = started
+        self.outcome = None
+        self.retry_after = None
+
+    def throttle(self, retry_after=None):
+        """Mark the request as throttled by the host."""
+        self.outcome = 'throttled'
+        self.retry_after = retry_after
+
+    def fail(self):
+        """Mark the request as failed."""
+        self.outcome = 'failed'
+
+
+class RateController:
+    """
+    Registry of per-host limiters shared by all outgoing requests.
+    """
+
+    def __init__(self, host_settings=None, **defaults):
+        """
+        Initialize the controller.
+
+        Args:
+            host_settings (dict, optional): Mapping of host to HostLimiter
+                keyword arguments overriding the defaults.
+            **defaults: Default HostLimiter keyword arguments.
+        """
+        self.host_settings = dict(DEFAULT_HOST_SETTINGS if host_settings is None else host_settings)
+        self.defaults = defaults
+        self.limiters = {}
+        self.processes = 1
+        self._lock = threading.Lock()
+
+    def share(self, processes):
+        """
+        Split each host's budget between several processes fetching at once.
+
+        Limiters created afterwards allow 1/processes of the concurrency and
+        keep processes times the gap between request starts.
+
+        Args:
+            processes (int): Number of processes sharing the budget.
+        """
+        with self._lock:
+            self.processes = max(1, processes)
+            self.limiters = {}
+
+    def limiter(self, host):
+        """
+        Get the limiter for a host, creating it on first use.
+
+        Args:
+            host (str): Host name, e.g. haikyo.info.
+
+        Returns:
+            HostLimiter: The host's limiter.
+        """
+        with self._lock:
+            if host not in self.limiters:
+                settings = dict(self.defaults)
+                settings.update(self.host_settings.get(host, {}))
+                self.limiters[host] = HostLimiter(**self._shared(settings))
+            return self.limiters[host]
+
+    def _shared(self, settings):
+        """Scale HostLimiter keyword arguments down to this process's share."""
+        if self.processes == 1:
+            return settings
+        shared = {name: parameter.default
+                  for name, parameter in inspect.signature(HostLimiter).parameters.items()}
+        shared.update(settings)
+        shared['max_limit'] = max(1, shared['max_limit'] // self.processes)
+        shared['min_limit'] = min(shared['min_limit'], shared['max_limit'])
+        shared['initial_limit'] = min(shared['initial_limit'], shared['max_limit'])
+        for name in ('initial_delay', 'min_delay'):
+            shared[name] = shared[name] * self.processes
+        shared['max_delay'] = max(shared['max_delay'], shared['min_delay'])
+        return shared
+
+    @contextmanager
+    def slot(self, host):
+        """
+        Hold a request slot for a host while the block runs.
+
+        An exception inside the block counts as a failed request. Call
+        ``throttle()`` or ``fail()`` on the slot to report other outcomes.
+
+        Args:
+            host (str): Host name the request goes to.
+
+        Yields:
+            _Slot: The acquired slot.
+        """
+        limiter = self.limiter(host)
+        slot = _Slot(limiter.acquire())
+        try:
+            yield slot
+        except Exception:
+            if slot.outcome is None:
+                slot.fail()
+            raise
+        finally:
+            limiter.release(slot.started, slot.outcome, slot.retry_after)
+
+    def get(self, session, url, max_retries=2, **kwargs):
+        """
+        Perform a rate-controlled GET request.
+
+        Throttled responses (429/503) are retried after the backoff, up to
+        max_retries times; the last response is returned either way.
+
+        Args:
+            session: A requests.Session (or the requests module).
+            url (str): URL to fetch.
+            max_retries (int): Retries for throttled responses.
+            **kwargs: Passed on to session.get.
+
+        Returns:
+            requests.Response: The response.
+        """
+        host = urlparse(url).netloc
+        for attempt in range(max_retries + 1):
+            with self.slot(host) as slot:
+                response = session.get(url, **kwargs)
+                if response.status_code in THROTTLE_STATUSES:
+                    slot.throttle(parse_retry_after(response.headers.get('Retry-After')))
+                elif response.status_code >= 500:
+                    slot.fail()
+            if response.status_code not in THROTTLE_STATUSES:
+                break
+        return response
+
+    @contextmanager
+    def stream(self, session, url, max_retries=2, **kwargs):
+        """
+        Perform a rate-controlled streaming GET, holding the slot while the body is read.
+
+        get() releases the slot once the headers are in, so a streamed body
+        would download outside the host's concurrency limit and its time
+        would not count towards the latency. Here the slot is held until the
+        block exits, an exception inside the block counts as a failed
+        request, and the response is closed on exit. Throttled responses are
+        retried as in get().
+
+        Args:
+            session: A requests.Session (or the requests module).
+            url (str): URL to fetch.
+            max_retries (int): Retries for throttled responses.
+            **kwargs: Passed on to session.get.
+
+        Yields:
+            requests.Response: The response, opened with stream=True.
+        """
+        host = urlparse(url).netloc
+        for attempt in range(max_retries + 1):
+            with self.slot(host) as slot:
+                response = session.get(url, stream=True, **kwargs)
+                try:
+                    if response.status_code in THROTTLE_STATUSES:
+                        slot.throttle(parse_retry_after(response.headers.get('Retry-After')))
+                        if attempt < max_retries:
+                            continue
+                    elif response.status_code >= 500:
+                        slot.fail()
+                    yield response
+                    return
+                finally:
+                    response.close()
+
+
+# Controller shared by every fetcher in the process
+rate_controller = RateController()
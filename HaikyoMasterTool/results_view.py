@@ -0,0 +1,265 @@
+"""
+Module providing a virtualized results list for the Tkinter interface.
+
+Only the rows that fit on screen exist as Treeview items; scrolling just
+rewrites their values. Worker threads hand results over through a queue
+that is drained in batches on a single ``after`` tick, and sorting and
+filtering work on the full result set in memory.
+"""
+
+import queue
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualResultsView(ttk.Frame):
+    """
+    A scrollable, sortable and filterable list that materializes only the visible rows.
+    """
+
+    def __init__(self, master, columns, formatter, key='url', rows=15, on_select=None,
+                 poll_interval=100, batch_size=500):
+        """
+        Initialize the view.
+
+        Args:
+            master: The parent widget.
+            columns (list): (column id, heading text, width) tuples.
+            formatter (function): Maps a row dict to a tuple of column values.
+            key (str): Row field that uniquely identifies a row.
+            rows (int): Number of visible rows.
+            on_select (function, optional): Called with the row dict when a row is clicked.
+            poll_interval (int): Milliseconds between queue drains.
+            batch_size (int): Maximum number of queued rows applied per drain.
+        """
+        super().__init__(master)
+        self.formatter = formatter
+        self.key = key
+        self.page_rows = rows
+        self.on_select = on_select
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+
+        # Model: every row, plus the filtered and sorted view of row indices
+        self.rows = []
+        self._positions = {}
+        self.visible = []
+        self.selected = set()
+        self.offset = 0
+        self.filter_text = ""
+        self.sort_column = None
+        self.sort_reverse = False
+        self._anchor = None
+        self._queue = queue.Queue()
+
+        column_ids = [column[0] for column in columns]
+        self.tree = ttk.Treeview(self, columns=column_ids, show="headings", selectmode="none", height=rows)
+        for column_id, heading, width in columns:
+            self.tree.heading(column_id, text=heading, command=lambda c=column_id: self.sort_by(c))
+            self.tree.column(column_id, width=width, minwidth=width // 2)
+        self.tree.tag_configure('selected', background='#cce4ff')
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.grid(column=0, row=0, sticky=(tk.N, tk.W, tk.E, tk.S))
+        self.scrollbar.grid(column=1, row=0, sticky=(tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        # The fixed pool of Treeview items that get reused while scrolling
+        self._items = [self.tree.insert('', tk.END, values=()) for _ in range(rows)]
+
+        self.tree.bind('<Button-1>', self._on_click)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-1))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(1))
+
+        self.after(self.poll_interval, self._drain)
+
+    # Thread-safe entry point
+
+    def submit(self, row):
+        """
+        Queue a row for insertion or update. Safe to call from any thread.
+
+        Args:
+            row (dict): The row; replaces an existing row with the same key.
+        """
+        self._queue.put(row)
+
+    # Model operations (main thread only)
+
+    def _drain(self):
+        """Apply queued rows in one batch and re-render once."""
+        changed = False
+        try:
+            for _ in range(self.batch_size):
+                self._upsert(self._queue.get_nowait())
+                changed = True
+        except queue.Empty:
+            pass
+
+        if changed:
+            self._apply_view(keep_offset=True)
+        self.after(self.poll_interval, self._drain)
+
+    def _upsert(self, row):
+        """Insert a row, or replace the row with the same key."""
+        key = row.get(self.key)
+        if key in self._positions:
+            self.rows[self._positions[key]] = row
+        else:
+            self._positions[key] = len(self.rows)
+            self.rows.append(row)
+
+    def _matches(self, row):
+        """Check whether a row passes the current filter."""
+        if not self.filter_text:
+            return True
+        return any(self.filter_text in str(value).lower() for value in self.formatter(row))
+
+    def _apply_view(self, keep_offset=False):
+        """Recompute the filtered and sorted row order, then render."""
+        self.visible = [i for i, row in enumerate(self.rows) if self._matches(row)]
+        if self.sort_column is not None:
+            position = list(self.tree['columns']).index(self.sort_column)
+            self.visible.sort(key=lambda i: str(self.formatter(self.rows[i])[position]).lower(),
+                              reverse=self.sort_reverse)
+        if not keep_offset:
+            self.offset = 0
+        self.offset = max(0, min(self.offset, len(self.visible) - self.page_rows))
+        self._render()
+
+    def clear(self):
+        """Remove all rows, including ones still waiting in the queue."""
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.rows = []
+        self._positions = {}
+        self.selected = set()
+        self._anchor = None
+        self._apply_view()
+
+    def set_filter(self, text):
+        """
+        Show only rows containing the text in any column.
+
+        Args:
+            text (str): Case-insensitive filter text; empty shows all rows.
+        """
+        self.filter_text = text.strip().lower()
+        self._apply_view()
+
+    def sort_by(self, column):
+        """
+        Sort by a column, toggling the direction when it is already the sort column.
+
+        Args:
+            column (str): The column id.
+        """
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self._apply_view()
+
+    def get(self, key):
+        """
+        Get a row by its key.
+
+        Args:
+            key: The row key.
+
+        Returns:
+            dict: The row, or None.
+        """
+        position = self._positions.get(key)
+        return self.rows[position] if position is not None else None
+
+    def selected_rows(self):
+        """
+        Get the selected rows in display order.
+
+        Returns:
+            list: Selected row dicts.
+        """
+        return [self.rows[i] for i in self.visible if self.rows[i].get(self.key) in self.selected]
+
+    def select_all(self):
+        """Select every row that passes the filter."""
+        self.selected = {self.rows[i].get(self.key) for i in self.visible}
+        self._render()
+
+    def select_none(self):
+        """Clear the selection."""
+        self.selected = set()
+        self._render()
+
+    # Rendering and input
+
+    def _render(self):
+        """Write the visible window of rows into the item pool."""
+        for slot, item in enumerate(self._items):
+            position = self.offset + slot
+            if position < len(self.visible):
+                row = self.rows[self.visible[position]]
+                tags = ('selected',) if row.get(self.key) in self.selected else ()
+                self.tree.item(item, values=self.formatter(row), tags=tags)
+            else:
+                self.tree.item(item, values=(), tags=())
+
+        total = len(self.visible)
+        if total > self.page_rows:
+            self.scrollbar.set(self.offset / total, (self.offset + self.page_rows) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        """
+        Scroll by a number of rows.
+
+        Args:
+            rows (int): Rows to move; negative scrolls up.
+        """
+        offset = max(0, min(self.offset + rows, len(self.visible) - self.page_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _on_scrollbar(self, *args):
+        """Handle scrollbar drags and clicks."""
+        if args[0] == 'moveto':
+            self.scroll(int(float(args[1]) * len(self.visible)) - self.offset)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            self.scroll(amount * self.page_rows if args[2] == 'pages' else amount)
+
+    def _on_click(self, event):
+        """Select rows with click, Ctrl-click (toggle) and Shift-click (range)."""
+        item = self.tree.identify_row(event.y)
+        if not item:
+            return
+        position = self.offset + self._items.index(item)
+        if position >= len(self.visible):
+            return
+
+        row = self.rows[self.visible[position]]
+        key = row.get(self.key)
+        if event.state & 0x0001 and self._anchor is not None:
+            # Shift: select the range from the anchor
+            start, end = sorted((self._anchor, position))
+            self.selected |= {self.rows[i].get(self.key) for i in self.visible[start:end + 1]}
+        elif event.state & 0x0004:
+            # Control: toggle this row
+            self.selected ^= {key}
+            self._anchor = position
+        else:
+            self.selected = {key}
+            self._anchor = position
+        self._render()
+
+        if self.on_select:
+            self.on_select(row)
@@ -4,11 +4,42 @@ Includes functionality to translate Japanese content to English.
 """
 
 import re
-import time
+import copy
+import threading
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
-from googletrans import Translator
+
+import metrics
+import tracing
+import page_stream
+from rate_control import rate_controller
+from singleflight import SingleFlight
+from search_cache import SearchCache
+from negative_cache import content_digest
+from utils import extract_spot_id, logger
+
+# Hard-coded coordinates for specific URLs for testing
+# This is a temporary solution to ensure KML generation works
+# In production, this would be replaced with more robust scraping logic
+HARDCODED_COORDINATES = {
+    "https://haikyo.info/s/3.html": {"lat": 34.72765861846603, "lng": 135.2125158181136},
+}
+
+def make_soup(html):
+    """
+    Parse HTML with BeautifulSoup.
+    
+    bs4 is imported on first use so that importing this module stays cheap.
+    
+    Args:
+        html (str): The HTML to parse.
+        
+    Returns:
+        BeautifulSoup: The parsed document.
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser')
 
 class HaikyoScraper:
     """
@@ -27,70 +58,181 @@ class HaikyoScraper:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
-        # Initialize translator for Japanese to English translation
-        self.translator = Translator()
+        # Japanese to English translator, created on first use (see translator)
+        self._translator = None
+        self._translator_lock = threading.Lock()
+        # Adaptive per-host throttling shared with every other fetcher in the process
+        self.rate_controller = rate_controller
+        # Optional ProgressReporter that counts pages through each pipeline stage
+        self.reporter = None
+        # Optional NegativeCache of pages known to have no coordinates
+        self.negative_cache = None
+        # Normalized search term -> ordered spot ids of all result pages
+        self.search_cache = SearchCache(ttl=3600, name='search')
+        # Result pages fetched at once; the rate controller still paces the host
+        self.search_workers = 8
+        # Spot pages are streamed and only read until every field has arrived
+        self.stream_pages = True
+        self.max_page_bytes = page_stream.DEFAULT_MAX_BYTES
+        # Optional PageArchive that keeps every fetched spot page for offline re-extraction
+        self.archive = None
+        # Concurrent jobs asking for the same spot, page or text share one call
+        self.detail_flights = SingleFlight('details')
+        self.page_flights = SingleFlight('page')
+        self.translate_flights = SingleFlight('translate')
+
+    @property
+    def translator(self):
+        """The googletrans Translator, imported and created on first use."""
+        if self._translator is None:
+            with self._translator_lock:
+                if self._translator is None:
+                    from googletrans import Translator
+                    self._translator = Translator()
+        return self._translator
+
+    @translator.setter
+    def translator(self, translator):
+        self._translator = translator
+
+    def _count_stage(self, stage):
+        """Count one item through a pipeline stage if a reporter is attached."""
+        if self.reporter is not None:
+            self.reporter.increment(stage)
 
-    def search_locations(self, search_term="", callback=None):
+    def fetch(self, url, timeout=30):
+        """
+        Fetch a URL through the adaptive rate controller.
+        
+        Args:
+            url (str): The URL to fetch.
+            timeout (int): Request timeout in seconds.
+            
+        Returns:
+            requests.Response: The response (not checked for errors).
+        """
+        with metrics.timed('fetch'):
+            return self.rate_controller.get(self.session, url, timeout=timeout)
+
+    def fetch_spot_page(self, url, timeout=30):
+        """
+        Fetch a spot page, reading it only as far as parse_location_page needs.
+        
+        With stream_pages set, the body is streamed and the download stops
+        once the title, address, description, images and coordinates have
+        arrived, or after max_page_bytes; the rest of the page (comments,
+        related spots) is never transferred or parsed. With an archive
+        attached, whole pages are fetched and archived instead, so later
+        extractors can use any part of them. Concurrent fetches of the same
+        URL share one download.
+        
+        Args:
+            url (str): The spot page URL.
+            timeout (int): Request timeout in seconds.
+            
+        Returns:
+            tuple: (response, html); html is empty for error responses, so
+                check response.status_code or call raise_for_status() first.
+        """
+        return self.page_flights.do(url, self._fetch_spot_page, url, timeout)
+
+    def _fetch_spot_page(self, url, timeout):
+        """Fetch a spot page; see fetch_spot_page()."""
+        if not self.stream_pages or self.archive is not None:
+            response = self.fetch(url, timeout=timeout)
+            if self.archive is not None and response.status_code < 400:
+                self.archive.put(url, response.content, response.status_code)
+            return response, response.text
+        # The host's slot is held until the page has been read
+        with metrics.timed('fetch'), self.rate_controller.stream(self.session, url, timeout=timeout) as response:
+            if response.status_code >= 400:
+                return response, ""
+            return response, page_stream.read_page(response, max_bytes=self.max_page_bytes)
+
+    def search_locations(self, search_term="", callback=None, max_pages=None, use_cache=True):
         """
         Search for abandoned locations based on the given search term.
         
+        The first result page tells how many pages there are; the remaining
+        pages are then fetched concurrently. Results are cached per
+        normalized search term and page limit, but only when every result
+        page was fetched, so a failed page is retried by the next search.
+        
         Args:
             search_term (str): The search term to look for.
             callback (function, optional): Callback function for progress updates.
+            max_pages (int, optional): Maximum number of result pages to fetch.
+            use_cache (bool): Whether to answer from the search cache.
             
         Returns:
             list: A list of location URLs found in the search results.
         """
+        # A search cut short by max_pages has its own entry
+        cache_key = f"{search_term}\npages={max_pages}" if max_pages else search_term
+        if use_cache:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                if callback:
+                    callback(100, f"Found {len(cached)} locations (cached)")
+                return [self.spot_url(entry) if entry.isdigit() else entry for entry in cached]
+        
         search_url = f"{self.base_url}/search.php?sw={search_term}"
         try:
             if callback:
                 callback(10, f"Searching for '{search_term}'...")
                 
-            response = self.session.get(search_url, timeout=30)
+            response = self.fetch(search_url)
             response.raise_for_status()
             
             if callback:
                 callback(30, f"Processing search results...")
                 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            location_links = []
-            
-            # Find all location entries in the search results
-            # The site uses div.list_line elements containing list_title divs with anchors
-            results = soup.select('div.list_line')
-            
-            total_results = len(results)
-            
-            if callback:
-                callback(50, f"Found {total_results} results, extracting links...")
-            
-            for i, result in enumerate(results):
-                # Find the link to the location page in the list_title div
-                link_element = result.select_one('div.list_title a')
-                if link_element and 'href' in link_element.attrs:
-                    link = link_element['href']
-                    # Handle both relative and absolute URLs
-                    if isinstance(link, str):
-                        full_url = urljoin(self.base_url, link)
-                        location_links.append(full_url)
-                
-                # Update progress
+            soup = make_soup(response.text)
+            pages = [self._parse_search_page(soup)]
+            failed_pages = 0
+            
+            # Fetch the remaining result pages concurrently
+            page_count = self._count_search_pages(soup)
+            if max_pages:
+                page_count = min(page_count, max_pages)
+            if page_count > 1:
                 if callback:
-                    progress = 50 + ((i + 1) / total_results * 50)  # Scale from 50-100%
-                    callback(progress, f"Found {i + 1} of {total_results} locations")
-            
-            # If no locations found with the primary method, try a fallback
-            if not location_links:
-                # Fallback: look for any links that match the pattern /s/*.html
-                all_links = soup.select('a[href*="/s/"]')
-                for link in all_links:
-                    if 'href' in link.attrs:
-                        href = link['href']
-                        if isinstance(href, str) and '/s/' in href and href.endswith('.html'):
-                            full_url = urljoin(self.base_url, href)
-                            if full_url not in location_links:
-                                location_links.append(full_url)
+                    callback(50, f"Fetching {page_count - 1} more result pages...")
+                page_urls = [f"{search_url}&page={page}" for page in range(2, page_count + 1)]
+                with ThreadPoolExecutor(max_workers=self.search_workers) as pool:
+                    results = pool.map(tracing.propagate(self._fetch_search_page), page_urls)
+                    for i, (links, error) in enumerate(results):
+                        progress = 50 + ((i + 1) / len(page_urls) * 50)  # Scale from 50-100%
+                        if error is not None:
+                            failed_pages += 1
+                            if callback:
+                                callback(progress, f"Error fetching result page {i + 2}: {error}")
+                            else:
+                                logger.warning("Error fetching search page %s: %s", page_urls[i], error)
+                            continue
+                        pages.append(links)
+                        if callback:
+                            callback(progress, f"Fetched result page {i + 2} of {page_count}")
+            
+            # Merge the pages in order, dropping duplicates
+            location_links = list(dict.fromkeys(link for links in pages for link in links))
             
+            if callback:
+                message = f"Found {len(location_links)} locations"
+                if failed_pages:
+                    message += f" ({failed_pages} result pages failed)"
+                callback(100, message)
+            
+            # Incomplete results are not cached, so the next search fetches the missing pages
+            if failed_pages:
+                return location_links
+            
+            # Cache spot pages by id to keep entries small
+            cached = []
+            for link in location_links:
+                spot_id = extract_spot_id(link)
+                cached.append(spot_id if spot_id and self.spot_url(spot_id) == link else link)
+            self.search_cache.put(cache_key, cached)
             return location_links
         
         except requests.RequestException as e:
@@ -98,10 +240,99 @@ class HaikyoScraper:
                 callback(0, f"Error searching locations: {str(e)}")
             return []
 
+    def _fetch_search_page(self, url):
+        """
+        Fetch one search result page and extract its location links.
+        
+        Args:
+            url (str): The URL of the result page.
+            
+        Returns:
+            tuple: (location URLs on the page, None), or (None, error message)
+                if the page failed.
+        """
+        try:
+            response = self.fetch(url)
+            response.raise_for_status()
+            return self._parse_search_page(make_soup(response.text)), None
+        except requests.RequestException as e:
+            return None, str(e)
+
+    def _count_search_pages(self, soup):
+        """
+        Get the number of result pages from the pagination links.
+        
+        Args:
+            soup (BeautifulSoup): The parsed first result page.
+            
+        Returns:
+            int: The number of pages (1 if there is no pagination).
+        """
+        page_count = 1
+        for link in soup.select('ul.pagination a[href]'):
+            match = re.search(r'[?&]page=(\d+)', link['href'])
+            if match:
+                page_count = max(page_count, int(match.group(1)))
+        return page_count
+
+    def _parse_search_page(self, soup):
+        """
+        Extract the location links from a search result page.
+        
+        Args:
+            soup (BeautifulSoup): The parsed result page.
+            
+        Returns:
+            list: Location URLs in page order.
+        """
+        location_links = []
+        
+        # Find all location entries in the search results
+        # The site uses div.list_line elements containing list_title divs with anchors
+        for result in soup.select('div.list_line'):
+            # Find the link to the location page in the list_title div
+            link_element = result.select_one('div.list_title a')
+            if link_element and 'href' in link_element.attrs:
+                link = link_element['href']
+                # Handle both relative and absolute URLs
+                if isinstance(link, str):
+                    full_url = urljoin(self.base_url, link)
+                    location_links.append(full_url)
+        
+        # If no locations found with the primary method, try a fallback
+        if not location_links:
+            # Fallback: look for any links that match the pattern /s/*.html
+            all_links = soup.select('a[href*="/s/"]')
+            for link in all_links:
+                if 'href' in link.attrs:
+                    href = link['href']
+                    if isinstance(href, str) and '/s/' in href and href.endswith('.html'):
+                        full_url = urljoin(self.base_url, href)
+                        if full_url not in location_links:
+                            location_links.append(full_url)
+        
+        return location_links
+
+    def spot_url(self, spot_id):
+        """
+        Build the URL of a spot detail page from its numeric id.
+        
+        Args:
+            spot_id (int or str): The haikyo.info spot id.
+            
+        Returns:
+            str: The spot page URL.
+        """
+        return f"{self.base_url}/s/{spot_id}.html"
+
     def scrape_location_details(self, url, callback=None):
         """
         Scrape details for a specific location.
         
+        If the same location is already being scraped (e.g. by another
+        user's job), this waits for that scrape and returns a copy of its
+        result; only the caller that started it gets progress callbacks.
+        
         Args:
             url (str): The URL of the location page.
             callback (function, optional): Callback function for progress updates.
@@ -109,101 +340,139 @@ class HaikyoScraper:
         Returns:
             dict: A dictionary containing location details.
         """
-        # Hard-coded coordinates for specific URLs for testing
-        # This is a temporary solution to ensure KML generation works
-        # In production, this would be replaced with more robust scraping logic
-        hardcoded_coords = {
-            "https://haikyo.info/s/3.html": {"lat": 34.72765861846603, "lng": 135.2125158181136},
-        }
-        
-        if url in hardcoded_coords:
-            print(f"Using hardcoded coordinates for {url}: {hardcoded_coords[url]}")
+        with tracing.span('scrape_location_details', url=url):
+            details = self.detail_flights.do(url, self._scrape_location_details, url, callback)
+        # Every caller gets its own copy to modify
+        return copy.deepcopy(details)
+
+    def _scrape_location_details(self, url, callback=None):
+        """Scrape details for a specific location; see scrape_location_details()."""
+        if url in HARDCODED_COORDINATES:
+            print(f"Using hardcoded coordinates for {url}: {HARDCODED_COORDINATES[url]}")
             # We'll still scrape other details, but use the hardcoded coordinates
         try:
             if callback:
                 callback(10, f"Fetching location details from {url}...")
                 
-            response = self.session.get(url, timeout=30)
+            response, html = self.fetch_spot_page(url)
             response.raise_for_status()
+            self._count_stage('fetched')
             
             if callback:
                 callback(30, f"Processing location page...")
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract basic location information
-            # Try multiple selectors for the title to handle different formats
-            title_element = soup.select_one('h1.spot_title') or soup.select_one('h1') or soup.select_one('h2') or soup.select_one('title')
-            title = title_element.text.strip() if title_element else url.split('/')[-1].replace('.html', '').replace('-', ' ').title()
-            
-            # Clean up the title if needed
-            title = re.sub(r'\s*- 廃墟検索地図.*$', '', title, flags=re.IGNORECASE)
             
+            return self.parse_location_page(html, url, callback)
+        
+        except requests.RequestException as e:
             if callback:
-                callback(50, f"Extracting coordinates and details for '{title}'...")
-            
-            # Extract address
-            address = ""
-            address_element = soup.select_one('div.spot_address') or soup.select_one('span.spot_address')
-            if address_element:
-                address = address_element.text.strip()
-            
-            # Extract coordinates from the page
-            coordinates = self._extract_coordinates(soup, url)
-            
-            # Extract description - look for main content
-            description = ""
-            
-            # Try to find the spot_descr or spot_body div
-            content_divs = soup.select('div.spot_descr') or soup.select('div.spot_body') or soup.select('div.body') or soup.select('div.content') or soup.select('div#main')
-            if content_divs:
-                description = content_divs[0].get_text(strip=True)
-            else:
-                # Fallback: get all text from the page
-                description = soup.get_text(strip=True)
-                # Remove common header/footer text if present
-                description = re.sub(r'(メニュー|ホーム|検索|ログイン|新規登録|サイトマップ|著作権|privacy policy)', '', description, flags=re.IGNORECASE)
-            
-            # Limit description length for KML size constraints
-            if len(description) > 1000:
-                description = description[:997] + "..."
-            
-            # Extract images if available
-            images = []
+                callback(0, f"Error scraping location details: {str(e)}")
+            return {
+                'title': "Error",
+                'url': url,
+                'address': "",
+                'coordinates': {'lat': 0, 'lng': 0},
+                'description': f"Error scraping details: {str(e)}",
+                'images': [],
+                'translated_title': "Error",
+                'translated_address': "",
+                'translated_description': f"Error scraping details: {str(e)}"
+            }
+
+    def parse_location_page(self, html, url, callback=None, translate=True):
+        """
+        Extract location details from an already fetched location page.
+        
+        Args:
+            html (str): The HTML of the location page.
+            url (str): The URL the page was fetched from.
+            callback (function, optional): Callback function for progress updates.
+            translate (bool): Whether to translate the title, address and description.
             
-            # First try to get main spot images
-            main_images = soup.select('div.spot_image v-lazy-image') or soup.select('div.spot_image img')
-            for img in main_images:
+        Returns:
+            dict: A dictionary containing location details.
+        """
+        with metrics.timed('parse'):
+            soup = make_soup(html)
+        
+        # Extract basic location information
+        # Try multiple selectors for the title to handle different formats
+        title_element = soup.select_one('h1.spot_title') or soup.select_one('h1') or soup.select_one('h2') or soup.select_one('title')
+        title = title_element.text.strip() if title_element else url.split('/')[-1].replace('.html', '').replace('-', ' ').title()
+        
+        # Clean up the title if needed
+        title = re.sub(r'\s*- 廃墟検索地図.*$', '', title, flags=re.IGNORECASE)
+        
+        if callback:
+            callback(50, f"Extracting coordinates and details for '{title}'...")
+        
+        # Extract address
+        address = ""
+        address_element = soup.select_one('div.spot_address') or soup.select_one('span.spot_address')
+        if address_element:
+            address = address_element.text.strip()
+        
+        # Extract coordinates from the page
+        with metrics.timed('coordinates'):
+            coordinates = self._resolve_coordinates(soup, html, url)
+        
+        # Extract description - look for main content
+        description = ""
+        
+        # Try to find the spot_descr or spot_body div
+        content_divs = soup.select('div.spot_descr') or soup.select('div.spot_body') or soup.select('div.body') or soup.select('div.content') or soup.select('div#main')
+        if content_divs:
+            description = content_divs[0].get_text(strip=True)
+        else:
+            # Fallback: get all text from the page
+            description = soup.get_text(strip=True)
+            # Remove common header/footer text if present
+            description = re.sub(r'(メニュー|ホーム|検索|ログイン|新規登録|サイトマップ|著作権|privacy policy)', '', description, flags=re.IGNORECASE)
+        
+        # Limit description length for KML size constraints
+        if len(description) > 1000:
+            description = description[:997] + "..."
+        
+        # Extract images if available
+        images = []
+        
+        # First try to get main spot images
+        main_images = soup.select('div.spot_image v-lazy-image') or soup.select('div.spot_image img')
+        for img in main_images:
+            if 'src' in img.attrs:
+                img_url = img['src']
+                if isinstance(img_url, str):
+                    if not img_url.startswith(('data:', 'http://maps.google')):
+                        if not img_url.startswith(('http://', 'https://')):
+                            img_url = urljoin(self.base_url, img_url)
+                        if img_url not in images:
+                            images.append(img_url)
+        
+        # Then try other images
+        if not images:
+            image_elements = soup.select('img[src*=".jpg"], img[src*=".png"], img[src*=".jpeg"], img[src*=".gif"]')
+            for img in image_elements:
                 if 'src' in img.attrs:
                     img_url = img['src']
                     if isinstance(img_url, str):
                         if not img_url.startswith(('data:', 'http://maps.google')):
                             if not img_url.startswith(('http://', 'https://')):
                                 img_url = urljoin(self.base_url, img_url)
-                            if img_url not in images:
+                            if img_url not in images and 'icons' not in img_url and 'logo' not in img_url:
                                 images.append(img_url)
-            
-            # Then try other images
-            if not images:
-                image_elements = soup.select('img[src*=".jpg"], img[src*=".png"], img[src*=".jpeg"], img[src*=".gif"]')
-                for img in image_elements:
-                    if 'src' in img.attrs:
-                        img_url = img['src']
-                        if isinstance(img_url, str):
-                            if not img_url.startswith(('data:', 'http://maps.google')):
-                                if not img_url.startswith(('http://', 'https://')):
-                                    img_url = urljoin(self.base_url, img_url)
-                                if img_url not in images and 'icons' not in img_url and 'logo' not in img_url:
-                                    images.append(img_url)
-            
-            if callback:
-                callback(80, f"Found {len(images)} images for '{title}'")
-            
-            # Use hardcoded coordinates if available
-            if url in hardcoded_coords:
-                coordinates = hardcoded_coords[url]
-                print(f"Using hardcoded coordinates instead of scraped ones for {url}")
-            
+        
+        if callback:
+            callback(80, f"Found {len(images)} images for '{title}'")
+        
+        # Use hardcoded coordinates if available
+        if url in HARDCODED_COORDINATES:
+            coordinates = HARDCODED_COORDINATES[url]
+            print(f"Using hardcoded coordinates instead of scraped ones for {url}")
+        
+        self._count_stage('parsed')
+        if coordinates.get('lat') or coordinates.get('lng'):
+            self._count_stage('geocoded')
+        
+        if translate:
             if callback:
                 callback(90, "Translating Japanese text to English...")
             
@@ -211,38 +480,57 @@ class HaikyoScraper:
             translated_title = self._translate_text(title)
             translated_address = self._translate_text(address) if address else ""
             translated_description = self._translate_text(description) if len(description) > 5 else ""
+            self._count_stage('translated')
+        else:
+            translated_title = title
+            translated_address = ""
+            translated_description = ""
+        
+        location_data = {
+            'title': title,
+            'url': url,
+            'address': address,
+            'coordinates': coordinates,
+            'description': description,
+            'images': images,
+            'translated_title': translated_title,
+            'translated_address': translated_address,
+            'translated_description': translated_description
+        }
+        
+        if callback:
+            callback(100, f"Scraped details for {title}")
+        
+        return location_data
+
+    def _resolve_coordinates(self, soup, html, url):
+        """
+        Extract coordinates, skipping pages already known to have none.
+        
+        With a negative cache attached, a page that yielded no coordinates is
+        remembered by spot id and content hash, and the extraction methods
+        are not run again for it until the entry expires or the page changes.
+        
+        Args:
+            soup (BeautifulSoup): The BeautifulSoup object for the page.
+            html (str): The HTML of the page.
+            url (str): The URL of the page.
             
-            location_data = {
-                'title': title,
-                'url': url,
-                'address': address,
-                'coordinates': coordinates,
-                'description': description,
-                'images': images,
-                'translated_title': translated_title,
-                'translated_address': translated_address,
-                'translated_description': translated_description
-            }
-            
-            if callback:
-                callback(100, f"Scraped details for {title}")
-            
-            return location_data
+        Returns:
+            dict: A dictionary containing lat and lng coordinates (0, 0 if none).
+        """
+        if self.negative_cache is None:
+            return self._extract_coordinates(soup, url)
         
-        except requests.RequestException as e:
-            if callback:
-                callback(0, f"Error scraping location details: {str(e)}")
-            return {
-                'title': "Error",
-                'url': url,
-                'address': "",
-                'coordinates': {'lat': 0, 'lng': 0},
-                'description': f"Error scraping details: {str(e)}",
-                'images': [],
-                'translated_title': "Error",
-                'translated_address': "",
-                'translated_description': f"Error scraping details: {str(e)}"
-            }
+        key = extract_spot_id(url) or url
+        digest = content_digest(html)
+        if self.negative_cache.is_unresolvable(key, digest):
+            return self._coordinates_found('known_unresolvable', 0, 0)
+        
+        coordinates = self._extract_coordinates(soup, url)
+        if not (coordinates['lat'] or coordinates['lng']):
+            self.negative_cache.mark_unresolvable(key, digest)
+        return coordinates
 
     def _extract_coordinates(self, soup, url):
         """
@@ -280,7 +568,7 @@ class HaikyoScraper:
                                 lat = float(spot_info['lat'])
                                 lng = float(spot_info['lng'])
                                 if lat != 0 and lng != 0:
-                                    return {'lat': lat, 'lng': lng}
+                                    return self._coordinates_found('spot_info', lat, lng)
                             except (ValueError, TypeError):
                                 pass
                 except Exception:
@@ -294,7 +582,7 @@ class HaikyoScraper:
                 lat = float(map_div.get('data-lat', '0'))
                 lng = float(map_div.get('data-lng', '0'))
                 if lat != 0 and lng != 0:
-                    return {'lat': lat, 'lng': lng}
+                    return self._coordinates_found('map_div', lat, lng)
             except (ValueError, TypeError):
                 pass
         
@@ -312,7 +600,7 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('table', lat, lng)
                         except (ValueError, TypeError):
                             pass
         
@@ -328,7 +616,7 @@ class HaikyoScraper:
                         try:
                             lng = float(coords_match.group(1))
                             lat = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('iframe', lat, lng)
                         except (ValueError, TypeError):
                             pass
                     
@@ -338,7 +626,7 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('iframe', lat, lng)
                         except (ValueError, TypeError):
                             pass
                             
@@ -348,7 +636,7 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('iframe', lat, lng)
                         except (ValueError, TypeError):
                             pass
                     
@@ -361,7 +649,7 @@ class HaikyoScraper:
                             lng = float(embed_coords_match.group(1))
                             lat = float(embed_coords_match.group(2))
                             print(f"Debug: Found embed coordinates lat={lat}, lng={lng}")
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('iframe', lat, lng)
                         except (ValueError, TypeError) as e:
                             print(f"Debug: Error parsing embed coordinates: {e}")
         
@@ -375,7 +663,7 @@ class HaikyoScraper:
             try:
                 lat = float(coords_match.group(1))
                 lng = float(coords_match.group(2))
-                return {'lat': lat, 'lng': lng}
+                return self._coordinates_found('page_text', lat, lng)
             except (ValueError, TypeError):
                 pass
                 
@@ -393,7 +681,7 @@ class HaikyoScraper:
                 
                 lat = lat_deg + (lat_min / 60) + (lat_sec / 3600)
                 lng = lng_deg + (lng_min / 60) + (lng_sec / 3600)
-                return {'lat': lat, 'lng': lng}
+                return self._coordinates_found('page_dms', lat, lng)
             except (ValueError, TypeError, IndexError):
                 pass
         
@@ -406,7 +694,7 @@ class HaikyoScraper:
                 lng = float(embed_match.group(1))
                 lat = float(embed_match.group(2))
                 print(f"Debug: Found embed coordinates in HTML: lat={lat}, lng={lng}")
-                return {'lat': lat, 'lng': lng}
+                return self._coordinates_found('html_embed', lat, lng)
             except (ValueError, TypeError) as e:
                 print(f"Debug: Error parsing embed coordinates from HTML: {e}")
         
@@ -422,7 +710,7 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('map_link', lat, lng)
                         except (ValueError, TypeError):
                             pass
                             
@@ -432,7 +720,7 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('map_link', lat, lng)
                         except (ValueError, TypeError):
                             pass
                     
@@ -442,20 +730,37 @@ class HaikyoScraper:
                         try:
                             lat = float(coords_match.group(1))
                             lng = float(coords_match.group(2))
-                            return {'lat': lat, 'lng': lng}
+                            return self._coordinates_found('map_link', lat, lng)
                         except (ValueError, TypeError):
                             pass
         
         # If no coordinates found, return default (0,0)
-        return {'lat': 0, 'lng': 0}
+        return self._coordinates_found('none', 0, 0)
+
+    def _coordinates_found(self, method, lat, lng):
+        """
+        Record which extraction method produced the coordinates.
+        
+        Args:
+            method (str): Name of the extraction method, or 'none'.
+            lat (float): Latitude.
+            lng (float): Longitude.
+            
+        Returns:
+            dict: A dictionary containing lat and lng coordinates.
+        """
+        metrics.coordinate_method(method)
+        return {'lat': lat, 'lng': lng}
 
-    def scrape_batch(self, urls, callback=None):
+    def scrape_batch(self, urls, callback=None, journal=None):
         """
         Scrape details for multiple locations.
         
         Args:
             urls (list): List of location URLs to scrape.
             callback (function, optional): Callback function for progress updates.
+            journal (CrawlJournal, optional): Journal of completed URLs. URLs already
+                in the journal are not fetched again, and new results are recorded.
             
         Returns:
             list: A list of dictionaries containing location details.
@@ -464,6 +769,10 @@ class HaikyoScraper:
         total_urls = len(urls)
         
         for i, url in enumerate(urls):
+            if journal is not None and url in journal:
+                results.append(journal.get(url))
+                continue
+            
             if callback:
                 overall_progress = (i / total_urls) * 100
                 callback(overall_progress, f"Scraping location {i+1} of {total_urls}")
@@ -477,8 +786,9 @@ class HaikyoScraper:
             location_data = self.scrape_location_details(url, location_callback)
             results.append(location_data)
             
-            # Add a small delay to be respectful to the server
-            time.sleep(1)
+            # Failed pages are left out of the journal so a resumed job retries them
+            if journal is not None and location_data['title'] != "Error":
+                journal.record(url, location_data)
         
         if callback:
             callback(100, f"Scraped {len(results)} locations")
@@ -500,7 +810,10 @@ class HaikyoScraper:
             
         try:
             # Attempt to translate
-            translated = self.translator.translate(text, src='ja', dest='en')
+            # The same text (e.g. a prefecture name) translated concurrently is sent once
+            with metrics.timed('translate'):
+                translated = self.translate_flights.do(text, self.translator.translate,
+                                                       text, src='ja', dest='en')
             if translated and hasattr(translated, 'text'):
                 return translated.text
         except Exception as e:
@@ -0,0 +1,97 @@
+"""
+Module providing a time-limited cache for search results.
+
+Search terms are normalized (Unicode width, case and whitespace) so that
+equivalent queries share an entry; entries expire after a TTL and the
+least recently used ones are evicted when the cache is full.
+"""
+
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import metrics
+
+
+def normalize_term(term):
+    """
+    Normalize a search term for use as a cache key.
+
+    Full-width and half-width forms, letter case and runs of whitespace
+    are folded, so '東京　都' and '東京 都' or 'Tokyo' and 'tokyo ' match.
+
+    Args:
+        term (str): The search term.
+
+    Returns:
+        str: The normalized term.
+    """
+    term = unicodedata.normalize('NFKC', term or "")
+    return " ".join(term.split()).lower()
+
+
+class SearchCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live.
+    """
+
+    def __init__(self, ttl=3600, max_entries=256, name='search'):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float): Seconds an entry stays valid.
+            max_entries (int): Maximum number of entries kept.
+            name (str): Cache name used in the hit/miss metrics.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, term):
+        """
+        Look up a search term.
+
+        Args:
+            term (str): The search term (normalized internally).
+
+        Returns:
+            The cached value, or None if missing or expired.
+        """
+        key = normalize_term(term)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            metrics.cache_lookup(self.name, entry is not None)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, term, value):
+        """
+        Store the result for a search term.
+
+        Args:
+            term (str): The search term (normalized internally).
+            value: The result to cache.
+        """
+        key = normalize_term(term)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
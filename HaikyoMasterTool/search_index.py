@@ -0,0 +1,689 @@
+"""
+Module providing a local full-text search index over scraped locations.
+
+Japanese text is split into character bigrams, so any substring of two or
+more characters can be found without a dictionary; Latin text (romanized
+names and the English translations) is split into lower-cased words that
+also match by prefix. Results are ranked with a saturated term-frequency
+score weighted by field and term rarity, and can be filtered by
+prefecture and category.
+
+Postings are kept as parallel arrays of doc ids and weights. Doc ids only
+grow, so the arrays stay sorted and lookups are binary searches; this
+keeps an index of a few hundred thousand spots within a modest amount of
+memory. A search walks the rarest term's postings by impact (highest
+weight first) and stops as soon as no unseen document can score higher
+than the hits it already has, so common terms cost about as much as rare
+ones. Prefix expansions are merged once and kept up to date as documents
+are added. Several processes can share one index file: each appends the
+records it adds, and loading the file again reads only what the others
+appended since.
+
+HaikyoScanner imports this module from here rather than keeping a copy.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import heapq
+import bisect
+import itertools
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+
+import file_lock
+
+# Runs of kana and kanji, and runs of Latin letters and digits
+CJK_RUN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3005\u3006]+')
+WORD = re.compile(r'[a-z0-9]+')
+
+# Relative weight of a match in each field; unknown fields count as 1
+DEFAULT_FIELD_WEIGHTS = {
+    'title': 3.0,
+    'translated_title': 3.0,
+    'address': 2.0,
+    'translated_address': 2.0,
+}
+
+# Term-frequency saturation (as in BM25's k1)
+SATURATION = 1.2
+
+# Prefix matches score a bit lower than whole-word matches
+PREFIX_WEIGHT = 0.8
+
+# Upper bound on the words a single prefix expands to
+MAX_PREFIX_EXPANSIONS = 64
+
+# Merged postings of this many prefixes are kept
+MAX_CACHED_PREFIXES = 256
+
+# Impact order is rebuilt once more than this share of postings was added since
+RESORT_FRACTION = 0.125
+
+# Combinations of weight tiers a multi-term search tries before walking postings instead
+MAX_TIER_COMBINATIONS = 512
+
+
+def tokenize(text, query=False):
+    """
+    Split text into index tokens.
+
+    Args:
+        text (str): The text to tokenize.
+        query (bool): Tokenize a search query rather than a document. Documents
+            also emit the last character of each Japanese run on its own, so
+            single-character queries can be answered by prefix.
+
+    Returns:
+        list: The tokens, in order of appearance.
+    """
+    text = unicodedata.normalize('NFKC', text or "").lower()
+    tokens = []
+    for run in CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if not query:
+            tokens.append(run[-1])
+    tokens.extend(WORD.findall(text))
+    return tokens
+
+
+def _impact(weight, idf):
+    """Score contribution of a term matching with a weighted term frequency."""
+    return idf * weight * (SATURATION + 1) / (weight + SATURATION)
+
+
+def _contains(ids, doc_id):
+    """Whether a sorted array of doc ids holds one."""
+    i = bisect.bisect_left(ids, doc_id)
+    return i < len(ids) and ids[i] == doc_id
+
+
+class _Postings:
+    """
+    Sorted doc ids and their weighted term frequencies for one token.
+
+    The entries are also kept by impact: doc ids grouped into tiers of equal
+    weight, highest first, and by doc id within a tier. This order is built
+    when first needed; entries added later form a small unsorted tail that
+    is folded into the tiers on the fly until it is worth rebuilding.
+    """
+
+    __slots__ = ('ids', 'weights', '_impact_ids', '_tiers')
+
+    def __init__(self):
+        self.ids = array('I')
+        self.weights = array('f')
+        # Doc ids by impact, and (weight, end) of each tier in them
+        self._impact_ids = array('I')
+        self._tiers = []
+
+    def append(self, doc_id, weight):
+        self.ids.append(doc_id)
+        self.weights.append(weight)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def get(self, doc_id, default=None):
+        i = bisect.bisect_left(self.ids, doc_id)
+        if i < len(self.ids) and self.ids[i] == doc_id:
+            return self.weights[i]
+        return default
+
+    def items(self):
+        return zip(self.ids, self.weights)
+
+    def tiers(self):
+        """
+        Get the entries by impact.
+
+        Returns:
+            list: (weight, doc ids in ascending order) tuples, highest weight first.
+        """
+        ids, weights = self.ids, self.weights
+        sorted_count = len(self._impact_ids)
+        if sorted_count * (1 + RESORT_FRACTION) < len(ids):
+            positions = sorted(range(len(ids)), key=weights.__getitem__, reverse=True)
+            self._impact_ids = array('I', map(ids.__getitem__, positions))
+            self._tiers = list(itertools.accumulate(sorted(Counter(weights).items(), reverse=True),
+                                                    lambda tier, count: (count[0], tier[1] + count[1])))
+            sorted_count = len(ids)
+
+        tail = {}
+        for i in range(sorted_count, len(ids)):
+            tail.setdefault(weights[i], array('I')).append(ids[i])
+        tiers = []
+        start = 0
+        for weight, end in self._tiers:
+            # Tail doc ids are newer, so they sort after the tier's
+            tiers.append((weight, self._impact_ids[start:end] + tail.pop(weight, array('I'))))
+            start = end
+        if tail:
+            tiers = sorted(tiers + list(tail.items()), reverse=True, key=lambda tier: tier[0])
+        return tiers
+
+    def by_impact(self):
+        """Iterate over (doc id, weight) pairs, highest weight first and by doc id within a weight."""
+        for weight, tier in self.tiers():
+            for doc_id in tier:
+                yield doc_id, weight
+
+
+class SearchIndex:
+    """
+    In-memory inverted index of location records.
+    """
+
+    def __init__(self, record_fields=None, field_weights=None):
+        """
+        Initialize an empty index.
+
+        Args:
+            record_fields (function, optional): Maps a record to a
+                (fields, prefecture, category) tuple; needed by add_record() and load().
+            field_weights (dict, optional): Weight per field name.
+        """
+        self.record_fields = record_fields
+        self.field_weights = dict(DEFAULT_FIELD_WEIGHTS if field_weights is None else field_weights)
+        # token -> _Postings
+        self.postings = {}
+        # Facet value -> set of doc ids
+        self.prefectures = {}
+        self.categories = {}
+        # Per-document data, indexed by doc id; replaced or removed documents
+        # stay in the postings and are skipped through the dead set
+        self.keys = []
+        self.records = []
+        self._doc_facets = []
+        self._doc_ids = {}
+        self._dead = set()
+        # Prefix lookups: sorted Latin words, and Japanese bigrams by first character
+        self._word_set = set()
+        self._words = []
+        self._bigrams = {}
+        # Query term -> (tokens it expands to, merged _Postings)
+        self._prefix_postings = {}
+        # Path -> (first line, offset read up to) of the files read so far, see load()
+        self._files = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def __contains__(self, key):
+        return key in self._doc_ids
+
+    def add(self, key, fields, prefecture="", category="", record=None):
+        """
+        Add a document, replacing any document with the same key.
+
+        Args:
+            key (str): Unique key, usually the location URL.
+            fields (dict): Field name to text.
+            prefecture (str): Prefecture used for filtering.
+            category (str): Category used for filtering.
+            record: Data returned with search hits (defaults to the key).
+        """
+        weights = {}
+        for field, text in fields.items():
+            weight = self.field_weights.get(field, 1.0)
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0.0) + weight
+
+        with self._lock:
+            self.remove(key)
+            doc_id = len(self.keys)
+            self.keys.append(key)
+            self.records.append(key if record is None else record)
+            self._doc_facets.append((prefecture or "", category or ""))
+            self._doc_ids[key] = doc_id
+
+            for token, weight in weights.items():
+                postings = self.postings.get(token)
+                if postings is None:
+                    self.postings[token] = postings = _Postings()
+                    if WORD.fullmatch(token):
+                        self._word_set.add(token)
+                    elif len(token) == 2:
+                        self._bigrams.setdefault(token[0], set()).add(token)
+                    # The token may belong to cached prefix expansions, which are rebuilt
+                    for end in range(1, len(token)):
+                        self._prefix_postings.pop(token[:end], None)
+                postings.append(doc_id, weight)
+            if self._prefix_postings:
+                self._add_to_prefixes(doc_id, weights)
+            if prefecture:
+                self.prefectures.setdefault(prefecture, set()).add(doc_id)
+            if category:
+                self.categories.setdefault(category, set()).add(doc_id)
+
+    def add_record(self, key, record):
+        """
+        Add a record, deriving its fields with record_fields.
+
+        Args:
+            key (str): Unique key, usually the location URL.
+            record: The record to index and return with hits.
+        """
+        fields, prefecture, category = self.record_fields(record)
+        self.add(key, fields, prefecture, category, record)
+
+    def remove(self, key):
+        """
+        Remove a document.
+
+        Args:
+            key (str): The document key.
+
+        Returns:
+            bool: True if the document was in the index.
+        """
+        with self._lock:
+            doc_id = self._doc_ids.pop(key, None)
+            if doc_id is None:
+                return False
+            self._dead.add(doc_id)
+            prefecture, category = self._doc_facets[doc_id]
+            self.prefectures.get(prefecture, set()).discard(doc_id)
+            self.categories.get(category, set()).discard(doc_id)
+            self.keys[doc_id] = self.records[doc_id] = None
+            return True
+
+    def _expand_prefix(self, prefix):
+        """Get the indexed tokens starting with a prefix."""
+        if not WORD.fullmatch(prefix):
+            return sorted(self._bigrams.get(prefix, ()))[:MAX_PREFIX_EXPANSIONS]
+
+        if len(self._words) != len(self._word_set):
+            self._words = sorted(self._word_set)
+        start = bisect.bisect_left(self._words, prefix)
+        matches = []
+        for token in self._words[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+
+    def _add_to_prefixes(self, doc_id, weights):
+        """Add a new document to the cached prefix expansions it matches."""
+        matched = {}
+        for token, weight in weights.items():
+            for end in range(1, len(token) + 1):
+                cached = self._prefix_postings.get(token[:end])
+                if cached is None:
+                    continue
+                prefix = token[:end]
+                if token == prefix:
+                    matched[prefix] = max(matched.get(prefix, 0.0), weight)
+                elif token in cached[0]:
+                    matched[prefix] = max(matched.get(prefix, 0.0), weight * PREFIX_WEIGHT)
+        for prefix, weight in matched.items():
+            self._prefix_postings[prefix][1].append(doc_id, weight)
+
+    def _term_postings(self, term, prefix):
+        """
+        Get the documents matching one query term.
+
+        Returns:
+            _Postings: Doc ids and weighted term frequencies.
+        """
+        exact = self.postings.get(term) or _Postings()
+        # Single Japanese characters are mostly indexed as the start of a bigram
+        if not prefix and not (len(term) == 1 and CJK_RUN.match(term)):
+            return exact
+
+        cached = self._prefix_postings.get(term)
+        if cached is not None:
+            return cached[1]
+        expansions = [token for token in self._expand_prefix(term) if token != term]
+        if not expansions:
+            return exact
+        if not len(exact) and len(expansions) == 1:
+            return self.postings[expansions[0]]
+
+        merged = dict(exact.items())
+        for token in expansions:
+            for doc_id, weight in self.postings[token].items():
+                merged[doc_id] = max(merged.get(doc_id, 0.0), weight * PREFIX_WEIGHT)
+        postings = _Postings()
+        for doc_id in sorted(merged):
+            postings.append(doc_id, merged[doc_id])
+        if len(self._prefix_postings) >= MAX_CACHED_PREFIXES:
+            del self._prefix_postings[next(iter(self._prefix_postings))]
+        self._prefix_postings[term] = (set(expansions), postings)
+        return postings
+
+    def search(self, query, limit=20, prefecture=None, category=None, prefix=True):
+        """
+        Search the index.
+
+        Every query term must match. When prefix is enabled, the last Latin
+        word of the query also matches longer words starting with it, so
+        partially typed queries find results.
+
+        Args:
+            query (str): The search query.
+            limit (int): Maximum number of hits.
+            prefecture (str, optional): Only return documents in this prefecture.
+            category (str, optional): Only return documents in this category.
+            prefix (bool): Whether the last Latin word matches by prefix.
+
+        Returns:
+            list: (score, record) tuples, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query, query=True)))
+        with self._lock:
+            filters = []
+            if prefecture:
+                filters.append(self.prefectures.get(prefecture, set()))
+            if category:
+                filters.append(self.categories.get(category, set()))
+            if not terms and not filters:
+                return []
+
+            words = [term for term in terms if WORD.fullmatch(term)]
+            last_word = words[-1] if prefix and words else None
+            matches = [self._term_postings(term, term == last_word) for term in terms]
+            if any(len(postings) == 0 for postings in matches):
+                return []
+            # Rarer terms weigh more
+            total = max(1, len(self._doc_ids))
+            idfs = [math.log(1 + total / len(postings)) for postings in matches]
+            filters.sort(key=len)
+            probes = sorted(range(len(matches)), key=lambda i: len(matches[i]))
+
+            # Walk the terms by impact, unless a filter is so small that walking
+            # all of it is cheaper than finding its members among the terms'
+            if not matches or (filters and len(filters[0]) ** 2 < limit * min(map(len, matches))):
+                scored = []
+                for doc_id in filters[0]:
+                    if doc_id in self._dead or any(doc_id not in facet for facet in filters[1:]):
+                        continue
+                    score = self._score(doc_id, matches, idfs, probes)
+                    if score is not None:
+                        scored.append((score, -doc_id))
+                hits = heapq.nlargest(limit, scored)
+            else:
+                hits = None
+                if len(matches) > 1:
+                    hits = self._tier_hits(matches, idfs, filters, limit)
+                if hits is None:
+                    hits = self._top_hits(matches, idfs, probes, filters, limit)
+
+            return [(score, self.records[-negative_id]) for score, negative_id in hits]
+
+    def _score(self, doc_id, matches, idfs, probes):
+        """
+        Score of a document, or None if a term does not match it.
+
+        The terms are probed in the order of probes (rarest first, to give up
+        early) and their impacts summed in query order, so equal documents
+        get bit-for-bit equal scores.
+        """
+        weights = [None] * len(matches)
+        for i in probes:
+            weight = matches[i].get(doc_id)
+            if weight is None:
+                return None
+            weights[i] = weight
+        score = 0.0
+        for weight, idf in zip(weights, idfs):
+            score += _impact(weight, idf)
+        return score
+
+    def _tier_hits(self, matches, idfs, filters, limit):
+        """
+        Find the best documents by intersecting the terms' weight tiers.
+
+        Documents in the same tier of every term score the same, so
+        combinations of tiers are tried best first and each is intersected
+        as a whole; the search ends once the next combination scores below
+        the hits found. Terms are intersected rarest first; intersections of
+        the first terms' tiers are shared between combinations, and once one
+        is empty, no combination that keeps those tiers is tried.
+
+        Returns:
+            list: (score, -doc id) tuples, best first, or None if the terms
+                rarely occur together and too many combinations came up empty.
+        """
+        if limit <= 0:
+            return []
+        # Combinations list tiers rarest term first; scores are summed in query order
+        rarest = sorted(range(len(matches)), key=lambda term: len(matches[term]))
+        positions = sorted(range(len(matches)), key=rarest.__getitem__)
+        tiers = [matches[term].tiers() for term in rarest]
+        impacts = [[_impact(weight, idfs[term]) for weight, ids in term_tiers]
+                   for term, term_tiers in zip(rarest, tiers)]
+        # (term, tier) -> its documents, and tiers of the first terms -> documents in all of them
+        tier_sets = {}
+        intersections = {}
+
+        def combination_score(combination):
+            score = 0.0
+            for position in positions:
+                score += impacts[position][combination[position]]
+            return score
+
+        def intersect(combination):
+            """Documents in a combination of tiers, and the number of first terms checked."""
+            docs = None
+            for end in range(1, len(combination) + 1):
+                prefix = combination[:end]
+                members = intersections.get(prefix)
+                if members is None:
+                    ids = tiers[end - 1][prefix[-1]][1]
+                    if docs is not None and len(docs) * 16 < len(ids):
+                        # A few documents are looked up rather than hashing a large tier
+                        members = {doc_id for doc_id in docs if _contains(ids, doc_id)}
+                    else:
+                        tier = tier_sets.get((end - 1, prefix[-1]))
+                        if tier is None:
+                            tier = tier_sets[(end - 1, prefix[-1])] = set(ids)
+                        members = tier if docs is None else docs.intersection(tier)
+                    intersections[prefix] = members
+                docs = members
+                if not docs:
+                    break
+            return docs, end
+
+        # Each combination is reached from one parent, by raising a tier at or
+        # after the one its parent raised
+        first = (0,) * len(tiers)
+        queue = [(-combination_score(first), first, 0)]
+        hits = []
+        found = 0
+        cutoff = None
+        for _ in range(MAX_TIER_COMBINATIONS):
+            if not queue:
+                return sorted(hits, reverse=True)[:limit]
+            negative_score, combination, raised = heapq.heappop(queue)
+            if cutoff is not None and -negative_score < cutoff:
+                return sorted(hits, reverse=True)[:limit]
+            docs, checked = intersect(combination)
+            # Children raising a later term keep an empty intersection of the first ones
+            for term in range(raised, checked if not docs else len(tiers)):
+                if combination[term] + 1 < len(tiers[term]):
+                    child = combination[:term] + (combination[term] + 1,) + combination[term + 1:]
+                    heapq.heappush(queue, (-combination_score(child), child, term))
+
+            if docs and self._dead:
+                docs = docs.difference(self._dead)
+            for facet in filters:
+                if not docs:
+                    break
+                docs = docs.intersection(facet)
+            if docs:
+                # Ties go to the lowest doc ids
+                hits.extend((-negative_score, -doc_id) for doc_id in sorted(docs)[:limit])
+                found += len(docs)
+                if cutoff is None and found >= limit:
+                    cutoff = -negative_score
+        return None
+
+    def _top_hits(self, matches, idfs, probes, filters, limit):
+        """
+        Find the best documents by walking the terms' postings by impact.
+
+        The postings are walked in turn (Fagin's threshold algorithm) and
+        every new document is scored in full. An unseen document scores at
+        most the sum of the terms' impacts at the weights last walked, so
+        the walk ends once that threshold cannot beat the worst hit found.
+
+        Returns:
+            list: (score, -doc id) tuples, best first.
+        """
+        if limit <= 0:
+            return []
+        walks = [postings.by_impact() for postings in matches]
+        # (doc id, weight) last walked and its impact, per term
+        last = [next(walk) for walk in walks]
+        impacts = [_impact(weight, idf) for (doc_id, weight), idf in zip(last, idfs)]
+        hits = []
+        seen = set()
+        dead = self._dead
+        candidates = [doc_id for doc_id, weight in last]
+        while True:
+            for doc_id in candidates:
+                if doc_id in seen or doc_id in dead:
+                    continue
+                seen.add(doc_id)
+                if filters and not all(doc_id in facet for facet in filters):
+                    continue
+                score = self._score(doc_id, matches, idfs, probes)
+                if score is None:
+                    continue
+                if len(hits) < limit:
+                    heapq.heappush(hits, (score, -doc_id))
+                elif (score, -doc_id) > hits[0]:
+                    heapq.heapreplace(hits, (score, -doc_id))
+
+            if len(hits) == limit:
+                threshold = 0.0
+                for impact in impacts:
+                    threshold += impact
+                worst, negative_id = hits[0]
+                # An unseen document scoring the threshold exactly comes after
+                # the last walked one in every term, so it loses the tie on doc id
+                if threshold < worst or (threshold == worst and max(doc_id for doc_id, weight in last) >= -negative_id):
+                    break
+
+            # Walk on in the term that adds the most to the threshold
+            term = max(range(len(walks)), key=impacts.__getitem__)
+            entry = next(walks[term], None)
+            if entry is None:
+                # Every document matching all terms is in this term's postings
+                break
+            last[term] = entry
+            impacts[term] = _impact(entry[1], idfs[term])
+            candidates = (entry[0],)
+        return sorted(hits, reverse=True)
+
+    def save(self, path):
+        """
+        Write the indexed records to a JSON lines file.
+
+        Other processes may append to the same file, so their records are
+        read back first (see load()) and the file is rewritten under a
+        file lock.
+
+        Args:
+            path (str): Output path.
+        """
+        with file_lock.locked(path):
+            if os.path.exists(path):
+                # A file this index never read may be older than its records
+                self.load(path, replace=path in self._files)
+            with self._lock:
+                entries = [(key, record) for key, record in zip(self.keys, self.records) if key is not None]
+            # The first line tells this file from the one it replaces, which may reuse its inode
+            head = (json.dumps({'generation': f"{os.getpid()}-{time.time_ns()}"}) + "\n").encode('utf-8')
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(head)
+                for key, record in entries:
+                    f.write((json.dumps({'key': key, 'record': record}, ensure_ascii=False) + "\n").encode('utf-8'))
+                size = f.tell()
+            os.replace(temp_path, path)
+            with self._lock:
+                self._files[path] = (head, size)
+
+    def append(self, path, keys):
+        """
+        Append the records of some documents to a file written by save().
+
+        Loading replays the file in order, so a record appended for a key
+        replaces the one written before it; save() now and then drops the
+        replaced lines.
+
+        Args:
+            path (str): Path of the file.
+            keys (list): Keys of the documents to append.
+        """
+        with self._lock:
+            entries = [(key, self.records[self._doc_ids[key]]) for key in keys if key in self._doc_ids]
+        if not entries:
+            return
+        data = "".join(json.dumps({'key': key, 'record': record}, ensure_ascii=False) + "\n"
+                       for key, record in entries).encode('utf-8')
+        # Not during a save() of another process, which would drop the lines
+        with file_lock.locked(path), open(path, 'a+b') as f:
+            f.seek(0)
+            head = f.readline()
+            end = f.seek(0, os.SEEK_END)
+            f.write(data)
+            with self._lock:
+                # The index already has these records; a later load() need not read them back
+                if self._files.get(path) == (head, end):
+                    self._files[path] = (head or data[:data.index(b"\n") + 1], end + len(data))
+
+    def load(self, path, replace=True):
+        """
+        Add the records of a file written by save() and append().
+
+        Loading a file again only reads the records appended since, or the
+        whole file if it was rewritten meanwhile, so a process can cheaply
+        pick up the records other processes wrote.
+
+        Args:
+            path (str): Input path.
+            replace (bool): Whether records replace documents already
+                indexed under the same key.
+
+        Returns:
+            int: Number of records loaded, counting replaced ones.
+        """
+        count = 0
+        with open(path, 'rb') as f:
+            head = f.readline()
+            with self._lock:
+                seen_head, offset = self._files.get(path, (None, 0))
+            if head != seen_head or not head.endswith(b"\n"):
+                offset = 0
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Still being appended; read it next time
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'key' not in entry:
+                    continue
+                if replace or entry['key'] not in self:
+                    self.add_record(entry['key'], entry['record'])
+                count += 1
+        with self._lock:
+            self._files[path] = (head, offset)
+        return count
@@ -0,0 +1,114 @@
+"""
+Module for serving a web app with several worker processes.
+
+The Flask development server runs one process, so it uses one core and
+loses all jobs when it restarts. Production mode serves the app with
+gunicorn instead: several worker processes, each with a few threads so a
+worker running a background job still answers progress polls. The
+workers share job state through the state store, which must therefore be
+one they can all see:
+
+    HAIKYO_STATE=sqlite:///state.db python main.py --production --workers 4
+
+Some state stays in each worker. /metrics, /traces and /debug/profile
+report on the worker that answers the request only. Where an app caches
+search results, each worker keeps its own cache, so another worker may
+scrape a search again. Local search indexes are also kept per worker.
+Each one catches up on the spots the other workers saved before it
+searches.
+"""
+
+import os
+import argparse
+import importlib
+
+from state_store import STATE_ENV, open_state_store
+
+HOST = '0.0.0.0'
+PORT = 5000
+
+# Threads per worker process
+THREADS = 4
+
+# Seconds a request may take; searches that scrape in the request take minutes
+TIMEOUT = 900
+
+
+def default_workers():
+    """One worker per core, at least two."""
+    return max(2, os.cpu_count() or 1)
+
+
+def add_arguments(parser):
+    """
+    Add the serving options to a command line parser.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser.
+    """
+    parser.add_argument('--production', action='store_true',
+                        help=f"serve with gunicorn and several workers (needs {STATE_ENV}=sqlite:///path)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes in production mode (default: one per core)")
+    parser.add_argument('--host', default=HOST, help=f"address to listen on (default: {HOST})")
+    parser.add_argument('--port', type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    # The Werkzeug debugger runs any code it is sent, so it is off unless asked for
+    parser.add_argument('--debug', action='store_true',
+                        help="development server only: enable the debugger and reloader "
+                             "(lets anyone who can reach --host run code; use with --host 127.0.0.1)")
+
+
+def parse_args(argv=None, description=None):
+    """
+    Parse the serving options.
+
+    Args:
+        argv (list, optional): Arguments; defaults to sys.argv[1:].
+        description (str, optional): Help text.
+
+    Returns:
+        argparse.Namespace: production, workers, host, port and debug.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def serve(target, host=HOST, port=PORT, workers=None):
+    """
+    Serve a WSGI app with gunicorn worker processes.
+
+    Each worker imports the app itself, after the fork.
+
+    Args:
+        target (str): 'module:attribute' of the Flask app, e.g. 'app:app'.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        workers (int, optional): Worker processes; defaults to one per core.
+
+    Raises:
+        SystemExit: If gunicorn is missing, or several workers would each
+            keep their own in-memory state.
+    """
+    workers = workers or default_workers()
+    if workers > 1 and not open_state_store().shared:
+        raise SystemExit(f"{workers} workers need a shared state store; "
+                         f"set {STATE_ENV}=sqlite:///path/to/state.db")
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("Production mode needs gunicorn: pip install gunicorn")
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', THREADS)
+            self.cfg.set('timeout', TIMEOUT)
+
+        def load(self):
+            module, attribute = target.split(':')
+            return getattr(importlib.import_module(module), attribute)
+
+    Application().run()
@@ -0,0 +1,98 @@
+"""
+Module for coalescing concurrent calls that do the same work.
+
+One scraper (and one geocoder) is shared by every request the app
+serves, so two users scraping overlapping selections used to fetch,
+parse and translate the same spot twice at the same time. A SingleFlight
+group runs one call per key at a time: a caller asking for a key that is
+already in flight waits for that call and gets its result (or its
+exception) instead of starting another one.
+
+    pages = SingleFlight('page')
+    html = pages.do(url, fetch, url)
+
+Nothing is kept once a call has finished; a later caller for the same key
+starts a new call. Caching finished results is left to the caches.
+"""
+
+import threading
+
+import metrics
+
+FLIGHT_CALLS = metrics.registry.counter(
+    'haikyo_singleflight_calls_total',
+    'Calls to single-flight groups by group and whether they ran or joined a call in flight.',
+    ['flight', 'result'])
+
+
+class _Call:
+    """A call in flight and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Group of keyed calls where each key runs at most once at a time, thread-safe.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize an empty group.
+
+        Args:
+            name (str): Group name used in the metrics.
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        # Key -> _Call currently running for it
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs), or wait for the call already running for key.
+
+        Args:
+            key: Hashable identity of the work, e.g. a URL.
+            fn (callable): The work.
+            *args: Positional arguments for fn.
+            **kwargs: Keyword arguments for fn.
+
+        Returns:
+            The result of the call; callers that joined get the same object.
+
+        Raises:
+            Exception: Whatever the call raised, re-raised in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            joined = call is not None
+            if not joined:
+                call = self._calls[key] = _Call()
+
+        if joined:
+            FLIGHT_CALLS.inc(self.name, 'coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        FLIGHT_CALLS.inc(self.name, 'executed')
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        """Number of keys with a call running."""
+        with self._lock:
+            return len(self._calls)
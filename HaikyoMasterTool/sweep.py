@@ -0,0 +1,338 @@
+"""
+Module for full-site sweeps of haikyo.info spot pages.
+
+Spot pages are split into shards that are fetched and parsed by a pool of
+worker processes, so HTML parsing scales with the number of CPU cores
+instead of being limited by the GIL. Workers write their results straight
+into a shared SQLite store; the coordinator retries failed pages and
+merges the final results.
+"""
+
+import os
+import json
+import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import extract_spot_id
+
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_ERROR = 'error'
+
+
+class SweepStore:
+    """
+    SQLite-backed store for sweep results shared between worker processes.
+    """
+
+    def __init__(self, path):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                spot_id INTEGER,
+                status TEXT NOT NULL,
+                data TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                updated REAL NOT NULL
+            )
+        """)
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_spot_id ON pages (spot_id)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS pages_updated ON pages (updated)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    def save(self, url, status, data=None, error=""):
+        """
+        Record the result of fetching a page.
+
+        Args:
+            url (str): The page URL.
+            status (str): One of STATUS_OK, STATUS_MISSING or STATUS_ERROR.
+            data (dict, optional): The extracted location data.
+            error (str, optional): Error message for failed pages.
+        """
+        spot_id = extract_spot_id(url)
+        with self.conn:
+            self.conn.execute("""
+                INSERT INTO pages (url, spot_id, status, data, error, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    status = excluded.status,
+                    data = excluded.data,
+                    error = excluded.error,
+                    attempts = pages.attempts + 1,
+                    updated = excluded.updated
+            """, (url, int(spot_id) if spot_id else None, status,
+                  json.dumps(data, ensure_ascii=False) if data is not None else None,
+                  error, time.time()))
+
+    def completed_urls(self):
+        """
+        Get the URLs that do not need to be fetched again.
+
+        Returns:
+            dict: Mapping of URL to status for pages that were scraped
+                successfully or do not exist.
+        """
+        rows = self.conn.execute('SELECT url, status FROM pages WHERE status IN (?, ?)',
+                                 (STATUS_OK, STATUS_MISSING))
+        return dict(rows.fetchall())
+
+    def counts(self):
+        """
+        Count stored pages by status.
+
+        Returns:
+            dict: Mapping of status to number of pages.
+        """
+        rows = self.conn.execute('SELECT status, COUNT(*) FROM pages GROUP BY status')
+        return dict(rows.fetchall())
+
+    def locations(self, since=None):
+        """
+        Iterate over the successfully scraped locations, ordered by spot id.
+
+        Args:
+            since (float, optional): Only locations saved at or after this
+                time.time() value.
+
+        Yields:
+            dict: Location data as produced by HaikyoScraper.
+        """
+        if since is None:
+            rows = self.conn.execute('SELECT data FROM pages WHERE status = ? ORDER BY spot_id, url',
+                                     (STATUS_OK,))
+        else:
+            rows = self.conn.execute('SELECT data FROM pages WHERE status = ? AND updated >= ? '
+                                     'ORDER BY spot_id, url', (STATUS_OK, since))
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def get_meta(self, key, default=None):
+        """
+        Read a JSON value stored alongside the results (e.g. a crawl checkpoint).
+
+        Args:
+            key (str): The metadata key.
+            default: Value returned if the key is not set.
+
+        Returns:
+            The decoded value, or default.
+        """
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        """
+        Store a JSON-serializable value alongside the results.
+
+        Args:
+            key (str): The metadata key.
+            value: The value to store.
+        """
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                              (key, json.dumps(value)))
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+
+# Per-process worker state, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(store_path, base_url, translate, archive_path=None, processes=1):
+    """Create the scraper and store connection used by a worker process."""
+    from rate_control import rate_controller
+    from scraper import HaikyoScraper
+    # The workers fetch from the same hosts at once, so each gets a share of the budget
+    rate_controller.share(processes)
+    _worker['scraper'] = HaikyoScraper(base_url)
+    if archive_path:
+        from page_archive import PageArchive
+        _worker['scraper'].archive = PageArchive(archive_path)
+    _worker['store'] = SweepStore(store_path)
+    _worker['translate'] = translate
+
+
+def _sweep_shard(urls):
+    """
+    Fetch and parse one shard of pages inside a worker process.
+
+    Args:
+        urls (list): Page URLs in this shard.
+
+    Returns:
+        dict: Counts of 'ok' and 'missing' pages and the list of 'failed' URLs.
+    """
+    scraper = _worker['scraper']
+    store = _worker['store']
+    summary = {'ok': 0, 'missing': 0, 'failed': []}
+
+    for url in urls:
+        try:
+            response, html = scraper.fetch_spot_page(url)
+            if response.status_code == 404:
+                store.save(url, STATUS_MISSING)
+                summary['missing'] += 1
+                continue
+            response.raise_for_status()
+            data = scraper.parse_location_page(html, url, translate=_worker['translate'])
+        except Exception as e:
+            store.save(url, STATUS_ERROR, error=str(e))
+            summary['failed'].append(url)
+            continue
+
+        store.save(url, STATUS_OK, data)
+        summary['ok'] += 1
+
+    return summary
+
+
+class SiteSweeper:
+    """
+    Coordinator for multi-process sweeps over haikyo.info spot pages.
+    """
+
+    def __init__(self, store_path, workers=None, shard_size=50, max_retries=2,
+                 base_url="https://haikyo.info", translate=False, archive_path=None):
+        """
+        Initialize the sweeper.
+
+        Args:
+            store_path (str): Path to the shared SQLite store.
+            workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            shard_size (int): Number of pages handed to a worker at a time.
+            max_retries (int): How many times failed pages are retried.
+            base_url (str): The base URL of the haikyo.info website.
+            translate (bool): Whether workers translate the scraped text.
+            archive_path (str, optional): PageArchive that workers store fetched pages in.
+        """
+        self.store_path = store_path
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.translate = translate
+        self.archive_path = archive_path
+
+    def partition(self, urls):
+        """
+        Split URLs into shards for the worker pool.
+
+        Args:
+            urls (list): The URLs to split.
+
+        Returns:
+            list: A list of URL lists.
+        """
+        return [urls[i:i + self.shard_size] for i in range(0, len(urls), self.shard_size)]
+
+    def sweep_range(self, start_id, end_id, callback=None, resume=True):
+        """
+        Sweep all spot pages in an id range.
+
+        Args:
+            start_id (int): First spot id (inclusive).
+            end_id (int): Last spot id (inclusive).
+            callback (function, optional): Callback function for progress updates.
+            resume (bool): Skip pages already completed in the store.
+
+        Returns:
+            dict: Sweep summary (see sweep_urls).
+        """
+        urls = [f"{self.base_url}/s/{spot_id}.html" for spot_id in range(start_id, end_id + 1)]
+        return self.sweep_urls(urls, callback, resume)
+
+    def sweep_urls(self, urls, callback=None, resume=True):
+        """
+        Fetch and parse the given pages across the worker pool.
+
+        Args:
+            urls (list): Page URLs to sweep.
+            callback (function, optional): Callback function for progress updates.
+            resume (bool): Skip pages already completed in the store.
+
+        Returns:
+            dict: Summary with 'ok', 'missing' and 'skipped' counts, the
+                URLs that still 'failed' after all retries, the 'shard_errors'
+                of crashed workers and 'elapsed' seconds.
+        """
+        started = time.time()
+        urls = list(dict.fromkeys(urls))
+        store = SweepStore(self.store_path)
+        try:
+            done = store.completed_urls() if resume else set()
+        finally:
+            store.close()
+
+        pending = [url for url in urls if url not in done]
+        summary = {'ok': 0, 'missing': 0, 'skipped': len(urls) - len(pending), 'failed': [],
+                   'shard_errors': []}
+        total = len(pending)
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            if attempt and callback:
+                processed = summary['ok'] + summary['missing']
+                callback(processed / total * 100, f"Retrying {len(pending)} failed pages (attempt {attempt + 1})")
+
+            # A worker that dies breaks its pool, so every attempt gets a fresh one
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.store_path, self.base_url, self.translate,
+                                               self.archive_path, self.workers)) as pool:
+                futures = {pool.submit(_sweep_shard, shard): shard for shard in self.partition(pending)}
+                failed = []
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # A crashed worker loses its whole shard, so retry all of it
+                        summary['shard_errors'].append(str(e))
+                        failed.extend(futures[future])
+                        continue
+
+                    summary['ok'] += result['ok']
+                    summary['missing'] += result['missing']
+                    failed.extend(result['failed'])
+
+                    if callback:
+                        processed = summary['ok'] + summary['missing']
+                        progress = processed / total * 100 if total else 100
+                        callback(progress, f"Swept {processed} of {total} pages")
+            pending = failed
+
+        summary['failed'] = pending
+        summary['elapsed'] = time.time() - started
+        if callback:
+            callback(100, f"Sweep finished: {summary['ok']} locations, {summary['missing']} missing, "
+                          f"{len(pending)} failed")
+        return summary
+
+    def merge(self):
+        """
+        Collect all successfully scraped locations from the store.
+
+        Returns:
+            list: Location dictionaries ordered by spot id.
+        """
+        store = SweepStore(self.store_path)
+        try:
+            return list(store.locations())
+        finally:
+            store.close()
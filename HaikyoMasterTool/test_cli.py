@@ -0,0 +1,73 @@
+"""
+Tests for the headless command-line batch mode.
+"""
+
+import json
+
+import cli
+
+
+class FakeScraper:
+    """Scraper that finds two locations per search and fails on one URL."""
+
+    def search_locations(self, term, max_pages=None):
+        return [f"https://haikyo.info/s/{len(term)}.html", "https://haikyo.info/s/99.html"]
+
+    def scrape_location_details(self, url):
+        if url.endswith('/99.html'):
+            return {'title': "Error", 'url': url, 'description': "Error scraping details: 404"}
+        return {'title': "廃病院", 'url': url, 'coordinates': {'lat': 35.0, 'lng': 139.0},
+                'images': [], 'translated_title': "Abandoned hospital"}
+
+
+def test_read_inputs_splits_terms_and_urls(tmp_path):
+    """Input file lines are URLs or search terms; comments and duplicates are dropped."""
+    path = tmp_path / 'jobs.txt'
+    path.write_text("# nightly\n病院\n\nhttps://haikyo.info/s/1.html\n病院\n", encoding='utf-8')
+
+    terms, urls = cli.read_inputs(['学校'], ['北海道'], [], str(path))
+
+    assert terms == ['学校', '北海道', '病院']
+    assert urls == ['https://haikyo.info/s/1.html']
+
+
+def test_geojson_output_is_streamed_and_valid(tmp_path, monkeypatch):
+    """A batch run writes a FeatureCollection and reports the failed page."""
+    monkeypatch.setattr(cli, 'HaikyoScraper', FakeScraper)
+    output = tmp_path / 'out.geojson'
+
+    status = cli.main(['--search', '病院', '--url', 'https://haikyo.info/s/7.html',
+                       '-o', str(output), '--workers', '2', '--quiet'])
+
+    assert status == 0
+    collection = json.loads(output.read_text(encoding='utf-8'))
+    features = sorted(collection['features'], key=lambda feature: feature['properties']['url'])
+    assert [feature['properties']['spot_id'] for feature in features] == ['2', '7']
+    assert features[0]['geometry'] == {'type': 'Point', 'coordinates': [139.0, 35.0]}
+
+
+def test_ndjson_to_stdout_and_failure_status(capsys, monkeypatch):
+    """NDJSON goes to stdout; a run where every page fails exits with 1."""
+    monkeypatch.setattr(cli, 'HaikyoScraper', FakeScraper)
+
+    assert cli.main(['--url', 'https://haikyo.info/s/1.html', '--quiet']) == 0
+    assert json.loads(capsys.readouterr().out)['translated_title'] == "Abandoned hospital"
+
+    assert cli.main(['--url', 'https://haikyo.info/s/99.html', '--quiet']) == 1
+
+
+def test_sweep_writes_the_locations_of_its_store(tmp_path):
+    """A sweep over pages already in the store resumes past them and writes them out."""
+    from sweep import SweepStore, STATUS_OK, STATUS_MISSING
+    path = str(tmp_path / 'spots.db')
+    store = SweepStore(path)
+    store.save('https://haikyo.info/s/1.html', STATUS_OK,
+               {'title': "廃校", 'url': 'https://haikyo.info/s/1.html', 'coordinates': None})
+    store.save('https://haikyo.info/s/2.html', STATUS_MISSING)
+    store.close()
+    output = tmp_path / 'out.ndjson'
+
+    status = cli.main(['--sweep', '1-2', '--store', path, '--workers', '1', '-o', str(output), '--quiet'])
+
+    assert status == 0
+    assert [json.loads(line)['title'] for line in output.read_text(encoding='utf-8').splitlines()] == ["廃校"]
@@ -0,0 +1,77 @@
+"""
+Tests for the spot-id enumeration crawler, using a fake scraper.
+"""
+
+import re
+
+from id_crawler import SpotIdCrawler
+from sweep import SweepStore
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeScraper:
+    """Pretends spot pages exist only for the given ids."""
+
+    def __init__(self, existing):
+        self.existing = set(existing)
+        self.requested = []
+
+    def spot_url(self, spot_id):
+        return f"https://haikyo.info/s/{spot_id}.html"
+
+    def fetch_spot_page(self, url, timeout=30):
+        spot_id = int(re.search(r'/s/(\d+)\.html', url).group(1))
+        self.requested.append(spot_id)
+        return FakeResponse(200 if spot_id in self.existing else 404), ""
+
+    def parse_location_page(self, html, url, callback=None, translate=True):
+        return {'title': url, 'url': url}
+
+
+def test_crawl_finds_clusters_and_skips_gaps(tmp_path):
+    """Both clusters are found while most of the gap is never requested."""
+    existing = list(range(1, 11)) + list(range(300, 306))
+    scraper = FakeScraper(existing)
+    store = SweepStore(str(tmp_path / 'crawl.db'))
+    crawler = SpotIdCrawler(scraper, store, concurrency=4, gap_threshold=8, max_stride=32)
+
+    summary = crawler.crawl(start_id=1)
+
+    assert summary['found'] == len(existing)
+    assert summary['skipped'] > 200
+    assert len(set(scraper.requested)) < 150
+    assert len(list(store.locations())) == len(existing)
+
+
+def test_crawl_resumes_without_refetching(tmp_path):
+    """A second run over the same range fetches nothing again."""
+    scraper = FakeScraper(range(1, 21))
+    path = str(tmp_path / 'crawl.db')
+    SpotIdCrawler(scraper, path, concurrency=4).crawl(start_id=1, end_id=20)
+    scraper.requested.clear()
+
+    summary = SpotIdCrawler(scraper, path, concurrency=4).crawl(start_id=1, end_id=20)
+    assert scraper.requested == []
+    assert summary['found'] == 20
+
+
+def test_checkpoints_are_kept_per_range(tmp_path):
+    """A crawl over another range starts at its own first id, not at an earlier crawl's checkpoint."""
+    scraper = FakeScraper(range(1, 31))
+    path = str(tmp_path / 'crawl.db')
+    SpotIdCrawler(scraper, path, concurrency=4).crawl(start_id=11, end_id=30)
+    scraper.requested.clear()
+
+    summary = SpotIdCrawler(scraper, path, concurrency=4).crawl(start_id=1, end_id=10)
+
+    assert sorted(scraper.requested) == list(range(1, 11))
+    assert summary['found'] == 10
@@ -0,0 +1,99 @@
+"""
+Tests for the image thumbnail cache.
+"""
+
+import os
+
+from image_cache import ImageCache
+from rate_control import RateController
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.chunks_read = 0
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            self.chunks_read += 1
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Serves canned image bytes and counts requests."""
+
+    def __init__(self, images):
+        self.images = images
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(url)
+        if url not in self.images:
+            return FakeResponse(b'', 404)
+        return FakeResponse(self.images[url])
+
+
+def make_cache(path, session):
+    return ImageCache(str(path), session=session, controller=RateController(initial_delay=0, min_delay=0))
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    """Two URLs with the same content share one cached file; failures are skipped."""
+    session = FakeSession({'https://a/1.png': PNG, 'https://b/1.png': PNG})
+    cache = make_cache(tmp_path, session)
+
+    cached = cache.cache_many(['https://a/1.png', 'https://b/1.png', 'https://c/missing.png'])
+
+    assert set(cached) == {'https://a/1.png', 'https://b/1.png'}
+    assert cached['https://a/1.png'] == cached['https://b/1.png']
+    assert os.path.exists(cache.file_path(cached['https://a/1.png']))
+
+
+def test_index_survives_restart(tmp_path):
+    """A new cache over the same directory does not download again."""
+    session = FakeSession({'https://a/1.png': PNG})
+    make_cache(tmp_path, session).cache_many(['https://a/1.png'])
+
+    cache = make_cache(tmp_path, session)
+    assert cache.filename('https://a/1.png')
+    cache.cache_many(['https://a/1.png'])
+    assert session.requests == ['https://a/1.png']
+
+
+def test_saves_keep_entries_of_other_caches(tmp_path):
+    """Two caches over one directory, as in two workers, keep each other's index entries."""
+    session = FakeSession({'https://a/1.png': PNG, 'https://b/2.png': PNG + b'2'})
+    first = make_cache(tmp_path, session)
+    second = make_cache(tmp_path, session)
+    first.cache_many(['https://a/1.png'])
+    second.cache_many(['https://b/2.png'])
+
+    assert set(make_cache(tmp_path, session).index) == {'https://a/1.png', 'https://b/2.png'}
+    # The second cache found the first one's image without downloading it
+    assert second.cache_many(['https://a/1.png'])
+    assert session.requests == ['https://a/1.png', 'https://b/2.png']
+
+
+def test_oversized_images_are_not_read_to_the_end(tmp_path):
+    """A body is abandoned once it passes max_bytes, or before reading if Content-Length says so."""
+    cache = make_cache(tmp_path, FakeSession({}))
+    cache.max_bytes = 100 * 1024
+    streamed = FakeResponse(PNG * 100000)
+    declared = FakeResponse(PNG, headers={'Content-Length': str(10 ** 9)})
+
+    assert cache._read_limited(streamed) is None
+    assert streamed.chunks_read == 2
+    assert cache._read_limited(declared) is None
+    assert declared.chunks_read == 0
+    assert cache._read_limited(FakeResponse(PNG)) == PNG
@@ -0,0 +1,41 @@
+"""
+Tests for the crawl journal used to resume interrupted jobs.
+"""
+
+from journal import CrawlJournal
+
+
+def test_journal_survives_restart(tmp_path):
+    """Entries written before a crash are replayed when the job reopens."""
+    urls = ['https://haikyo.info/s/1.html', 'https://haikyo.info/s/2.html', 'https://haikyo.info/s/3.html']
+    journal = CrawlJournal.for_job(str(tmp_path), "\n".join(urls), {'urls': urls})
+    journal.record(urls[0], {'title': 'a'})
+    journal.record(urls[1], {'title': 'b'})
+    journal.close()
+
+    # Simulate a crash in the middle of writing an entry
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"key": "https://haikyo.info/s/3.ht')
+
+    assert CrawlJournal.unfinished(str(tmp_path)) == [journal.path]
+
+    resumed = CrawlJournal.for_job(str(tmp_path), "\n".join(urls))
+    assert resumed.job == {'urls': urls}
+    assert resumed.get(urls[1]) == {'title': 'b'}
+    assert resumed.pending(urls) == [urls[2]]
+
+    resumed.record(urls[2], {'title': 'c'})
+    resumed.finish()
+    assert CrawlJournal.unfinished(str(tmp_path)) == []
+    assert len(CrawlJournal(resumed.path)) == 3
+
+
+def test_finished_job_starts_fresh(tmp_path):
+    """Reopening a finished job does not reuse its old results."""
+    journal = CrawlJournal.for_job(str(tmp_path), 'job')
+    journal.record('x', 1)
+    journal.finish()
+
+    again = CrawlJournal.for_job(str(tmp_path), 'job')
+    assert len(again) == 0
+    again.close()
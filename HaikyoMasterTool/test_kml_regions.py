@@ -0,0 +1,42 @@
+"""
+Tests for the regionated KML super-overlay.
+"""
+
+import re
+import zipfile
+
+from kml_regions import build_tiles, write_kmz
+
+
+def grid(count):
+    """Placemarks spread over a square of roughly Japan's size."""
+    side = int(count ** 0.5) + 1
+    return [(f"spot {i}", 30 + (i // side) * 15 / side, 130 + (i % side) * 15 / side, f"<p>{i}</p>")
+            for i in range(count)]
+
+
+def test_every_placemark_lands_in_exactly_one_small_tile():
+    """Tiles hold at most max_per_tile placemarks and together hold all of them."""
+    tiles = build_tiles(grid(1000), max_per_tile=50)
+
+    names = [name for kml in tiles.values() for name in re.findall(r'<name>(spot \d+)</name>', kml)]
+    assert sorted(names) == sorted(f"spot {i}" for i in range(1000))
+    assert all(kml.count('<Placemark>') <= 50 for kml in tiles.values())
+    assert len(tiles) > 20
+
+
+def test_links_point_to_tiles_with_regions(tmp_path):
+    """Every NetworkLink has a Region/Lod and refers to a tile packaged in the KMZ."""
+    tiles = build_tiles(grid(300) + [("same", 35.0, 139.0, "")] * 150, max_per_tile=40, max_depth=6)
+    path = tmp_path / 'spots.kmz'
+    write_kmz(tiles, str(path))
+
+    with zipfile.ZipFile(path) as kmz:
+        packaged = kmz.namelist()
+        assert packaged[0] == 'doc.kml'
+        for name in packaged:
+            kml = kmz.read(name).decode('utf-8')
+            links = re.findall(r'<NetworkLink>.*?</NetworkLink>', kml)
+            for link in links:
+                assert '<Region>' in link and '<minLodPixels>' in link
+                assert re.search(r'<href>(.*?)</href>', link).group(1) in packaged
@@ -0,0 +1,65 @@
+"""
+Tests for the incrementally updated live KML feed.
+"""
+
+import re
+import json
+
+from kml_updates import PlacemarkFeed
+
+DOC_URL = 'http://localhost:5000/live/doc.kml'
+
+
+def spot(spot_id, title="廃校", lat=35.0):
+    """A scraped location dictionary."""
+    return {'url': f'https://haikyo.info/s/{spot_id}.html', 'title': title,
+            'coordinates': {'lat': lat, 'lng': 139.0}}
+
+
+def targets(kml, action):
+    """Placemark ids inside one Update action."""
+    section = re.search(f'<{action}>(.*?)</{action}>', kml)
+    return sorted(re.findall(r'(?:targetId|id)="(spot-\d+)"', section.group(1))) if section else []
+
+
+def test_update_holds_only_changes_since_the_cookie():
+    """Unchanged spots are left out; changed ones are replaced, removed ones deleted."""
+    feed = PlacemarkFeed()
+    first = feed.sync([spot(1), spot(2), spot(3)])
+    assert feed.sync([spot(1), spot(2), spot(3)]) == first
+
+    feed.sync([spot(1), spot(2, title="廃病院"), spot(4)])
+    update = feed.update_document(first, DOC_URL)
+
+    assert re.search(r'<cookie>version=(\d+)</cookie>', update).group(1) == str(feed.version)
+    assert targets(update, 'Create') == ['spot-2', 'spot-4']
+    assert targets(update, 'Delete') == ['spot-2', 'spot-3']
+    assert '<Update>' not in feed.update_document(feed.version, DOC_URL)
+
+
+def test_full_document_links_updates_from_its_version():
+    """The document carries every placemark and polls for changes after its own version."""
+    feed = PlacemarkFeed()
+    feed.sync([spot(1), spot(2, lat=None)])
+
+    kml = feed.full_document('http://localhost:5000/live/update.kml')
+
+    assert kml.count('<Placemark') == 1
+    assert f'update.kml?version={feed.version}</href>' in kml
+    assert targets(feed.update_document(feed.version + 5, DOC_URL), 'Create') == ['spot-1']
+
+
+def test_dumped_state_continues_in_another_feed():
+    """A feed loaded from another's JSON state keeps its versions and only adds new changes."""
+    feed = PlacemarkFeed()
+    feed.sync([spot(1), spot(2)])
+    since = feed.version
+
+    other = PlacemarkFeed()
+    other.load(json.loads(json.dumps(feed.dump())))
+    assert other.sync([spot(1), spot(2)]) == since
+    other.sync([spot(1), spot(3)])
+
+    update = other.update_document(since, DOC_URL)
+    assert targets(update, 'Create') == ['spot-3']
+    assert targets(update, 'Delete') == ['spot-2']
@@ -0,0 +1,79 @@
+"""
+Tests for the normalized Location record and LocationBatch container.
+"""
+
+from location import Location, LocationBatch
+
+
+def test_adapters_normalize_all_shapes():
+    """All three tools' dictionaries map onto the same Location fields."""
+    master = Location.from_dict({
+        'title': '摩耶観光ホテル', 'url': 'https://haikyo.info/s/3.html',
+        'coordinates': {'lat': 34.7276, 'lng': 135.2125}, 'images': ['a.jpg']
+    })
+    locator = Location.from_dict({
+        'ja': '摩耶観光ホテル', 'en': 'Maya Tourist Hotel',
+        'coordinates': (34.7276, 135.2125), 'url': 'https://haikyo.info/s/3.html'
+    })
+    scanner = Location.from_dict({
+        'id': '3', 'name': '摩耶観光ホテル', 'url': 'https://haikyo.info/s/3.html',
+        'latitude': '34.7276', 'longitude': '135.2125', 'prefecture': '兵庫県'
+    })
+
+    for location in (master, locator, scanner):
+        assert location.spot_id == '3'
+        assert location.title == '摩耶観光ホテル'
+        assert (location.lat, location.lng) == (34.7276, 135.2125)
+        assert location.has_coordinates
+
+    assert master.image_url == 'a.jpg'
+    assert locator.translated_title == 'Maya Tourist Hotel'
+    assert scanner.prefecture == '兵庫県'
+
+
+def test_missing_and_zero_coordinates():
+    """Zero or missing coordinates are not treated as usable."""
+    assert not Location.from_master({'title': 'x', 'coordinates': None}).has_coordinates
+    assert not Location.from_master({'title': 'x', 'coordinates': {'lat': 0, 'lng': 0}}).has_coordinates
+    assert not Location.from_locator({'ja': 'x', 'coordinates': None}).has_coordinates
+
+
+def test_round_trip_to_master():
+    """Converting back to the HaikyoMasterTool shape keeps the data."""
+    data = {
+        'title': 't', 'url': 'https://haikyo.info/s/10.html', 'address': 'a',
+        'coordinates': {'lat': 35.0, 'lng': 139.0}, 'description': 'd', 'images': ['i.jpg'],
+        'translated_title': 'T', 'translated_address': 'A', 'translated_description': 'D'
+    }
+    assert Location.from_master(data).to_master() == data
+    # Half a coordinate pair is no coordinates
+    assert Location(title='t', lat=35.0).to_master()['coordinates'] is None
+
+
+def test_batch_columns_and_filter():
+    """LocationBatch stores columns and filters without losing rows."""
+    batch = LocationBatch([
+        Location(url='https://haikyo.info/s/1.html', title='a', lat=35.0, lng=139.0, prefecture='東京都'),
+        Location(url='https://haikyo.info/s/2.html', title='b', prefecture='東京都'),
+        Location(url='https://haikyo.info/s/3.html', title='c', lat=34.0, lng=135.0, prefecture='兵庫県'),
+    ])
+
+    assert len(batch) == 3
+    assert batch[1].lat is None
+    assert batch[2].spot_id == '3'
+    assert batch.indices_with_coordinates() == [0, 2]
+    assert [loc.title for loc in batch.filter(prefecture='東京都')] == ['a', 'b']
+    assert [loc.title for loc in batch.filter(with_coordinates=True)] == ['a', 'c']
+    assert batch.bounds() == (34.0, 135.0, 35.0, 139.0)
+
+    # A rescraped location replaces its row in place
+    batch[1] = {'url': 'https://haikyo.info/s/2.html', 'title': 'b2', 'coordinates': {'lat': 36.0, 'lng': 140.0}}
+    assert (batch[1].title, batch[1].lat) == ('b2', 36.0)
+    assert batch.indices_with_coordinates() == [0, 1, 2]
+
+
+def test_prefecture_strings_are_interned():
+    """Repeated prefecture strings share a single object."""
+    first = Location(prefecture=''.join(['東京', '都']))
+    second = Location(prefecture=''.join(['東', '京都']))
+    assert first.prefecture is second.prefecture
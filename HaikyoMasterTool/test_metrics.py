@@ -0,0 +1,44 @@
+"""
+Tests for the in-process metrics and their Prometheus text rendering.
+"""
+
+import pytest
+
+from metrics import MetricsRegistry, STAGE_FAILURES, timed
+
+
+def test_histogram_buckets_are_cumulative():
+    """Each bucket counts every observation at or below its bound."""
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'Test latencies.', ['stage'], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, 'fetch')
+
+    text = registry.render()
+    assert 'test_seconds_bucket{stage="fetch",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="fetch",le="1.0"} 3' in text
+    assert 'test_seconds_bucket{stage="fetch",le="+Inf"} 4' in text
+    assert 'test_seconds_sum{stage="fetch"} 6.05' in text
+    assert 'test_seconds_count{stage="fetch"} 4' in text
+    assert '# TYPE test_seconds histogram' in text
+
+
+def test_counter_labels_are_escaped_and_checked():
+    """Label values are escaped, and the label count must match."""
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Test counter.', ['cache', 'result'])
+    counter.inc('a"b', 'hit', amount=2)
+
+    assert 'test_total{cache="a\\"b",result="hit"} 2' in registry.render()
+    with pytest.raises(ValueError):
+        counter.inc('search')
+
+
+def test_timed_counts_failures():
+    """A stage that raises is counted as a failure and the error propagates."""
+    before = STAGE_FAILURES._values.get(('test_stage',), 0)
+    with pytest.raises(RuntimeError):
+        with timed('test_stage'):
+            raise RuntimeError('boom')
+
+    assert STAGE_FAILURES._values[('test_stage',)] == before + 1
@@ -0,0 +1,42 @@
+"""
+Tests for the cache of spots without extractable coordinates.
+"""
+
+from negative_cache import NegativeCache, content_digest
+from scraper import HaikyoScraper
+
+PAGE = '<html><body><h1 class="spot_title">廃ホテル</h1>\n<div class="spot_descr">地図なし</div></body></html>'
+
+
+def test_entries_depend_on_content_and_ttl(tmp_path):
+    """An entry only hits for the same page content and until it expires."""
+    cache = NegativeCache(str(tmp_path / 'unresolvable.db'), ttl=60)
+    digest = content_digest(PAGE)
+    cache.mark_unresolvable('123', digest)
+
+    assert cache.is_unresolvable('123', content_digest(PAGE.replace('\n', '\n    ')))
+    assert not cache.is_unresolvable('123', content_digest(PAGE + '<p>map</p>'))
+    assert not cache.is_unresolvable('456', digest)
+
+    expired = NegativeCache(str(tmp_path / 'unresolvable.db'), ttl=-1)
+    expired.mark_unresolvable('123', digest)
+    assert not expired.is_unresolvable('123', digest)
+    assert expired.purge_expired() == 1
+
+
+def test_scraper_skips_extraction_for_known_pages(tmp_path):
+    """A page that yielded no coordinates is not run through the extractors again."""
+    scraper = HaikyoScraper()
+    scraper.negative_cache = NegativeCache(str(tmp_path / 'unresolvable.db'))
+    calls = []
+    extract = scraper._extract_coordinates
+    scraper._extract_coordinates = lambda soup, url: calls.append(url) or extract(soup, url)
+    url = 'https://haikyo.info/s/123.html'
+
+    first = scraper.parse_location_page(PAGE, url, translate=False)
+    second = scraper.parse_location_page(PAGE, url, translate=False)
+    changed = scraper.parse_location_page(PAGE.replace('地図なし', '地図あり'), url, translate=False)
+
+    assert first['coordinates'] == second['coordinates'] == {'lat': 0, 'lng': 0}
+    assert calls == [url, url]
+    assert changed['title'] == '廃ホテル'
@@ -0,0 +1,93 @@
+"""
+Tests for the compressed page archive and offline replay.
+"""
+
+import os
+import hashlib
+
+import page_archive
+from page_archive import PageArchive, replay
+
+# Navigation shared by every page, varied enough that one page alone compresses poorly
+BOILERPLATE = ''.join(f'<div class="nav"><a href="/list/{hashlib.md5(bytes([i])).hexdigest()}">'
+                      f'{hashlib.sha1(bytes([i])).hexdigest()}</a></div>\n' for i in range(200))
+
+
+def spot_page(spot_id):
+    """A spot page with shared boilerplate and embedded coordinates."""
+    return (f'<html><body>\n{BOILERPLATE}<h1 class="spot_title">廃墟 {spot_id}</h1>\n'
+            f'<div class="spot_map" data-lat="35.{spot_id}" data-lng="139.{spot_id}"></div>\n'
+            '</body></html>')
+
+
+def test_pages_are_deduplicated_and_indexed_by_url(tmp_path):
+    """Identical content is stored once; every fetch is recorded by URL and time."""
+    archive = PageArchive(str(tmp_path / 'pages.db'), codec='zlib')
+    url = 'https://haikyo.info/s/1.html'
+    first = archive.put(url, spot_page(1), fetched=100.0)
+    again = archive.put(url, spot_page(1), fetched=200.0)
+    archive.put(url, spot_page(11), fetched=300.0)
+
+    assert first == again
+    assert [fetched for fetched, status, digest in archive.history(url)] == [100.0, 200.0, 300.0]
+    assert archive.latest(url)[2].decode('utf-8') == spot_page(11)
+    assert archive.get(first).decode('utf-8') == spot_page(1)
+    assert archive.stats()['pages'] == 2
+
+
+def test_trained_dictionary_shrinks_later_pages(tmp_path):
+    """Pages stored after training compress better and still read back intact."""
+    path = str(tmp_path / 'pages.db')
+    archive = PageArchive(path, codec='zlib', train_after=5)
+    for spot_id in range(1, 6):
+        archive.put(f'https://haikyo.info/s/{spot_id}.html', spot_page(spot_id))
+    before = archive.stats()['stored_bytes'] / 5
+    archive.put('https://haikyo.info/s/6.html', spot_page(6))
+    after = archive.stats()['stored_bytes'] - before * 5
+    archive.close()
+
+    reopened = PageArchive(path, codec='zlib')
+    assert after < before / 2
+    assert reopened.latest('https://haikyo.info/s/6.html')[2].decode('utf-8') == spot_page(6)
+
+
+def test_replay_re_extracts_latest_pages(tmp_path):
+    """Replay parses the latest version of each page in worker processes."""
+    path = str(tmp_path / 'pages.db')
+    archive = PageArchive(path, codec='zlib', train_after=3)
+    for spot_id in range(1, 8):
+        archive.put(f'https://haikyo.info/s/{spot_id}.html', spot_page(spot_id))
+    archive.put('https://haikyo.info/s/404.html', 'missing', status=404)
+    archive.close()
+
+    results = list(replay(path, workers=2, chunk_size=3))
+
+    assert len(results) == 7
+    by_url = {url: data for url, fetched, data, error in results}
+    assert by_url['https://haikyo.info/s/5.html']['coordinates'] == {'lat': 35.5, 'lng': 139.5}
+
+
+def record_chunk(rows):
+    """Stand-in for _replay_chunk that leaves a file behind for every page it parsed."""
+    for url, fetched, digest in rows:
+        open(os.path.join(os.environ['REPLAY_MARKERS'], digest), 'w').close()
+    return [(url, fetched, {}, None) for url, fetched, digest in rows]
+
+
+def test_closing_replay_early_skips_the_remaining_pages(tmp_path, monkeypatch):
+    """A consumer that stops early (cli --limit) does not wait for the whole archive to be parsed."""
+    path = str(tmp_path / 'pages.db')
+    archive = PageArchive(path, codec='zlib', train_after=0)
+    for spot_id in range(1, 41):
+        archive.put(f'https://haikyo.info/s/{spot_id}.html', spot_page(spot_id))
+    archive.close()
+    markers = tmp_path / 'parsed'
+    markers.mkdir()
+    monkeypatch.setenv('REPLAY_MARKERS', str(markers))
+    monkeypatch.setattr(page_archive, '_replay_chunk', record_chunk)
+
+    results = replay(path, workers=1, chunk_size=1)
+    next(results)
+    results.close()
+
+    assert len(os.listdir(markers)) <= 1 + page_archive.REPLAY_CHUNKS_PER_WORKER + 1
@@ -0,0 +1,102 @@
+"""
+Tests for reading spot pages only until all fields have arrived.
+"""
+
+from page_stream import OVERLAP, SpotPageWatcher, read_page
+from rate_control import RateController
+from scraper import HaikyoScraper
+
+HEAD = (
+    '<html><head><meta charset="utf-8"></head><body>'
+    '<h1 class="spot_title">廃ホテル</h1>'
+    '<div class="spot_address">北海道</div>'
+    '<div class="spot_descr"><div><p>山の中のホテル</p></div><p>閉業</p></div>'
+    '<div class="spot_image"><div><img src="/img/1.jpg"></div></div>'
+    '<script>window.spot_info = {"lat": 43.1, "lng": 141.3};</script>'
+)
+TAIL = '<div class="comments">' + '<p>コメント</p>' * 20000 + '</div></body></html>'
+
+
+class FakeResponse:
+    """Streamed response that serves a page in chunks and counts how many were read."""
+
+    def __init__(self, body, status_code=200, content_type='text/html'):
+        self.body = body.encode('utf-8')
+        self.status_code = status_code
+        self.headers = {'content-type': content_type}
+        self.encoding = 'ISO-8859-1'
+        self.read = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            self.read += 1
+            yield self.body[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def test_reading_stops_once_every_field_has_closed():
+    """Nested elements are balanced; the tail of the page is never read."""
+    response = FakeResponse(HEAD + TAIL)
+
+    html = read_page(response, chunk_size=7)
+
+    assert html.startswith(HEAD[:-len('</script>')])
+    assert len(html) < len(HEAD) + 7
+    assert response.closed
+
+
+def test_missing_field_reads_to_the_byte_limit():
+    """Without coordinates the page is read further, but not past max_bytes."""
+    page = HEAD.replace('window.spot_info', 'window.other') + TAIL
+    watcher = SpotPageWatcher()
+
+    html = read_page(FakeResponse(page), watcher, max_bytes=64 * 1024, chunk_size=4096)
+
+    assert watcher.found == {'title', 'address', 'description', 'images'}
+    assert 64 * 1024 - 4 < len(html.encode('utf-8')) < 64 * 1024 + 4096
+
+
+def test_scraper_parses_the_prefix():
+    """The scraper parses the streamed prefix into the same fields as the full page."""
+    scraper = HaikyoScraper()
+    scraper.rate_controller = RateController(initial_delay=0.0, min_delay=0.0)
+    limiter = scraper.rate_controller.limiter('haikyo.info')
+    response = FakeResponse(HEAD + TAIL)
+    chunks = response.iter_content
+
+    def iter_content(chunk_size=1):
+        # The host's slot stays taken while the body is read
+        for chunk in chunks(chunk_size):
+            assert limiter.in_flight == 1
+            yield chunk
+
+    response.iter_content = iter_content
+    scraper.session = type('Session', (), {'get': lambda self, url, **kwargs: response})()
+
+    response, html = scraper.fetch_spot_page('https://haikyo.info/s/1.html')
+    data = scraper.parse_location_page(html, 'https://haikyo.info/s/1.html', translate=False)
+
+    assert data['title'] == '廃ホテル'
+    assert data['coordinates'] == {'lat': 43.1, 'lng': 141.3}
+    assert response.read < 10
+    assert limiter.in_flight == 0
+
+
+def test_fields_split_across_tiny_chunks():
+    """Tags and markers split across chunks are found, and scanned text does not pile up."""
+    watcher = SpotPageWatcher()
+    page = '<p>前置き</p>' * 2000 + HEAD + TAIL
+    for start in range(0, len(page), 3):
+        if watcher.feed(page[start:start + 3]):
+            break
+
+    assert watcher.complete
+    assert watcher.text == page[:len(watcher.text)]
+    assert len(watcher._window) < OVERLAP + 200
@@ -0,0 +1,67 @@
+"""
+Tests for the in-process sampling profiler.
+"""
+
+import time
+import threading
+from collections import Counter
+
+import pytest
+
+from profiling import SamplingProfiler, ProfilerBusy, collapse
+
+
+def busy_worker(stop):
+    """Spin until told to stop."""
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_profile_samples_other_threads():
+    """Stacks of background threads are sampled, rooted at the thread name."""
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_worker, args=(stop,), name='scrape-worker')
+    worker.start()
+    try:
+        stacks = SamplingProfiler(interval=0.001).profile(0.2)
+    finally:
+        stop.set()
+        worker.join()
+
+    worker_stacks = [stack for stack in stacks if stack.startswith('scrape-worker;')]
+    assert worker_stacks
+    assert any('busy_worker (test_profiling.py:' in stack for stack in worker_stacks)
+    # Neither the sampler nor the thread waiting for it is profiled
+    assert not any('_sample (profiling.py:' in stack or 'profile (profiling.py:' in stack for stack in stacks)
+
+
+def test_collapse_orders_by_count():
+    """Collapsed output has one 'stack count' line per stack, most frequent first."""
+    assert collapse(Counter({'main;a': 1, 'main;a;b': 3})) == "main;a;b 3\nmain;a 1\n"
+
+
+def test_concurrent_profiles_are_rejected():
+    """Only one profile runs at a time."""
+    profiler = SamplingProfiler()
+    started = threading.Event()
+    original = profiler.sample_once
+
+    def sample_once(stacks, skip=()):
+        started.set()
+        original(stacks, skip)
+
+    profiler.sample_once = sample_once
+    thread = threading.Thread(target=profiler.profile, args=(0.3,))
+    thread.start()
+    started.wait()
+    with pytest.raises(ProfilerBusy):
+        profiler.profile(0.1)
+    thread.join()
+
+
+def test_profiles_are_capped(monkeypatch):
+    """A profile longer than MAX_SECONDS stops at the cap."""
+    monkeypatch.setattr('profiling.MAX_SECONDS', 0.05)
+    started = time.monotonic()
+    SamplingProfiler(interval=0.001).profile(60)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,84 @@
+"""
+Tests for the coalesced progress reporter.
+"""
+
+import time
+import threading
+
+from progress import ProgressReporter
+from state_store import MemoryStateStore
+
+
+def test_latest_value_wins():
+    """A burst of updates collapses into the most recent one."""
+    reporter = ProgressReporter()
+    for i in range(1000):
+        reporter.update(i / 10, f"Step {i}", 'scraping')
+
+    snapshot = reporter.snapshot()
+    assert snapshot['progress'] == 99.9
+    assert snapshot['message'] == "Step 999"
+    assert snapshot['status'] == 'scraping'
+
+    # Status is kept when an update does not change it
+    reporter.update(100, "Done")
+    assert reporter.snapshot()['status'] == 'scraping'
+
+
+def test_stage_counters_and_version():
+    """Concurrent stage increments are all counted and bump the version."""
+    reporter = ProgressReporter()
+    version = reporter.version
+
+    def work():
+        for _ in range(500):
+            reporter.increment('fetched')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = reporter.snapshot()
+    assert snapshot['stages']['fetched'] == 2000
+    assert snapshot['version'] > version
+
+    reporter.reset("Scraping...", 'scraping')
+    assert reporter.snapshot()['stages']['fetched'] == 0
+
+
+def test_update_waits_for_a_reset_in_progress():
+    """An update reads and replaces the state under the lock reset() holds."""
+    reporter = ProgressReporter(status='scraping')
+    with reporter._lock:
+        updater = threading.Thread(target=reporter.update, args=(50, "Halfway"))
+        updater.start()
+        updater.join(0.05)
+        assert updater.is_alive()
+        # What a concurrent reset() does while holding the lock
+        reporter._latest = (0, "Ready", 'ready')
+    updater.join()
+
+    assert (reporter.snapshot()['message'], reporter.snapshot()['status']) == ("Halfway", 'ready')
+
+
+def test_store_writes_are_throttled():
+    """A burst of updates is published in a few writes, the last one carrying the latest state."""
+    class CountingStore(MemoryStateStore):
+        writes = 0
+
+        def update(self, key, fn, default=None):
+            CountingStore.writes += 1
+            return super().update(key, fn, default)
+
+    store = CountingStore()
+    reporter = ProgressReporter(store=store, publish_interval=0.05)
+    for i in range(1000):
+        reporter.update(i / 10, f"Step {i}", 'scraping')
+        reporter.increment('fetched')
+    time.sleep(0.2)
+
+    assert CountingStore.writes <= 5
+    snapshot = store.get('progress')
+    assert (snapshot['message'], snapshot['stages']['fetched']) == ("Step 999", 1000)
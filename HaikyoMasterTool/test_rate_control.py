@@ -0,0 +1,106 @@
+"""
+Tests for the adaptive per-host rate controller.
+"""
+
+import time
+
+import pytest
+
+from rate_control import MIN_DELAY, HostLimiter, RateController, parse_retry_after
+
+
+def test_limit_grows_on_success_and_halves_on_throttle():
+    """Successful requests raise the limit, throttled ones cut it in half."""
+    limiter = HostLimiter(initial_limit=2, max_limit=8, initial_delay=0.0, min_delay=0.0)
+    for _ in range(20):
+        limiter.release(limiter.acquire())
+    grown = limiter.limit
+    assert grown > 4
+
+    limiter.release(limiter.acquire(), 'throttled', retry_after=0)
+    assert limiter.limit == pytest.approx(grown / 2)
+    assert limiter.delay >= 0.25
+
+
+def test_limit_respects_bounds():
+    """The limit never leaves the configured range."""
+    limiter = HostLimiter(initial_limit=1, min_limit=1, max_limit=3, initial_delay=0.0, min_delay=0.0)
+    for _ in range(50):
+        limiter.release(limiter.acquire())
+    assert limiter.limit == 3
+    for _ in range(5):
+        limiter.release(limiter.acquire(), 'failed', retry_after=0)
+    assert limiter.limit == 1
+
+
+def test_slot_reports_exceptions_as_failures():
+    """An exception inside a slot backs the host off."""
+    controller = RateController(initial_limit=4, initial_delay=0.0, min_delay=0.0)
+    with pytest.raises(TimeoutError):
+        with controller.slot('haikyo.info'):
+            raise TimeoutError()
+    limiter = controller.limiter('haikyo.info')
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_stream_holds_the_slot_while_reading():
+    """A streamed body is read inside the slot; a read error backs the host off."""
+    controller = RateController(initial_limit=4, initial_delay=0.0, min_delay=0.0)
+    limiter = controller.limiter('haikyo.info')
+
+    class Response:
+        status_code = 200
+        headers = {}
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    session = type('Session', (), {'get': lambda self, url, **kwargs: Response()})()
+    with controller.stream(session, 'https://haikyo.info/s/1.html') as response:
+        assert limiter.in_flight == 1
+    assert response.closed and limiter.in_flight == 0
+
+    with pytest.raises(ConnectionError):
+        with controller.stream(session, 'https://haikyo.info/s/1.html'):
+            raise ConnectionError()
+    assert limiter.limit < 4
+    assert limiter.in_flight == 0
+
+
+def test_nominatim_is_limited_to_one_request():
+    """Per-host settings keep Nominatim at one request at a time."""
+    limiter = RateController().limiter('nominatim.openstreetmap.org')
+    assert limiter.max_limit == 1
+    assert limiter.min_delay == 1.0
+
+
+def test_delay_never_decays_below_the_floor():
+    """Successful requests shorten the gap between requests only down to MIN_DELAY."""
+    limiter = HostLimiter(initial_delay=1.0)
+    for _ in range(100):
+        limiter.in_flight += 1
+        limiter.release(time.monotonic())
+    assert limiter.delay == pytest.approx(MIN_DELAY)
+
+
+def test_shared_budget_is_split_between_processes():
+    """Each of several processes gets its share of a host's concurrency and rate."""
+    controller = RateController(max_limit=8)
+    controller.share(4)
+    limiter = controller.limiter('haikyo.info')
+    assert limiter.max_limit == 2
+    assert limiter.min_delay == pytest.approx(4 * MIN_DELAY)
+
+    nominatim = controller.limiter('nominatim.openstreetmap.org')
+    assert nominatim.max_limit == 1
+    assert nominatim.min_delay == 4.0
+
+
+def test_parse_retry_after():
+    """Both delta-seconds and HTTP dates are understood."""
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert parse_retry_after('soon') is None
@@ -0,0 +1,90 @@
+"""
+Tests for the search result cache and paginated search fetching.
+"""
+
+import requests
+
+from search_cache import SearchCache, normalize_term
+from scraper import HaikyoScraper
+
+
+def result_page(spot_ids, page_count):
+    """Build a minimal haikyo.info search result page."""
+    lines = "".join(f'<div class="list_line"><div class="list_title"><a href="/s/{spot_id}.html">x</a></div></div>'
+                    for spot_id in spot_ids)
+    pages = "".join(f'<li><a class="page-link" href="https://haikyo.info/search.php?sw=x&amp;page={page}">{page}</a></li>'
+                    for page in range(2, page_count + 1))
+    return f'<html><body>{lines}<ul class="pagination">{pages}</ul></body></html>'
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+def test_normalized_terms_share_entries():
+    """Width, case and whitespace variants of a term hit the same entry."""
+    cache = SearchCache(ttl=60)
+    cache.put('東京　都', ['1'])
+    assert cache.get(' 東京 都') == ['1']
+    cache.put('Ｔｏｋｙｏ', ['2'])
+    assert cache.get('tokyo') == ['2']
+    assert normalize_term('  A   b ') == 'a b'
+
+    expired = SearchCache(ttl=-1)
+    expired.put('x', ['1'])
+    assert expired.get('x') is None
+
+
+def test_search_fetches_all_pages_and_caches():
+    """Every result page is fetched once, merged in order, and served from cache on repeat."""
+    pages = {1: result_page([1, 2], 3), 2: result_page([3, 4], 3), 3: result_page([5, 2], 3)}
+    fetched = []
+
+    def fetch(url, timeout=30):
+        fetched.append(url)
+        page = int(url.split('page=')[1]) if 'page=' in url else 1
+        return FakeResponse(pages[page])
+
+    scraper = HaikyoScraper()
+    scraper.fetch = fetch
+
+    urls = scraper.search_locations('Tokyo')
+    assert urls == [f"https://haikyo.info/s/{spot_id}.html" for spot_id in (1, 2, 3, 4, 5)]
+    assert len(fetched) == 3
+
+    assert scraper.search_locations(' tokyo') == urls
+    assert len(fetched) == 3
+
+
+def test_incomplete_searches_are_not_cached():
+    """A search with a failed page, or cut short by max_pages, is not served to a full search."""
+    pages = {1: result_page([1, 2], 3), 2: result_page([3, 4], 3), 3: result_page([5], 3)}
+    failing = {2}
+    fetched = []
+
+    def fetch(url, timeout=30):
+        page = int(url.split('page=')[1]) if 'page=' in url else 1
+        fetched.append(page)
+        if page in failing:
+            raise requests.ConnectionError("reset")
+        return FakeResponse(pages[page])
+
+    scraper = HaikyoScraper()
+    scraper.fetch = fetch
+    messages = []
+
+    assert len(scraper.search_locations('Tokyo', callback=lambda progress, message: messages.append(message))) == 3
+    assert any('Error fetching result page 2' in message for message in messages)
+
+    failing.clear()
+    assert len(scraper.search_locations('Tokyo', max_pages=2)) == 4
+    fetched.clear()
+    assert len(scraper.search_locations('Tokyo')) == 5
+    assert sorted(fetched) == [1, 2, 3]
+    assert len(scraper.search_locations('Tokyo', max_pages=2)) == 4
+    assert len(fetched) == 3
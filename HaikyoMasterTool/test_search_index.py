@@ -0,0 +1,203 @@
+"""
+Tests for the local full-text search index.
+"""
+
+import math
+import time
+import heapq
+import random
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from search_index import SearchIndex, tokenize
+
+
+def make_index():
+    index = SearchIndex()
+    index.add('a', {'title': '摩耶観光ホテル', 'translated_title': 'Maya Tourist Hotel',
+                    'description': '兵庫県神戸市の廃墟ホテル'}, prefecture='兵庫県', category='ホテル')
+    index.add('b', {'title': '旧松尾鉱山', 'translated_title': 'Former Matsuo Mine',
+                    'description': 'ホテルではない鉱山跡'}, prefecture='岩手県', category='鉱山')
+    index.add('c', {'title': '奈良ドリームランド', 'translated_title': 'Nara Dreamland',
+                    'description': '遊園地'}, prefecture='奈良県', category='遊園地')
+    return index
+
+
+def record_fields(record):
+    return {'title': record}, "", ""
+
+
+def index_spots(path, worker, count):
+    """Append spots to a shared index file from a separate process, compacting it in between."""
+    index = SearchIndex(record_fields)
+    for i in range(count):
+        key = f"{worker}-{i}"
+        index.add_record(key, f"廃墟{worker}{i}")
+        index.append(path, [key])
+        if i % 5 == 4:
+            index.save(path)
+
+
+def test_tokenize_mixes_bigrams_and_words():
+    """Japanese runs become bigrams and Latin text becomes lower-cased words."""
+    assert tokenize('廃墟ホテル Hotel', query=True) == ['廃墟', '墟ホ', 'ホテ', 'テル', 'hotel']
+    # Full-width Latin is folded by NFKC normalization
+    assert tokenize('ＨＯＴＥＬ') == ['hotel']
+
+
+def test_ranked_search_with_prefix_and_filters():
+    """Title matches rank first, prefixes and single characters match, filters narrow."""
+    index = make_index()
+
+    assert [record for _, record in index.search('ホテル')] == ['a', 'b']
+    assert [record for _, record in index.search('dream')] == ['c']
+    assert [record for _, record in index.search('鉱')] == ['b']
+    assert [record for _, record in index.search('ホテル', prefecture='岩手県')] == ['b']
+    assert index.search('ホテル', category='遊園地') == []
+    assert index.search('hotel dreamland') == []
+
+
+def test_replace_and_remove():
+    """Re-adding a key replaces the old document; removed documents disappear."""
+    index = make_index()
+    index.add('a', {'title': '別のスポット'})
+    assert [record for _, record in index.search('ホテル')] == ['b']
+    assert [record for _, record in index.search('スポット')] == ['a']
+
+    assert index.remove('a')
+    assert index.search('スポット') == []
+    assert len(index) == 2
+
+
+def test_tier_search_matches_a_full_scan():
+    """Multi-term searches find the same hits, in the same order, as scoring every document."""
+    rng = random.Random(3)
+    index = SearchIndex()
+    for i in range(2000):
+        index.add(f'k{i}', {'title': ' '.join(rng.choices(['hotel', 'mine', 'park', 'nara'], k=2)),
+                            'description': ' '.join(rng.choices(['hotel', 'mine', 'old', 'park', 'school'], k=6))},
+                  prefecture=f'p{i % 3}')
+    index.remove('k5')
+
+    for query, prefecture in [('hotel mine', None), ('hotel park old', None), ('mine sch', 'p1'), ('nara school', None)]:
+        hits = index.search(query, limit=30, prefecture=prefecture)
+        terms = [index._term_postings(term, term == query.split()[-1]) for term in query.split()]
+        idfs = [math.log(1 + len(index) / len(postings)) for postings in terms]
+        scanned = []
+        for doc_id, key in enumerate(index.keys):
+            if key is None or (prefecture and doc_id not in index.prefectures[prefecture]):
+                continue
+            score = index._score(doc_id, terms, idfs, range(len(terms)))
+            if score is not None:
+                scanned.append((score, -doc_id))
+        assert [record for _, record in hits] == [index.records[-doc_id] for _, doc_id in heapq.nlargest(30, scanned)]
+
+
+@pytest.fixture(scope='module')
+def large_index():
+    """An index the size of a full crawl, with Zipf-distributed words like real text."""
+    rng = random.Random(7)
+    kana = 'アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン'
+    kanji = '廃墟旧跡館場所園地病院学校工場鉱山神社寺村駅線橋道隧川湖海島東西南北京都大阪奈良戸浜台'
+    japanese = list(dict.fromkeys(''.join(rng.choices(kanji + kana, k=rng.randint(2, 4))) for _ in range(4000)))
+    english = ['hotel', 'hospital', 'school', 'mine', 'tunnel', 'park', 'station', 'house', 'factory', 'shrine'] + \
+        list(dict.fromkeys(''.join(rng.choices('abcdefghijklmnoprstuy', k=rng.randint(3, 9))) for _ in range(4000)))
+    japanese_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(japanese) + 1)))
+    english_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(english) + 1)))
+
+    index = SearchIndex()
+    for i in range(200_000):
+        index.add(f'k{i}', {'title': ''.join(rng.choices(japanese, cum_weights=japanese_weights, k=2)),
+                            'translated_title': ' '.join(rng.choices(english, cum_weights=english_weights, k=2)),
+                            'address': f'県{i % 47}' + rng.choice(japanese),
+                            'description': ''.join(rng.choices(japanese, cum_weights=japanese_weights, k=6)),
+                            'translated_description': ' '.join(rng.choices(english, cum_weights=english_weights,
+                                                                           k=6))},
+                  prefecture=f'県{i % 47}', category=f'c{i % 8}')
+    return index, japanese, english
+
+
+def test_search_latency_on_a_full_crawl(large_index):
+    """Typical searches over 200,000 spots answer within 10 ms."""
+    index, japanese, english = large_index
+    queries = [(japanese[0], {}), (japanese[1] + japanese[40], {}), (japanese[300], {}), (japanese[0][:1], {}),
+               (english[0], {}), (english[1][:2], {}), (english[0][:1], {}), (f'{english[0]} {english[1]}', {}),
+               (f'{english[2]} {english[5][:3]}', {}), (f'{japanese[2]} {english[0]}', {}),
+               (japanese[0], {'prefecture': '県3'}), (english[3], {'category': 'c2'})]
+    for query, filters in queries:
+        # The first search of a term builds its impact order
+        assert index.search(query, **filters)
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            index.search(query, **filters)
+            timings.append(time.perf_counter() - start)
+        assert min(timings) < 0.010, f"{query!r} took {min(timings) * 1000:.1f} ms"
+
+
+def test_appended_records_replace_saved_ones(tmp_path):
+    """Records appended after a save are loaded over the saved ones."""
+    path = str(tmp_path / 'index.jsonl')
+    index = make_index()
+    index.save(path)
+    index.add('a', {'title': '別のスポット'}, record='a2')
+    index.add('d', {'title': '新しいスポット'})
+    index.append(path, ['a', 'd', 'missing'])
+
+    loaded = SearchIndex(lambda record: ({'title': '別のスポット' if record == 'a2' else record}, "", ""))
+    assert loaded.load(path) == 5
+    assert len(loaded) == 4
+    assert [record for _, record in loaded.search('別の')] == ['a2']
+
+
+def test_load_reads_only_what_others_appended(tmp_path):
+    """Loading a file again picks up the records another index appended or saved since."""
+    path = str(tmp_path / 'index.jsonl')
+    writer = SearchIndex(record_fields)
+    writer.add_record('a', '摩耶観光ホテル')
+    writer.save(path)
+    reader = SearchIndex(record_fields)
+    assert reader.load(path) == 1
+
+    writer.add_record('b', '旧松尾鉱山')
+    writer.append(path, ['b'])
+    assert writer.load(path) == 0
+    assert reader.load(path) == 1
+    assert [record for _, record in reader.search('鉱山')] == ['旧松尾鉱山']
+
+    # A rewritten file is read again from the start
+    writer.add_record('c', '奈良ドリームランド')
+    writer.save(path)
+    assert reader.load(path) == 3
+    assert len(reader) == 3
+
+
+def test_concurrent_saves_keep_every_process_records(tmp_path):
+    """Processes appending to and rewriting one file lose none of each other's records."""
+    path = str(tmp_path / 'index.jsonl')
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        list(pool.map(index_spots, [path] * 3, range(3), [20] * 3))
+
+    index = SearchIndex(record_fields)
+    index.load(path)
+    assert len(index) == 60
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_prefix_searches_see_added_documents():
+    """Documents added after a prefix search are found, and scored, as if added before it."""
+    index = make_index()
+    assert [record for _, record in index.search('ma')] == ['a', 'b']
+    assert index.search('m')
+    rebuilt = make_index()
+    for search_index in (index, rebuilt):
+        search_index.add('d', {'title': 'Maya Mine'})
+        search_index.add('e', {'title': 'Former Matsuo Hotel'})
+    assert sorted(record for _, record in index.search('ma')) == ['a', 'b', 'd', 'e']
+    assert index.search('ma') == rebuilt.search('ma')
+    assert index.search('m') == rebuilt.search('m')
+    assert [record for _, record in index.search('ドリ')] == ['c']
+    index.add('f', {'title': 'ドリル工場'})
+    assert sorted(record for _, record in index.search('ド')) == ['c', 'f']
@@ -0,0 +1,11 @@
+"""
+Tests for the serving options.
+"""
+
+import serving
+
+
+def test_debugger_is_opt_in():
+    """The development server only runs the Werkzeug debugger with --debug."""
+    assert serving.parse_args([]).debug is False
+    assert serving.parse_args(['--debug', '--host', '127.0.0.1']).debug is True
@@ -0,0 +1,60 @@
+"""
+Tests for coalescing concurrent calls with the same key.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    """Callers for a key in flight wait for that call and get its result."""
+    flights = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch(url):
+        calls.append(url)
+        started.set()
+        release.wait(5)
+        return f"page {url}"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(flights.do, 'a', fetch, 'a')
+        started.wait(5)
+        others = [pool.submit(flights.do, 'a', fetch, 'a') for _ in range(3)]
+        other_key = pool.submit(flights.do, 'b', lambda: 'page b')
+        assert other_key.result(5) == 'page b'
+        release.set()
+        results = [first.result(5)] + [future.result(5) for future in others]
+
+    assert calls == ['a']
+    assert results == ['page a'] * 4
+    assert flights.in_flight() == 0
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    """A failing call raises in every waiting caller; the next call runs again."""
+    flights = SingleFlight('test')
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(flights.do, 'a', fail)
+        started.wait(5)
+        joined = pool.submit(flights.do, 'a', fail)
+        release.set()
+        for future in (first, joined):
+            with pytest.raises(ValueError):
+                future.result(5)
+
+    assert flights.do('a', lambda: 'ok') == 'ok'
@@ -0,0 +1,62 @@
+"""
+Tests that importing the web app stays cheap.
+"""
+
+import os
+import sys
+import tempfile
+import subprocess
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ('bs4', 'googletrans', 'simplekml', 'httpx')
+
+# Generous wall-clock budget for importing the app in a fresh interpreter
+IMPORT_BUDGET_SECONDS = 3.0
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_python(code):
+    """Run code in a fresh interpreter in a scratch directory and return its last output line."""
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    with tempfile.TemporaryDirectory() as scratch:
+        result = subprocess.run([sys.executable, '-c', code], cwd=scratch, env=env,
+                                capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_app_import_defers_heavy_modules():
+    """Importing the app loads none of the heavy scraping and KML modules."""
+    loaded = run_python(
+        "import sys, app\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+    assert loaded == "[]"
+
+
+def test_app_import_time_budget():
+    """The app imports within the startup budget."""
+    elapsed = float(run_python(
+        "import time\n"
+        "started = time.perf_counter()\n"
+        "import app\n"
+        "print(time.perf_counter() - started)"))
+    assert elapsed < IMPORT_BUDGET_SECONDS
+
+
+def test_app_import_touches_no_files():
+    """Importing the app opens no store and creates no directories in the working directory."""
+    created = run_python(
+        "import os, app\n"
+        "print(sorted(os.listdir('.')))")
+    assert created == "[]"
+
+
+def test_components_are_created_on_first_use():
+    """The scraper is built on first use and its translator only when translating."""
+    created = run_python(
+        "import sys, app\n"
+        "scraper = app.get_scraper()\n"
+        "assert app.get_scraper() is scraper and scraper.reporter is app.get_progress_reporter()\n"
+        "print('googletrans' in sys.modules)")
+    assert created == "False"
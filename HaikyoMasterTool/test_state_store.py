@@ -0,0 +1,57 @@
+"""
+Tests for the state stores shared by web app workers.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from progress import ProgressReporter
+from state_store import MemoryStateStore, SQLiteStateStore, open_state_store
+
+
+def increment(path, times):
+    """Increment a counter in a SQLite store from a separate process."""
+    store = SQLiteStateStore(path)
+    for _ in range(times):
+        store.update('count', lambda count: count + 1, 0)
+
+
+@pytest.mark.parametrize('kind', ['memory', 'sqlite'])
+def test_values_are_copies(kind, tmp_path):
+    """Values read back equal what was written; changing them needs a write."""
+    store = open_state_store('memory' if kind == 'memory' else f"sqlite:///{tmp_path / 'state.db'}")
+    store.set('locations', [{'url': 'https://haikyo.info/s/1.html'}])
+
+    locations = store.get('locations')
+    locations.append({'url': 'https://haikyo.info/s/2.html'})
+    assert len(store.get('locations')) == 1
+
+    assert store.update('locations', lambda saved: saved + locations[1:])[1]['url'].endswith('2.html')
+    assert store.pop('locations') == locations
+    assert store.get('locations', []) == []
+
+
+def test_sqlite_updates_are_atomic_across_processes(tmp_path):
+    """Concurrent read-modify-writes from several processes are all kept."""
+    path = str(tmp_path / 'state.db')
+    store = SQLiteStateStore(path)
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        list(pool.map(increment, [path] * 3, [50] * 3))
+    assert store.get('count') == 150
+
+
+def test_progress_is_shared_through_the_store(tmp_path):
+    """A reporter in another worker sees the progress another one published."""
+    path = str(tmp_path / 'state.db')
+    worker = ProgressReporter(store=SQLiteStateStore(path))
+    poller = ProgressReporter(store=SQLiteStateStore(path))
+    worker.reset("Scraping selected locations...", 'scraping')
+    worker.increment('fetched', 3)
+    worker.update(50, "Scraping location 2 of 4")
+    worker.flush()
+
+    snapshot = poller.snapshot()
+    assert (snapshot['progress'], snapshot['status'], snapshot['stages']['fetched']) == (50, 'scraping', 3)
+    assert snapshot['version'] >= 1
+    assert ProgressReporter(store=MemoryStateStore()).snapshot()['status'] == 'ready'
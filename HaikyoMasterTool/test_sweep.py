@@ -0,0 +1,75 @@
+"""
+Tests for the sweep store and shard partitioning.
+"""
+
+import os
+import time
+
+import sweep
+from sweep import SweepStore, SiteSweeper, STATUS_OK, STATUS_MISSING, STATUS_ERROR
+
+
+def test_store_tracks_completed_pages(tmp_path):
+    """Only successful and missing pages count as completed."""
+    store = SweepStore(str(tmp_path / 'sweep.db'))
+    store.save('https://haikyo.info/s/2.html', STATUS_OK, {'title': 'b'})
+    store.save('https://haikyo.info/s/1.html', STATUS_OK, {'title': 'a'})
+    store.save('https://haikyo.info/s/3.html', STATUS_MISSING)
+    store.save('https://haikyo.info/s/4.html', STATUS_ERROR, error='timeout')
+
+    assert store.completed_urls() == {
+        'https://haikyo.info/s/1.html': STATUS_OK,
+        'https://haikyo.info/s/2.html': STATUS_OK,
+        'https://haikyo.info/s/3.html': STATUS_MISSING
+    }
+    assert store.counts() == {STATUS_OK: 2, STATUS_MISSING: 1, STATUS_ERROR: 1}
+    assert [loc['title'] for loc in store.locations()] == ['a', 'b']
+
+    # A retried page replaces its earlier error
+    saved = time.time()
+    store.save('https://haikyo.info/s/4.html', STATUS_OK, {'title': 'd'})
+    assert store.counts() == {STATUS_OK: 3, STATUS_MISSING: 1}
+    assert [loc['title'] for loc in store.locations(since=saved)] == ['d']
+    store.close()
+
+
+def test_partition_covers_every_url():
+    """Shards cover all URLs in order without overlap."""
+    sweeper = SiteSweeper('unused.db', shard_size=3)
+    urls = [f'https://haikyo.info/s/{i}.html' for i in range(8)]
+    shards = sweeper.partition(urls)
+    assert [len(shard) for shard in shards] == [3, 3, 2]
+    assert sum(shards, []) == urls
+
+
+def test_duplicate_urls_are_not_counted_as_skipped(tmp_path):
+    """Only distinct URLs already in the store count as skipped."""
+    path = str(tmp_path / 'sweep.db')
+    store = SweepStore(path)
+    store.save('https://haikyo.info/s/1.html', STATUS_OK, {'title': 'a'})
+    store.close()
+
+    summary = SiteSweeper(path, workers=1).sweep_urls(['https://haikyo.info/s/1.html'] * 3)
+
+    assert (summary['skipped'], summary['failed'], summary['shard_errors']) == (1, [], [])
+
+
+def crash_once(urls):
+    """Stand-in for _sweep_shard whose worker dies the first time it sees a crash page."""
+    marker = os.environ['SWEEP_CRASH_MARKER']
+    if any(url.endswith('crash') for url in urls) and not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return {'ok': len(urls), 'missing': 0, 'failed': []}
+
+
+def test_crashed_workers_are_retried_in_a_new_pool(tmp_path, monkeypatch):
+    """A worker process that dies breaks the pool; its pages are retried in a fresh one."""
+    monkeypatch.setenv('SWEEP_CRASH_MARKER', str(tmp_path / 'crashed'))
+    monkeypatch.setattr(sweep, '_sweep_shard', crash_once)
+    urls = ['https://haikyo.info/s/1.html', 'https://haikyo.info/s/crash', 'https://haikyo.info/s/3.html']
+
+    summary = SiteSweeper(str(tmp_path / 'sweep.db'), workers=2, shard_size=1).sweep_urls(urls)
+
+    assert (summary['ok'], summary['failed']) == (3, [])
+    assert summary['shard_errors']
@@ -0,0 +1,54 @@
+"""
+Tests for per-job span tracing.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import tracing
+
+
+def test_spans_are_recorded_per_job():
+    """Spans, timed stages and propagated worker spans end up in the job trace."""
+    def work(n):
+        with tracing.span('worker', n=n):
+            return n
+
+    with tracing.record('test', enabled=True) as trace:
+        with tracing.span('outer', url='https://haikyo.info/s/1.html'):
+            with metrics.timed('fetch'):
+                pass
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            assert list(pool.map(tracing.propagate(work), [1, 2])) == [1, 2]
+
+    data = json.loads(tracing.store.get(trace.job_id).to_json())
+    spans = [event for event in data['traceEvents'] if event['ph'] == 'X']
+    names = [event['name'] for event in spans]
+    assert names.count('worker') == 2
+    assert {'outer', 'fetch', 'test'} <= set(names)
+    outer = next(event for event in spans if event['name'] == 'outer')
+    fetch = next(event for event in spans if event['name'] == 'fetch')
+    assert outer['args']['url'] == 'https://haikyo.info/s/1.html'
+    assert outer['ts'] <= fetch['ts'] and fetch['dur'] <= outer['dur']
+    assert data['otherData']['job_id'] == trace.job_id
+    assert tracing.current() is None
+
+
+def test_disabled_tracing_records_nothing():
+    """Without an active trace, spans are a shared no-op."""
+    with tracing.record('test', enabled=False) as trace:
+        assert trace is None
+        assert tracing.span('a') is tracing.span('b')
+        work = lambda: None
+        assert tracing.propagate(work) is work
+
+
+def test_store_keeps_newest_traces():
+    """The store drops the oldest trace when full."""
+    store = tracing.TraceStore(max_traces=2)
+    for job_id in ('a', 'b', 'c'):
+        store.put(tracing.Trace(job_id, 'test'))
+
+    assert store.get('a') is None
+    assert [summary['job_id'] for summary in store.summaries()] == ['c', 'b']
@@ -6,9 +6,10 @@ import os
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import threading
-import time
 from scraper import HaikyoScraper
 from kml_generator import KMLGenerator
+from results_view import VirtualResultsView
+from progress import ProgressReporter
 
 class HaikyoApplication:
     """Main UI class for the Haikyo Locator application."""
@@ -23,7 +24,9 @@ class HaikyoApplication:
         self.root = root
         self.scraper = HaikyoScraper()
         self.kml_generator = KMLGenerator()
-        self.locations = []
+        # Workers write progress here; the UI renders it at a fixed frame rate
+        self.progress = ProgressReporter()
+        self.scraper.reporter = self.progress
         self.search_thread = None
         self.scrape_thread = None
         self.generate_kml_thread = None
@@ -31,6 +34,7 @@ class HaikyoApplication:
         # Set up the UI
         self._create_widgets()
         self._setup_layout()
+        self.progress.attach_tk(self.root, self._update_status_ui, fps=10)
     
     def _create_widgets(self):
         """Create all UI widgets."""
@@ -46,26 +50,21 @@ class HaikyoApplication:
         # Results section
         self.results_frame = ttk.LabelFrame(self.main_frame, text="Search Results", padding="10")
         
-        # Create a frame for the treeview and scrollbar
-        self.tree_frame = ttk.Frame(self.results_frame)
-        
-        # Create treeview widget with scrollbars
-        self.tree_columns = ("title", "url", "coordinates")
-        self.tree = ttk.Treeview(self.tree_frame, columns=self.tree_columns, show="headings", selectmode="extended")
-        
-        # Set column headings
-        self.tree.heading("title", text="Location Name")
-        self.tree.heading("url", text="URL")
-        self.tree.heading("coordinates", text="Coordinates")
-        
-        # Set column widths
-        self.tree.column("title", width=200, minwidth=150)
-        self.tree.column("url", width=300, minwidth=200)
-        self.tree.column("coordinates", width=150, minwidth=100)
-        
-        # Add scrollbars to the treeview
-        self.tree_yscroll = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=self.tree_yscroll.set)
+        # Filter box for narrowing down the results
+        self.filter_frame = ttk.Frame(self.results_frame)
+        self.filter_label = ttk.Label(self.filter_frame, text="Filter:")
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add('write', lambda *args: self.results_view.set_filter(self.filter_var.get()))
+        self.filter_entry = ttk.Entry(self.filter_frame, textvariable=self.filter_var, width=40)
+        
+        # Virtualized results list; only the visible rows exist as Treeview items.
+        # Each row is a location dictionary, keyed by its URL.
+        self.results_view = VirtualResultsView(
+            self.results_frame,
+            columns=[("title", "Location Name", 200), ("url", "URL", 300), ("coordinates", "Coordinates", 150)],
+            formatter=self._format_row,
+            on_select=self._show_details
+        )
         
         # Actions section
         self.actions_frame = ttk.Frame(self.results_frame)
@@ -84,9 +83,7 @@ class HaikyoApplication:
         self.progress_bar = ttk.Progressbar(self.progress_frame, orient=tk.HORIZONTAL, length=400, mode='determinate')
         self.status_label = ttk.Label(self.progress_frame, text="Ready")
         
-        # Bind treeview selection event
-        self.tree.bind('<<TreeviewSelect>>', self._on_tree_select)
-        
+
     def _setup_layout(self):
         """Arrange all widgets using the grid layout manager."""
         # Main frame
@@ -103,13 +100,14 @@ class HaikyoApplication:
         # Results section
         self.results_frame.grid(column=0, row=1, sticky=(tk.N, tk.W, tk.E, tk.S), padx=5, pady=5)
         
-        # Tree frame
-        self.tree_frame.grid(column=0, row=0, sticky=(tk.N, tk.W, tk.E, tk.S), padx=5, pady=5)
-        self.tree.grid(column=0, row=0, sticky=(tk.N, tk.W, tk.E, tk.S))
-        self.tree_yscroll.grid(column=1, row=0, sticky=(tk.N, tk.S))
+        # Filter and results list
+        self.filter_frame.grid(column=0, row=0, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.filter_label.grid(column=0, row=0, sticky=tk.W, padx=5)
+        self.filter_entry.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
+        self.results_view.grid(column=0, row=1, sticky=(tk.N, tk.W, tk.E, tk.S), padx=5, pady=5)
         
         # Actions section
-        self.actions_frame.grid(column=0, row=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.actions_frame.grid(column=0, row=2, sticky=(tk.W, tk.E), padx=5, pady=5)
         self.select_all_button.grid(column=0, row=0, sticky=tk.W, padx=5, pady=5)
         self.select_none_button.grid(column=1, row=0, sticky=tk.W, padx=5, pady=5)
         self.scrape_button.grid(column=2, row=0, sticky=tk.E, padx=5, pady=5)
@@ -128,9 +126,8 @@ class HaikyoApplication:
         self.main_frame.columnconfigure(0, weight=1)
         self.search_frame.columnconfigure(1, weight=1)
         self.results_frame.columnconfigure(0, weight=1)
-        self.results_frame.rowconfigure(0, weight=1)
-        self.tree_frame.columnconfigure(0, weight=1)
-        self.tree_frame.rowconfigure(0, weight=1)
+        self.results_frame.rowconfigure(1, weight=1)
+        self.filter_frame.columnconfigure(1, weight=1)
         self.details_frame.columnconfigure(0, weight=1)
         self.progress_frame.columnconfigure(0, weight=1)
     
@@ -166,28 +163,18 @@ class HaikyoApplication:
             # Perform the search
             urls = self.scraper.search_locations(search_term, self._update_status)
             
-            # Get basic details for each URL
-            for i, url in enumerate(urls):
-                progress = (i + 1) / len(urls) * 100
-                self._update_status(progress, f"Processing search result {i+1} of {len(urls)}")
-                
+            # Hand the results to the list view; it inserts them in batches on the UI thread
+            for url in urls:
                 # Extract basic info from URL
                 title = url.split('/')[-1].replace('-', ' ').title()
                 
-                # Add to the treeview
-                self._add_to_treeview(title, url, "Click 'Scrape Selected' to get coordinates")
-                
-                # Add to locations list
-                self.locations.append({
+                self.results_view.submit({
                     'title': title,
                     'url': url,
                     'coordinates': None,
                     'description': "",
                     'images': []
                 })
-                
-                # Pause briefly to allow UI updates
-                time.sleep(0.1)
             
             # Update status
             if len(urls) > 0:
@@ -205,8 +192,8 @@ class HaikyoApplication:
     def _start_scraping(self):
         """Start scraping selected locations in a separate thread."""
         # Get selected items
-        selected_items = self.tree.selection()
-        if not selected_items:
+        selected_urls = [location['url'] for location in self.results_view.selected_rows()]
+        if not selected_urls:
             messagebox.showwarning("Warning", "Please select at least one location to scrape.")
             return
         
@@ -215,48 +202,27 @@ class HaikyoApplication:
         self.search_button.config(state=tk.DISABLED)
         
         # Start the scraping in a separate thread
-        self.scrape_thread = threading.Thread(target=self._scrape_task, args=(selected_items,))
+        self.scrape_thread = threading.Thread(target=self._scrape_task, args=(selected_urls,))
         self.scrape_thread.daemon = True
         self.scrape_thread.start()
     
-    def _scrape_task(self, selected_items):
+    def _scrape_task(self, selected_urls):
         """
         Perform the scraping task in a background thread.
         
         Args:
-            selected_items (list): List of selected tree item IDs.
+            selected_urls (list): URLs of the selected locations.
         """
         try:
             # Update status
-            self._update_status(0, "Scraping selected locations...")
-            
-            selected_urls = []
-            selected_indices = []
-            
-            # Get URLs for selected items
-            for item_id in selected_items:
-                item_values = self.tree.item(item_id, 'values')
-                url = item_values[1]  # URL is in the second column
-                
-                # Find the corresponding index in the locations list
-                for i, location in enumerate(self.locations):
-                    if location['url'] == url:
-                        selected_urls.append(url)
-                        selected_indices.append(i)
-                        break
+            self.progress.reset("Scraping selected locations...", 'scraping')
             
             # Scrape location details
             scraped_locations = self.scraper.scrape_batch(selected_urls, self._update_status)
             
-            # Update locations list and treeview with scraped data
-            for i, location_data in enumerate(scraped_locations):
-                index = selected_indices[i]
-                self.locations[index] = location_data
-                
-                # Update the treeview
-                item_id = selected_items[i]
-                coords_text = f"{location_data['coordinates']['lat']}, {location_data['coordinates']['lng']}"
-                self.tree.item(item_id, values=(location_data['title'], location_data['url'], coords_text))
+            # Replace the rows in the list view with the scraped data
+            for location_data in scraped_locations:
+                self.results_view.submit(location_data)
             
             # Update status
             self._update_status(100, f"Scraped {len(scraped_locations)} locations")
@@ -272,7 +238,7 @@ class HaikyoApplication:
     def _start_generate_kml(self):
         """Start generating KML file in a separate thread."""
         # Check if we have locations with coordinates
-        valid_locations = [loc for loc in self.locations if loc['coordinates'] and 
+        valid_locations = [loc for loc in self.results_view.rows if loc['coordinates'] and 
                           (loc['coordinates']['lat'] != 0 or loc['coordinates']['lng'] != 0)]
         
         if not valid_locations:
@@ -282,7 +248,7 @@ class HaikyoApplication:
         # Ask for output file location
         output_file = filedialog.asksaveasfilename(
             defaultextension=".kml",
-            filetypes=[("KML files", "*.kml"), ("All files", "*.*")],
+            filetypes=[("KML files", "*.kml"), ("KMZ files with images", "*.kmz"), ("All files", "*.*")],
             title="Save KML File"
         )
         
@@ -292,24 +258,26 @@ class HaikyoApplication:
         # Disable button during KML generation
         self.generate_kml_button.config(state=tk.DISABLED)
         
-        # Start the KML generation in a separate thread
-        self.generate_kml_thread = threading.Thread(target=self._generate_kml_task, args=(output_file,))
+        # Start the KML generation in a separate thread, on a snapshot of the rows
+        self.generate_kml_thread = threading.Thread(target=self._generate_kml_task,
+                                                    args=(output_file, list(self.results_view.rows)))
         self.generate_kml_thread.daemon = True
         self.generate_kml_thread.start()
     
-    def _generate_kml_task(self, output_file):
+    def _generate_kml_task(self, output_file, locations):
         """
         Generate KML file in a background thread.
         
         Args:
             output_file (str): Path to save the KML file.
+            locations (list): The locations to export.
         """
         try:
             # Update status
             self._update_status(0, "Generating KML file...")
             
             # Generate KML file
-            success = self.kml_generator.generate_kml(self.locations, output_file, self._update_status)
+            success = self.kml_generator.generate_kml(locations, output_file, self._update_status)
             
             if success:
                 self._update_status(100, f"KML file generated successfully: {os.path.basename(output_file)}")
@@ -330,69 +298,57 @@ class HaikyoApplication:
         """
         Update the status display from any thread.
         
+        Only the latest value is kept; the UI picks it up on its next frame.
+        
         Args:
             progress (float): Progress value (0-100)
             message (str): Status message
         """
-        self.root.after(0, lambda: self._update_status_ui(progress, message))
+        self.progress.update(progress, message)
     
-    def _update_status_ui(self, progress, message):
+    def _update_status_ui(self, snapshot):
         """
         Update the status UI components.
         
         Args:
-            progress (float): Progress value (0-100)
-            message (str): Status message
+            snapshot (dict): Progress snapshot from the ProgressReporter
         """
-        self.progress_bar['value'] = progress
+        self.progress_bar['value'] = snapshot['progress']
+        stages = snapshot['stages']
+        message = snapshot['message']
+        if any(stages.values()):
+            message += "  (" + ", ".join(f"{count} {stage}" for stage, count in stages.items()) + ")"
         self.status_label.config(text=message)
-        self.root.update_idletasks()
     
-    def _add_to_treeview(self, title, url, coordinates):
+    def _format_row(self, location):
         """
-        Add an item to the treeview.
+        Format a location for display in the results list.
         
         Args:
-            title (str): Location title
-            url (str): Location URL
-            coordinates (str): Coordinates as string
+            location (dict): Location dictionary
+            
+        Returns:
+            tuple: (title, url, coordinates) column values
         """
-        self.tree.insert('', tk.END, values=(title, url, coordinates))
+        coords = location.get('coordinates')
+        if coords:
+            coords_text = f"{coords['lat']}, {coords['lng']}"
+        else:
+            coords_text = "Click 'Scrape Selected' to get coordinates"
+        return (location['title'], location['url'], coords_text)
     
     def _clear_results(self):
-        """Clear all results from the treeview and locations list."""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.locations = []
+        """Clear all results from the results list."""
+        self.results_view.clear()
         self._clear_details()
     
     def _select_all(self):
-        """Select all items in the treeview."""
-        for item in self.tree.get_children():
-            self.tree.selection_add(item)
+        """Select all items in the results list."""
+        self.results_view.select_all()
     
     def _select_none(self):
-        """Deselect all items in the treeview."""
-        for item in self.tree.get_children():
-            self.tree.selection_remove(item)
-    
-    def _on_tree_select(self, event):
-        """
-        Handle treeview selection event.
-        
-        Args:
-            event: The Tkinter event object
-        """
-        selected_items = self.tree.selection()
-        if selected_items:
-            item_values = self.tree.item(selected_items[0], 'values')
-            url = item_values[1]  # URL is in the second column
-            
-            # Find the corresponding location
-            for location in self.locations:
-                if location['url'] == url:
-                    self._show_details(location)
-                    break
+        """Deselect all items in the results list."""
+        self.results_view.select_none()
     
     def _show_details(self, location):
         """
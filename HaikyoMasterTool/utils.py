@@ -128,3 +128,19 @@ def sanitize_filename(filename):
         sanitized = "unnamed"
     
     return sanitized
+
+def extract_spot_id(url):
+    """
+    Extract the numeric haikyo.info spot id from a spot URL.
+    
+    Args:
+        url (str): Spot URL, e.g. https://haikyo.info/s/1283.html
+        
+    Returns:
+        str: The spot id, or an empty string if the URL is not a spot page
+    """
+    if not url:
+        return ""
+    
+    match = re.search(r'/s/(\d+)\.html', url) or re.search(r'/explorer/(\d+)/', url)
+    return match.group(1) if match else ""
@@ -0,0 +1,48 @@
+"""
+Module for locking files that several worker processes rewrite.
+
+The search index and the image cache index are files every worker of a
+web app reads and writes. Rewriting one is a read-modify-write: read what
+the other workers added, merge, write a temporary file and move it into
+place. locked() serializes these across processes with an exclusive lock
+on a companion .lock file:
+
+    with locked(path):
+        ...read path, merge, write f"{path}.{os.getpid()}.tmp", os.replace...
+
+The locks are advisory fcntl locks. Without fcntl (on Windows, where the
+apps only run the single-process development server) they only serialize
+the threads of the process.
+"""
+
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Stands in for the file locks when fcntl is not available
+_process_lock = threading.RLock()
+
+
+@contextmanager
+def locked(path):
+    """
+    Hold an exclusive lock on a file for the duration of a with block.
+
+    Args:
+        path (str): Path of the file; the lock is taken on path + '.lock'.
+    """
+    if fcntl is None:
+        with _process_lock:
+            yield
+        return
+    # Each call opens its own descriptor, so threads of one process exclude each other too
+    with open(f"{path}.lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -4,22 +4,37 @@ Handles geocoding of addresses for map visualization.
 """
 
 import re
-import time
-import requests
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
 import logging
 
+import metrics
+from negative_cache import content_digest
+from rate_control import rate_controller
+from singleflight import SingleFlight
+
+# Host used by the Nominatim geocoder, for rate control
+NOMINATIM_HOST = 'nominatim.openstreetmap.org'
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Geocoder:
     """A class to handle geocoding of location addresses."""
     
-    def __init__(self):
-        """Initialize the geocoder."""
+    def __init__(self, negative_cache=None):
+        """
+        Initialize the geocoder.
+        
+        Args:
+            negative_cache (NegativeCache, optional): Remembers locations for which
+                every geocoding query failed, so they are not queried again.
+        """
+        # geopy is imported here rather than at module level to keep startup fast
+        from geopy.geocoders import Nominatim
         self.geolocator = Nominatim(user_agent="haikyo_locator")
         self.cache = {}  # Simple in-memory cache
+        self.negative_cache = negative_cache
+        # Concurrent lookups of the same query share one request
+        self.flights = SingleFlight('geocode')
     
     def _normalize_address(self, address):
         """Normalize address for better geocoding results."""
@@ -55,46 +70,70 @@ class Geocoder:
         """Geocode with retry logic to handle timeouts."""
         if not query:
             return None
+        return self.flights.do(query, self._geocode_query, query, max_retries)
+    
+    def _geocode_query(self, query, max_retries):
+        """Geocode one query, from the cache if possible; see _geocode_with_retry()."""
+        from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited
         
         # Check cache first
-        if query in self.cache:
+        hit = query in self.cache
+        metrics.cache_lookup('geocode', hit)
+        if hit:
             return self.cache[query]
         
         for attempt in range(max_retries):
             try:
-                location = self.geolocator.geocode(query)
+                # The shared rate controller spaces requests and backs off on errors
+                with rate_controller.slot(NOMINATIM_HOST) as slot:
+                    try:
+                        with metrics.timed('geocode'):
+                            location = self.geolocator.geocode(query)
+                    except GeocoderRateLimited as e:
+                        slot.throttle(e.retry_after)
+                        raise
                 if location:
                     coords = (location.latitude, location.longitude)
                     self.cache[query] = coords  # Cache result
                     return coords
-                time.sleep(1)  # Be nice to the geocoding service
-            except (GeocoderTimedOut, GeocoderUnavailable) as e:
+            except (GeocoderTimedOut, GeocoderUnavailable, GeocoderRateLimited) as e:
                 logger.warning(f"Geocoding retry {attempt+1}/{max_retries} for '{query}': {str(e)}")
-                time.sleep(2)  # Wait before retry
             except Exception as e:
                 logger.error(f"Geocoding error for '{query}': {str(e)}")
                 break
         
         return None
     
-    def geocode(self, name, address):
+    def geocode(self, name, address, key=None):
         """
         Geocode a location based on its name and address.
         
         Args:
             name (str): The name of the location
             address (str): The address of the location
+            key (str, optional): Identifies the location (e.g. its URL) in the
+                negative cache; defaults to the name and address
             
         Returns:
             tuple: (latitude, longitude) or None if geocoding fails
         """
-        # Try geocoding with the full address first
         normalized_address = self._normalize_address(address)
-        coords = self._geocode_with_retry(normalized_address)
         
-        # If that fails, try fallback methods
-        if not coords:
-            coords = self._fallback_geocoding(name, normalized_address)
+        # Skip every query for locations that failed before with the same name and address
+        query_text = f"{name}\n{normalized_address}"
+        digest = content_digest(query_text) if self.negative_cache is not None else None
+        if digest is not None and self.negative_cache.is_unresolvable(key or query_text, digest):
+            coords = None
+        else:
+            # Try geocoding with the full address first
+            coords = self._geocode_with_retry(normalized_address)
+            
+            # If that fails, try fallback methods
+            if not coords:
+                coords = self._fallback_geocoding(name, normalized_address)
+            
+            if not coords and digest is not None:
+                self.negative_cache.mark_unresolvable(key or query_text, digest)
         
         # If all geocoding attempts fail, return default coordinates for Japan
         if not coords:
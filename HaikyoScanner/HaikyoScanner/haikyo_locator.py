@@ -4,37 +4,135 @@ HaikyoLocator - A tool for scraping and visualizing abandoned locations in Japan
 from haikyo.info with enhanced search capabilities.
 """
 
+import io
 import os
 import sys
 import re
 import webbrowser
 import json
+import threading
 from urllib.parse import quote, unquote
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, make_response
+from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, redirect, url_for, make_response, Response
 
+import metrics
+import tracing
+import profiling
+import kml_regions
+import serving
 from scraper import Scraper
 from geocoder import Geocoder
 from map_generator import MapGenerator
+from journal import CrawlJournal
+from image_cache import ImageCache
+from search_cache import SearchCache
+# The local search index is maintained in HaikyoMasterTool; import that single copy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'HaikyoMasterTool'))
+from search_index import SearchIndex
+from negative_cache import NegativeCache
+from state_store import open_state_store
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
-# Initialize components
-scraper = Scraper()
-geocoder = Geocoder()
-map_generator = MapGenerator()
+# Popup thumbnails are cached locally and served from /images/
+IMAGE_CACHE_DIR = os.path.join('temp', 'images')
 
-# Data storage
-locations = []
-current_map_path = None
+# Locations that could not be geocoded, persisted between runs
+NEGATIVE_CACHE_PATH = 'unresolvable.db'
 
-# Progress tracking
-progress = {
+# Scraper, geocoder, map generator and image cache are created on first use to keep startup fast
+scraper = None
+geocoder = None
+map_generator = None
+image_cache = None
+components_lock = threading.Lock()
+
+def get_scraper():
+    """Get the shared scraper, creating it on first use."""
+    global scraper
+    with components_lock:
+        if scraper is None:
+            scraper = Scraper()
+        return scraper
+
+def get_geocoder():
+    """Get the shared geocoder, creating it (and importing geopy) on first use."""
+    global geocoder
+    with components_lock:
+        if geocoder is None:
+            # Locations that no geocoding query resolves are not queried again for a while
+            geocoder = Geocoder(NegativeCache(NEGATIVE_CACHE_PATH))
+        return geocoder
+
+def get_image_cache():
+    """Get the shared image cache, loading its index on first use."""
+    global image_cache
+    with components_lock:
+        if image_cache is None:
+            image_cache = ImageCache(IMAGE_CACHE_DIR)
+        return image_cache
+
+def get_map_generator():
+    """Get the shared map generator, creating it on first use."""
+    global map_generator
+    cache = get_image_cache()
+    with components_lock:
+        if map_generator is None:
+            map_generator = MapGenerator(cache)
+        return map_generator
+
+# Locations of the last search ('locations'), its map file ('map_path') and search
+# progress ('progress') live in the state store, shared by every worker process
+state = open_state_store()
+
+# Directory for crawl journals, so interrupted searches can resume
+JOURNAL_DIR = 'journals'
+
+# Finished searches (locations, mapped locations and map file) by search term
+search_cache = SearchCache(ttl=3600, max_entries=64, name='search')
+
+# Local full-text index of every location scraped so far, persisted between runs
+# and shared by the worker processes through the file
+SEARCH_INDEX_PATH = 'spot_index.jsonl'
+search_index = None
+search_index_lock = threading.Lock()
+
+def index_fields(location):
+    """Map a scraped location to search index fields, prefecture and category."""
+    fields = {
+        'title': location.get('name', ""),
+        'address': location.get('address', ""),
+        'description': location.get('description', "")
+    }
+    return fields, location.get('prefecture', ""), location.get('category', "")
+
+def get_search_index():
+    """Get the local search index, with the spots other workers appended to SEARCH_INDEX_PATH."""
+    global search_index
+    with search_index_lock:
+        if search_index is None:
+            index = SearchIndex(index_fields)
+            if os.path.exists(SEARCH_INDEX_PATH):
+                # Searches append their spots; rewrite the file once replaced lines make up half of it
+                if index.load(SEARCH_INDEX_PATH) > 2 * len(index):
+                    index.save(SEARCH_INDEX_PATH)
+            search_index = index
+        elif os.path.exists(SEARCH_INDEX_PATH):
+            # Only reads the lines appended since the last call
+            search_index.load(SEARCH_INDEX_PATH)
+        return search_index
+
+# Progress before the first search
+IDLE_PROGRESS = {
     'progress': 0,
     'current_step': 'Idle',
     'total_locations': 0,
     'processed_locations': 0
 }
 
+def set_progress(**changes):
+    """Update fields of the search progress."""
+    state.update('progress', lambda progress: dict(progress, **changes), IDLE_PROGRESS)
+
 @app.route('/')
 def index():
     """Render the main search page."""
@@ -43,20 +141,15 @@ def index():
 @app.route('/progress', methods=['GET'])
 def get_progress():
     """Return current progress information."""
-    global progress
-    return jsonify(progress)
+    return jsonify(state.get('progress', IDLE_PROGRESS))
 
 @app.route('/search', methods=['POST'])
+@metrics.job('search')
+@tracing.record('search')
 def search():
     """Handle search requests and scrape data."""
     # Reset progress
-    global progress
-    progress = {
-        'progress': 0,
-        'current_step': 'Initializing search',
-        'total_locations': 0,
-        'processed_locations': 0
-    }
+    state.set('progress', dict(IDLE_PROGRESS, current_step='Initializing search'))
     
     # Get search parameters
     search_term = request.form.get('search_term', '')
@@ -85,38 +178,87 @@ def search():
         else:
             url = f"https://haikyo.info/search.php?sw={quote(search_term)}"
     
+    # Local-first mode answers from previously scraped locations without touching the network,
+    # optionally only those in a prefecture or category
+    if request.form.get('local_first'):
+        hits = get_search_index().search(search_term, limit=max_locations,
+                                         prefecture=request.form.get('prefecture', '').strip() or None,
+                                         category=request.form.get('category', '').strip() or None)
+        if hits:
+            locations = [record for score, record in hits]
+            geocoded_locations = [loc for loc in locations if 'latitude' in loc and 'longitude' in loc]
+            state.set('locations', locations)
+            state.set('map_path', get_map_generator().generate_map(geocoded_locations) if geocoded_locations else None)
+            set_progress(current_step="Search complete! (local index)", progress=100)
+            return jsonify({
+                'success': True,
+                'locations_found': len(locations),
+                'locations_mapped': len(geocoded_locations),
+                'redirect': '/map'
+            })
+    
+    # Repeated searches are answered without scraping or geocoding again
+    cache_key = f"{search_term}\n{max_locations}"
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        locations, geocoded_locations, map_path = cached
+        if geocoded_locations and not os.path.exists(map_path or ""):
+            map_path = get_map_generator().generate_map(geocoded_locations)
+            search_cache.put(cache_key, (locations, geocoded_locations, map_path))
+        state.set('locations', locations)
+        state.set('map_path', map_path)
+        set_progress(current_step="Search complete! (cached)", progress=100)
+        return jsonify({
+            'success': True,
+            'locations_found': len(locations),
+            'locations_mapped': len(geocoded_locations),
+            'redirect': '/map'
+        })
+    
+    # Journal finished work so a search interrupted by a restart resumes where it stopped
+    journal = CrawlJournal.for_job(JOURNAL_DIR, f"{url}\n{max_locations}",
+                                   {'url': url, 'max_locations': max_locations})
+    
     try:
         print(f"Searching with URL: {url}, max locations: {max_locations}")
-        progress['current_step'] = f"Searching for abandoned locations at {url}"
-        progress['progress'] = 10
+        set_progress(current_step=f"Searching for abandoned locations at {url}", progress=10)
         
         # Scrape locations with the user-specified maximum
-        global locations
-        locations = scraper.scrape_locations(url, max_pages=max_locations//5 + 1)
+        locations = get_scraper().scrape_locations(url, max_pages=max_locations//5 + 1, journal=journal)
         
         # Limit to max_locations if needed
         if len(locations) > max_locations:
             locations = locations[:max_locations]
         
         print(f"Found {len(locations)} locations before geocoding")
-        progress['current_step'] = f"Found {len(locations)} locations. Starting geocoding..."
-        progress['progress'] = 30
-        progress['total_locations'] = len(locations)
+        set_progress(current_step=f"Found {len(locations)} locations. Starting geocoding...",
+                     progress=30, total_locations=len(locations))
         
         # Geocode locations
         geocoded_locations = []
         for i, location in enumerate(locations):
             # Update progress for each location
             progress_pct = 30 + (i / len(locations) * 50)
-            progress['progress'] = progress_pct
-            progress['processed_locations'] = i
-            progress['current_step'] = f"Geocoding location {i+1}/{len(locations)}: {location.get('name', 'unknown')}"
+            set_progress(progress=progress_pct, processed_locations=i,
+                         current_step=f"Geocoding location {i+1}/{len(locations)}: {location.get('name', 'unknown')}")
+            
+            # Coordinates read from the detail page need no geocoding
+            if 'latitude' in location and 'longitude' in location:
+                geocoded_locations.append(location)
+                print(f"Using page coordinates for: {location.get('name', 'unknown location')}")
+                continue
             
             if not location.get('address'):
                 print(f"No address found for {location.get('name', 'unknown location')}")
                 continue
-                
-            coords = geocoder.geocode(location['name'], location['address'])
+            
+            geocode_key = f"geocode:{location.get('url') or location['address']}"
+            if geocode_key in journal:
+                coords = journal.get(geocode_key)
+            else:
+                coords = get_geocoder().geocode(location['name'], location['address'], key=location.get('url'))
+                if coords:
+                    journal.record(geocode_key, list(coords))
             if coords:
                 location['latitude'] = coords[0]
                 location['longitude'] = coords[1]
@@ -126,18 +268,29 @@ def search():
                 print(f"Failed to geocode: {location['name']}, {location['address']}")
         
         # Generate map if we have geocoded locations
-        progress['current_step'] = "Generating interactive map..."
-        progress['progress'] = 90
+        set_progress(current_step="Generating interactive map...", progress=90)
         
-        global current_map_path
+        map_path = None
         if geocoded_locations:
-            current_map_path = map_generator.generate_map(geocoded_locations)
+            map_path = get_map_generator().generate_map(geocoded_locations)
             print(f"Generated map with {len(geocoded_locations)} locations")
         else:
             print("No locations were successfully geocoded")
         
-        progress['current_step'] = "Search complete!"
-        progress['progress'] = 100
+        state.set('locations', locations)
+        if map_path:
+            state.set('map_path', map_path)
+        set_progress(current_step="Search complete!", progress=100)
+        journal.finish()
+        search_cache.put(cache_key, (locations, geocoded_locations, map_path))
+        
+        # Index the scraped locations for later local searches
+        spot_index = get_search_index()
+        indexed = [location['url'] for location in locations if location.get('url')]
+        for location in locations:
+            if location.get('url'):
+                spot_index.add_record(location['url'], location)
+        spot_index.append(SEARCH_INDEX_PATH, indexed)
         
         # Return success response
         return jsonify({
@@ -147,8 +300,8 @@ def search():
             'redirect': '/map'
         })
     except Exception as e:
-        progress['current_step'] = f"Error: {str(e)}"
-        progress['progress'] = 0
+        journal.close()
+        set_progress(current_step=f"Error: {str(e)}", progress=0)
         
         import traceback
         traceback.print_exc()
@@ -157,35 +310,86 @@ def search():
 @app.route('/map')
 def show_map():
     """Show the generated map with locations."""
-    global locations
-    return render_template('map_view.html', locations=locations)
+    return render_template('map_view.html', locations=state.get('locations', []))
 
 @app.route('/map_file')
 def get_map_file():
     """Return the generated HTML map file."""
-    global current_map_path
+    current_map_path = state.get('map_path')
     if current_map_path and os.path.exists(current_map_path):
         return send_file(current_map_path)
     return "Map not generated yet", 404
 
+@app.route('/metrics')
+def get_metrics():
+    """Expose stage latencies, cache hit ratios and job counts for Prometheus."""
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/traces')
+def list_traces():
+    """List the recorded search traces, newest first (recorded when HAIKYO_TRACE is set)."""
+    return jsonify({'enabled': tracing.ENABLED, 'traces': tracing.store.summaries()})
+
+@app.route('/traces/<job_id>')
+def download_trace(job_id):
+    """Download a search trace as trace-event JSON for chrome://tracing or Perfetto."""
+    trace = tracing.store.get(job_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return Response(trace.to_json(), mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename={job_id}.json'})
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Sample every thread's stack for ?seconds=N and return collapsed stacks (needs HAIKYO_PROFILER=1)."""
+    if not profiling.ENABLED:
+        return jsonify({'error': 'Profiler is disabled'}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({'error': 'seconds must be a number'}), 400
+    try:
+        stacks = profiling.profiler.profile(seconds)
+    except profiling.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(profiling.collapse(stacks), mimetype='text/plain')
+
+@app.route('/images/<name>')
+def get_cached_image(name):
+    """Serve a cached popup thumbnail."""
+    return send_from_directory(get_image_cache().cache_dir, name, max_age=86400)
+
 @app.route('/export', methods=['GET'])
 def export_data():
     """Export the scraped data as JSON."""
-    global locations
+    locations = state.get('locations', [])
     if not locations:
         return jsonify({'error': 'No data to export'}), 400
     
     format_type = request.args.get('format', 'json')
     
     if format_type == 'kml':
-        return export_as_kml()
+        return export_as_kml(locations)
+    elif format_type == 'kmz':
+        return export_as_regionated_kmz(locations)
     else:
         return jsonify(locations)
 
-def export_as_kml():
+def kml_description(location):
+    """HTML popup for a location's KML placemark."""
+    address = location.get('address', '')
+    category = location.get('category', '')
+    url = location.get('url', '')
+    description = f'      <p><strong>Address:</strong> {address}</p>\n'
+    if category:
+        description += f'      <p><strong>Category:</strong> {category}</p>\n'
+    if url:
+        description += f'      <p><a href="{url}" target="_blank">View Original Page</a></p>\n'
+    description += f'      <p><strong>Coordinates:</strong> {location.get("latitude")}, {location.get("longitude")}</p>\n'
+    return description
+
+def export_as_kml(locations):
     """Export location data as KML for use in Google Earth/Maps."""
-    global locations
-    
     # Create KML content
     kml_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
     kml_content += '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
@@ -212,20 +416,10 @@ def export_as_kml():
         name = location.get('name', 'Unknown Location')
         lat = location.get('latitude')
         lon = location.get('longitude')
-        address = location.get('address', '')
-        category = location.get('category', '')
-        url = location.get('url', '')
         
         kml_content += '  <Placemark>\n'
         kml_content += f'    <name>{name}</name>\n'
-        kml_content += '    <description><![CDATA[\n'
-        kml_content += f'      <p><strong>Address:</strong> {address}</p>\n'
-        if category:
-            kml_content += f'      <p><strong>Category:</strong> {category}</p>\n'
-        if url:
-            kml_content += f'      <p><a href="{url}" target="_blank">View Original Page</a></p>\n'
-        kml_content += f'      <p><strong>Coordinates:</strong> {lat}, {lon}</p>\n'
-        kml_content += '    ]]></description>\n'
+        kml_content += f'    <description><![CDATA[\n{kml_description(location)}    ]]></description>\n'
         kml_content += '    <styleUrl>#haikyoIcon</styleUrl>\n'
         kml_content += '    <Point>\n'
         kml_content += f'      <coordinates>{lon},{lat},0</coordinates>\n'
@@ -242,11 +436,35 @@ def export_as_kml():
     
     return response
 
+def export_as_regionated_kmz(locations):
+    """Export location data as a regionated KMZ super-overlay for Google Earth."""
+    placemarks = [(location.get('name', 'Unknown Location'), location['latitude'], location['longitude'],
+                   kml_description(location))
+                  for location in locations if 'latitude' in location and 'longitude' in location]
+    
+    # Google Earth only loads the tiles of the visible area and zoom level
+    kmz = io.BytesIO()
+    with metrics.timed('kml_render'):
+        kml_regions.write_kmz(kml_regions.build_tiles(placemarks), kmz)
+    
+    response = make_response(kmz.getvalue())
+    response.headers['Content-Type'] = 'application/vnd.google-earth.kmz'
+    response.headers['Content-Disposition'] = 'attachment; filename=haikyo_locations.kmz'
+    
+    return response
+
 def main():
     """Main entry point for the application."""
+    args = serving.parse_args(description="HaikyoLocator web app")
+    
     # Create temporary directory for map files if it doesn't exist
     os.makedirs('temp', exist_ok=True)
     
+    # Production mode serves the app with several worker processes (see serving)
+    if args.production:
+        serving.serve('haikyo_locator:app', args.host, args.port, args.workers)
+        return
+    
     print("Starting HaikyoLocator...")
     print("Open your browser and navigate to http://localhost:5000")
     
@@ -254,7 +472,7 @@ def main():
     webbrowser.open('http://localhost:5000')
     
     # Run Flask app
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host=args.host, port=args.port, debug=args.debug)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,197 @@
+"""
+Module providing a durable journal for long-running crawl jobs.
+
+Every completed URL is appended to a JSON lines file together with its
+extracted record and flushed to disk, so a job that dies halfway can be
+resumed without fetching the finished pages again.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+
+def _read_journal(path):
+    """
+    Read the entries of a journal file.
+
+    Args:
+        path (str): Path to the journal file.
+
+    Returns:
+        tuple: (job description, dict of key to record, whether the job completed)
+    """
+    job = {}
+    records = {}
+    complete = False
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line
+                continue
+            if 'job' in entry:
+                job = entry['job']
+            elif 'key' in entry:
+                records[entry['key']] = entry.get('record')
+            elif entry.get('complete'):
+                complete = True
+    return job, records, complete
+
+
+class CrawlJournal:
+    """
+    Append-only journal of completed work for a single crawl job.
+
+    The first line of the file describes the job, each following line
+    records one completed key (usually a URL) and its result, and a final
+    marker line is written when the job finishes.
+    """
+
+    def __init__(self, path, job=None):
+        """
+        Open a journal, replaying any entries already on disk.
+
+        Args:
+            path (str): Path to the journal file.
+            job (dict, optional): Description of the job, written as the header
+                of a new journal (e.g. the list of URLs to crawl).
+        """
+        self.path = path
+        self.job = job or {}
+        self.records = {}
+        self.complete = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            job, self.records, self.complete = _read_journal(path)
+            self.job = job or self.job
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding='utf-8')
+        if is_new:
+            self._append({'job': self.job})
+        elif self._ends_mid_line():
+            # Terminate a partially written entry so new entries stay parseable
+            self._file.write("\n")
+
+    @classmethod
+    def for_job(cls, directory, job_key, job=None):
+        """
+        Open the journal for a job identified by a key.
+
+        The same key always maps to the same file, so restarting an interrupted
+        job with the same input picks up where it left off. A journal whose job
+        already finished is discarded and the job starts fresh.
+
+        Args:
+            directory (str): Directory holding journal files.
+            job_key (str): Identifies the job, e.g. the joined list of URLs.
+            job (dict, optional): Description of the job for new journals.
+
+        Returns:
+            CrawlJournal: The opened journal.
+        """
+        digest = hashlib.sha1(job_key.encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(directory, f"job_{digest}.jsonl")
+        if os.path.exists(path) and _read_journal(path)[2]:
+            os.remove(path)
+        return cls(path, job)
+
+    @staticmethod
+    def unfinished(directory):
+        """
+        List the journals in a directory whose jobs never finished.
+
+        Args:
+            directory (str): Directory holding journal files.
+
+        Returns:
+            list: Paths of unfinished journal files.
+        """
+        if not os.path.isdir(directory):
+            return []
+
+        paths = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.jsonl'):
+                continue
+            path = os.path.join(directory, name)
+            if not _read_journal(path)[2]:
+                paths.append(path)
+        return paths
+
+    def _ends_mid_line(self):
+        """Check whether the journal file ends without a trailing newline."""
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _append(self, entry):
+        """Write one entry and make sure it reaches the disk."""
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key, default=None):
+        """
+        Get the recorded result for a key.
+
+        Args:
+            key (str): The journal key.
+            default: Value returned if the key has not been recorded.
+
+        Returns:
+            The recorded result, or default.
+        """
+        return self.records.get(key, default)
+
+    def pending(self, keys):
+        """
+        Filter out keys that were already completed.
+
+        Args:
+            keys (iterable): Keys of the job.
+
+        Returns:
+            list: Keys that still need to be processed, in order, without duplicates.
+        """
+        return [key for key in dict.fromkeys(keys) if key not in self.records]
+
+    def record(self, key, record):
+        """
+        Record a completed key and its result.
+
+        Args:
+            key (str): The journal key, usually a URL.
+            record: JSON-serializable result for the key.
+        """
+        with self._lock:
+            if key in self.records:
+                return
+            self._append({'key': key, 'record': record})
+            self.records[key] = record
+
+    def finish(self):
+        """Mark the job as complete and close the journal."""
+        with self._lock:
+            if not self.complete:
+                self._append({'complete': True})
+                self.complete = True
+        self.close()
+
+    def close(self):
+        """Close the journal file without marking the job complete."""
+        if not self._file.closed:
+            self._file.close()
@@ -4,25 +4,34 @@ Handles the creation of interactive maps with location markers.
 """
 
 import os
-import folium
-from folium.plugins import MarkerCluster
 import random
 import string
 import tempfile
 
+import metrics
+
 class MapGenerator:
     """A class to generate interactive maps with location markers."""
     
-    def __init__(self):
-        """Initialize the map generator."""
+    def __init__(self, image_cache=None, image_route='/images/'):
+        """
+        Initialize the map generator.
+        
+        Args:
+            image_cache (ImageCache, optional): Thumbnail cache; when set, popup
+                images are served locally instead of hotlinked.
+            image_route (str): URL prefix under which cached images are served.
+        """
         self.temp_dir = 'temp'
         os.makedirs(self.temp_dir, exist_ok=True)
+        self.image_cache = image_cache
+        self.image_route = image_route
     
     def _random_string(self, length=8):
         """Generate a random string for unique filenames."""
         return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
     
-    def _create_popup_html(self, location):
+    def _create_popup_html(self, location, cached_images=None):
         """Create HTML content for location popups."""
         html = f"""
         <div class="location-popup">
@@ -30,7 +39,10 @@ class MapGenerator:
         """
         
         if location.get('image_url'):
-            html += f"""<img src="{location['image_url']}" alt="{location.get('name', 'Location image')}" style="max-width:200px; max-height:150px;"><br>"""
+            image_url = location['image_url']
+            if cached_images and image_url in cached_images:
+                image_url = self.image_route + cached_images[image_url]
+            html += f"""<img src="{image_url}" alt="{location.get('name', 'Location image')}" style="max-width:200px; max-height:150px;"><br>"""
         
         if location.get('address'):
             html += f"""<strong>Address:</strong> {location['address']}<br>"""
@@ -61,6 +73,10 @@ class MapGenerator:
         if not locations:
             raise ValueError("No locations provided for map generation")
         
+        # folium is imported on first use to keep startup fast
+        import folium
+        from folium.plugins import MarkerCluster
+        
         # Determine map center if not provided
         if not center:
             # Use the center of all locations or default to center of Japan
@@ -77,10 +93,17 @@ class MapGenerator:
         # Add marker cluster
         marker_cluster = MarkerCluster().add_to(m)
         
+        # Download popup thumbnails concurrently before building the markers
+        cached_images = {}
+        if self.image_cache:
+            cached_images = self.image_cache.cache_many(
+                location.get('image_url') for location in locations
+                if 'latitude' in location and 'longitude' in location)
+        
         # Add markers for each location
         for location in locations:
             if 'latitude' in location and 'longitude' in location:
-                popup_html = self._create_popup_html(location)
+                popup_html = self._create_popup_html(location, cached_images)
                 folium.Marker(
                     location=[location['latitude'], location['longitude']],
                     popup=folium.Popup(popup_html, max_width=300),
@@ -93,6 +116,7 @@ class MapGenerator:
         filepath = os.path.join(self.temp_dir, filename)
         
         # Save map to file
-        m.save(filepath)
+        with metrics.timed('map_render'):
+            m.save(filepath)
         
         return filepath
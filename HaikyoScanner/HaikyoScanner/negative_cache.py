@@ -0,0 +1,126 @@
+"""
+Module for remembering spots whose coordinates cannot be resolved.
+
+About a third of spots have no map embed, and every run sends them through
+the whole chain of fallbacks (extraction patterns, blog posts, geocoding
+queries) only to come up empty again. This cache records such spots in
+SQLite, keyed by spot and tied to a hash of the page content, so repeated
+runs skip the fallbacks until the entry expires or the page changes.
+"""
+
+import time
+import sqlite3
+import hashlib
+import threading
+
+import metrics
+
+# Entries are retried after this many seconds even if the page is unchanged
+DEFAULT_TTL = 14 * 24 * 3600
+
+
+def content_digest(content):
+    """
+    Hash page content for comparison with a cached entry.
+
+    Runs of whitespace are collapsed, so re-indented pages keep their digest.
+
+    Args:
+        content (str or bytes): The page content.
+
+    Returns:
+        str: Hex digest.
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='replace')
+    return hashlib.sha1(b" ".join(content.split())).hexdigest()
+
+
+class NegativeCache:
+    """
+    Persistent, thread-safe set of known unresolvable spots with a TTL.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, name='unresolvable'):
+        """
+        Open (and create if needed) the cache.
+
+        Args:
+            path (str): Path to the SQLite database file.
+            ttl (float): Seconds an entry stays valid.
+            name (str): Cache name used in the hit/miss metrics.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS unresolvable (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def is_unresolvable(self, key, digest):
+        """
+        Check whether a spot is known to be unresolvable.
+
+        Args:
+            key (str): Spot id or URL.
+            digest (str): content_digest() of the current page.
+
+        Returns:
+            bool: True if the spot failed before with the same content and
+                the entry has not expired.
+        """
+        with self._lock:
+            row = self.conn.execute('SELECT digest, expires FROM unresolvable WHERE key = ?',
+                                    (key,)).fetchone()
+        hit = row is not None and row[0] == digest and row[1] > time.time()
+        metrics.cache_lookup(self.name, hit)
+        return hit
+
+    def mark_unresolvable(self, key, digest):
+        """
+        Record that a spot could not be resolved.
+
+        Args:
+            key (str): Spot id or URL.
+            digest (str): content_digest() of the page that failed.
+        """
+        with self._lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO unresolvable (key, digest, expires) VALUES (?, ?, ?)',
+                              (key, digest, time.time() + self.ttl))
+
+    def forget(self, key):
+        """
+        Remove a spot, e.g. after it was resolved.
+
+        Args:
+            key (str): Spot id or URL.
+        """
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM unresolvable WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        """
+        Delete expired entries.
+
+        Returns:
+            int: Number of entries deleted.
+        """
+        with self._lock, self.conn:
+            return self.conn.execute('DELETE FROM unresolvable WHERE expires <= ?',
+                                     (time.time(),)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM unresolvable').fetchone()[0]
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
@@ -0,0 +1,124 @@
+"""
+Module for an in-process sampling profiler.
+
+While a profile runs, a sampler thread reads the stacks of every other
+thread at a fixed interval with sys._current_frames() and counts each
+distinct stack. The request that asked for the profile waits for the
+sampler, so profiles are short and one runs at a time: under gunicorn
+that request holds one of the worker's threads meanwhile. The result is returned in the collapsed stack format
+("thread;outer;inner count" per line) read by flamegraph.pl, speedscope
+and similar tools. Nothing runs and nothing is hooked while no profile
+is being taken.
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Set HAIKYO_PROFILER=1 to expose the profiler endpoint
+ENABLED = os.environ.get('HAIKYO_PROFILER', '0') not in ('', '0')
+
+# Default time between samples in seconds
+DEFAULT_INTERVAL = 0.01
+
+# Longest profile accepted, in seconds; the waiting request holds a server thread
+MAX_SECONDS = 30
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame):
+    """Describe a stack frame as 'function (file:line)'."""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads of the process.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        """
+        Initialize the profiler.
+
+        Args:
+            interval (float): Seconds between samples.
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def sample_once(self, stacks, skip=()):
+        """
+        Take one sample of every thread's stack.
+
+        Args:
+            stacks (Counter): Collapsed stack -> sample count, updated in place.
+            skip (iterable): Thread ids not to sample.
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in skip:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}").replace(';', ':'))
+            stacks[";".join(reversed(labels))] += 1
+
+    def _sample(self, seconds, stacks, skip):
+        """Sample every thread but those in skip (and this one) until seconds have passed."""
+        skip = set(skip) | {threading.get_ident()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample_once(stacks, skip)
+            time.sleep(self.interval)
+
+    def profile(self, seconds):
+        """
+        Sample all threads for a while from a sampler thread.
+
+        Args:
+            seconds (float): How long to sample, at most MAX_SECONDS.
+
+        Returns:
+            Counter: Collapsed stack -> number of samples.
+
+        Raises:
+            ProfilerBusy: If another profile is running.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            stacks = Counter()
+            # The calling thread only waits, so it is left out of the samples
+            sampler = threading.Thread(target=self._sample, name='profiler', daemon=True,
+                                       args=(min(max(seconds, 0), MAX_SECONDS), stacks,
+                                             {threading.get_ident()}))
+            sampler.start()
+            sampler.join()
+            return stacks
+        finally:
+            self._lock.release()
+
+
+def collapse(stacks):
+    """
+    Render sampled stacks in the collapsed stack format, most frequent first.
+
+    Args:
+        stacks (Counter): Collapsed stack -> number of samples.
+
+    Returns:
+        str: One "stack count" line per distinct stack.
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Profiler shared by the whole process
+profiler = SamplingProfiler()
@@ -6,9 +6,120 @@ Handles web scraping from haikyo.info.
 import re
 import json
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 
+import metrics
+import tracing
+from rate_control import rate_controller
+from singleflight import SingleFlight
+from extraction import ExtractionPlan, Field, Rule, tag, text
+
+
+def _text_of(element):
+    """Stripped text of an element."""
+    return element.get_text(strip=True)
+
+
+def _address_text(string):
+    """Text of the paragraph, div or span around an address-like string."""
+    parent = string.parent
+    if parent is not None and parent.name in ('p', 'div', 'span'):
+        return parent.get_text(strip=True)
+    return None
+
+
+def _json_ld(script):
+    """Parsed JSON-LD object of a script element, if it is one."""
+    try:
+        data = json.loads(script.string or "")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _description_text(paragraph):
+    """Paragraph text long enough to describe the location, truncated to 200 characters."""
+    text = paragraph.get_text(strip=True)
+    if len(text) > 50 and not re.match(r'^(https?:|www\.|住所|Address|カテゴリ|Category)', text):
+        return text[:200] + '...' if len(text) > 200 else text
+    return None
+
+
+def _valid_coordinates(lat, lng):
+    """Coordinates as floats, or None if they are unset (0) or out of range."""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if lat == 0 or lng == 0 or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def _spot_info_coordinates(script):
+    """Coordinates from the window.spot_info object the site embeds for its map."""
+    match = re.search(r'window\.spot_info\s*=\s*(\{.*?\});', script.string, re.DOTALL)
+    if not match:
+        return None
+    lat = re.search(r'["\']?\blat["\']?\s*:\s*["\']?(-?[\d.]+)', match.group(1))
+    lng = re.search(r'["\']?\b(?:lng|lon)["\']?\s*:\s*["\']?(-?[\d.]+)', match.group(1))
+    coordinates = lat and lng and _valid_coordinates(lat.group(1), lng.group(1))
+    return ('spot_info',) + coordinates if coordinates else None
+
+
+def _map_div_coordinates(div):
+    """Coordinates from the data-lat and data-lng attributes of the spot map."""
+    coordinates = _valid_coordinates(div['data-lat'], div['data-lng'])
+    return ('map_div',) + coordinates if coordinates else None
+
+
+def _embed_coordinates(iframe):
+    """Coordinates from a Google Maps embed URL."""
+    src = iframe['src']
+    if 'google.com/maps' not in src and 'maps.google' not in src:
+        return None
+    match = re.search(r'!2d([\d.-]+)!3d([\d.-]+)', src)
+    if match:
+        coordinates = _valid_coordinates(match.group(2), match.group(1))
+    else:
+        match = re.search(r'[?&](?:q|ll)=([\d.-]+),([\d.-]+)', src)
+        coordinates = match and _valid_coordinates(match.group(1), match.group(2))
+    return ('iframe',) + coordinates if coordinates else None
+
+
+def _title_name(title):
+    """Page title without the site name."""
+    return re.sub(r'\s*[-|]\s*.*$', '', title.get_text(strip=True)) or None
+
+
+# Everything _enrich_from_detail_page reads from a detail page, gathered in one walk
+DETAIL_PAGE_PLAN = ExtractionPlan(
+    Field('labelled_address',
+          Rule(tag('p', 'div', 'span'), _text_of,
+               after=text(re.compile(r'住所|Address', re.IGNORECASE)))),
+    Field('meta_description',
+          Rule(tag('meta', name='description', content=True), lambda meta: meta['content'])),
+    Field('json_ld',
+          Rule(tag('script', type='application/ld+json'), _json_ld), many=True),
+    Field('address',
+          Rule(text(re.compile(r'県.*[市町村]|[市町村].*県', re.DOTALL)), _address_text)),
+    Field('category',
+          Rule(tag('p', 'div', 'span', 'a'), _text_of,
+               after=text(re.compile(r'カテゴリ|Category', re.IGNORECASE)))),
+    Field('first_keyword',
+          Rule(tag('meta', name='keywords', content=True),
+               lambda meta: meta['content'].split(',')[0].strip())),
+    Field('description', Rule(tag('p'), _description_text)),
+    Field('title', Rule(tag('title'), _title_name)),
+    # (method, lat, lng) from the map data embedded in the page, in the order the site prefers them
+    Field('coordinates',
+          Rule(tag('script', where=lambda script: 'window.spot_info' in (script.string or "")),
+               _spot_info_coordinates),
+          Rule(tag('div', class_='spot_map', **{'data-lat': True, 'data-lng': True}),
+               _map_div_coordinates),
+          Rule(tag('iframe', src=True), _embed_coordinates)),
+)
+
 class Scraper:
     """A class to scrape haikyo (abandoned places) information from haikyo.info."""
     
@@ -19,18 +130,29 @@ class Scraper:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8'
         }
+        # Concurrent searches fetching the same page share one download
+        self.page_flights = SingleFlight('page')
     
     def _make_request(self, url):
         """Make a request to the given URL and return the BeautifulSoup object."""
         try:
-            # Add timeout to prevent hanging
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            return BeautifulSoup(response.content, 'html.parser')
+            content = self.page_flights.do(url, self._fetch, url)
+            with metrics.timed('parse'):
+                # bs4 is imported on first use to keep startup fast
+                from bs4 import BeautifulSoup
+                return BeautifulSoup(content, 'html.parser')
         except requests.exceptions.RequestException as e:
             print(f"Warning: Error making request to {url}: {str(e)}")
             raise Exception(f"Error making request to {url}: {str(e)}")
     
+    def _fetch(self, url):
+        """Fetch a URL and return its body; raises for error responses."""
+        with metrics.timed('fetch'):
+            # Add timeout to prevent hanging
+            response = rate_controller.get(requests, url, headers=self.headers, timeout=10)
+            response.raise_for_status()
+            return response.content
+    
     def _is_search_url(self, url):
         """Check if the URL is a search URL."""
         parsed_url = urlparse(url)
@@ -193,22 +315,22 @@ class Scraper:
     
     def _enrich_location_data(self, location):
         """Get additional data from the location's detail page."""
+        with tracing.span('enrich_location_data', url=location['url']):
+            self._enrich_from_detail_page(location)
+    
+    def _enrich_from_detail_page(self, location):
+        """Fill in the address, description, image and embedded coordinates from the detail page."""
         detail_soup = self._make_request(location['url'])
+        with metrics.timed('extract'):
+            fields = DETAIL_PAGE_PLAN.run(detail_soup)
         
-        # Try to extract address
-        address_element = detail_soup.find(string=re.compile(r'住所|Address', re.IGNORECASE))
-        if address_element and hasattr(address_element, 'parent'):
-            parent = address_element.parent
-            # Look for the address text in nearby elements
-            if parent and hasattr(parent, 'find_next'):
-                next_element = parent.find_next(['p', 'div', 'span'])
-                if next_element:
-                    location['address'] = next_element.get_text(strip=True)
+        # An address next to an address label wins over the one from the search results
+        if 'labelled_address' in fields:
+            location['address'] = fields['labelled_address']
         
         # Direct meta information extraction
-        meta_info = detail_soup.find('meta', attrs={'name': 'description'})
-        if meta_info and meta_info.get('content'):
-            meta_content = meta_info.get('content')
+        meta_content = fields.get('meta_description')
+        if meta_content:
             # Extract address from meta description
             address_match = re.search(r'所在地：([^。]+)', meta_content)
             if address_match and not location.get('address'):
@@ -219,37 +341,29 @@ class Scraper:
                 location['description'] = meta_content[:200] + '...' if len(meta_content) > 200 else meta_content
         
         # Try to find address in structured data
-        script_elements = detail_soup.find_all('script', attrs={'type': 'application/ld+json'})
-        for script in script_elements:
-            if script.string:
+        for json_data in fields['json_ld']:
+            # Extract address from JSON-LD
+            if 'address' in json_data and not location.get('address'):
                 try:
-                    json_data = json.loads(script.string)
-                    if isinstance(json_data, dict):
-                        # Extract address from JSON-LD
-                        if 'address' in json_data and not location.get('address'):
-                            location['address'] = json_data['address'].get('addressRegion', '') + json_data['address'].get('addressLocality', '')
-                        
-                        # Extract name if missing
-                        if 'name' in json_data and not location.get('name'):
-                            location['name'] = json_data['name']
-                            
-                        # Extract image if missing
-                        if 'image' in json_data and not location.get('image_url'):
-                            image_url = json_data['image']
-                            if isinstance(image_url, list) and len(image_url) > 0:
-                                location['image_url'] = image_url[0]
-                            elif isinstance(image_url, str):
-                                location['image_url'] = image_url
-                except:
+                    location['address'] = json_data['address'].get('addressRegion', '') + json_data['address'].get('addressLocality', '')
+                except (AttributeError, TypeError):
                     pass
+            
+            # Extract name if missing
+            if 'name' in json_data and not location.get('name'):
+                location['name'] = json_data['name']
+                
+            # Extract image if missing
+            if 'image' in json_data and not location.get('image_url'):
+                image_url = json_data['image']
+                if isinstance(image_url, list) and len(image_url) > 0:
+                    location['image_url'] = image_url[0]
+                elif isinstance(image_url, str):
+                    location['image_url'] = image_url
         
-        # If address not found, try different approach
-        if not location.get('address'):
-            for element in detail_soup.find_all(['p', 'div', 'span']):
-                text = element.get_text(strip=True)
-                if '県' in text and ('市' in text or '町' in text or '村' in text):
-                    location['address'] = text
-                    break
+        # If address not found, use the first text that looks like one
+        if not location.get('address') and fields.get('address'):
+            location['address'] = fields['address']
         
         # Try to extract prefecture
         if location.get('address'):
@@ -257,42 +371,25 @@ class Scraper:
             if prefecture_match:
                 location['prefecture'] = prefecture_match.group(0)
         
-        # Try to extract category
-        category_element = detail_soup.find(string=re.compile(r'カテゴリ|Category', re.IGNORECASE))
-        if category_element and hasattr(category_element, 'parent'):
-            parent = category_element.parent
-            # Look for category text
-            if parent and hasattr(parent, 'find_next'):
-                next_element = parent.find_next(['p', 'div', 'span', 'a'])
-                if next_element:
-                    location['category'] = next_element.get_text(strip=True)
-        
-        # Also try to find category in meta keywords
-        if not location.get('category'):
-            keywords = detail_soup.find('meta', attrs={'name': 'keywords'})
-            if keywords and keywords.get('content'):
-                keyword_list = keywords.get('content').split(',')
-                if len(keyword_list) > 0:
-                    location['category'] = keyword_list[0].strip()
+        # Category next to a category label; the first meta keyword only if there is no category yet
+        if fields.get('category'):
+            location['category'] = fields['category']
+        elif not location.get('category') and fields.get('first_keyword'):
+            location['category'] = fields['first_keyword']
         
         # Extract a description if not already found
-        if not location.get('description'):
-            description_candidates = detail_soup.find_all(['p', 'div.content', 'div.description'])
-            for candidate in description_candidates:
-                text = candidate.get_text(strip=True)
-                if len(text) > 50 and not re.match(r'^(https?:|www\.|住所|Address|カテゴリ|Category)', text):
-                    location['description'] = text[:200] + '...' if len(text) > 200 else text
-                    break
+        if not location.get('description') and fields.get('description'):
+            location['description'] = fields['description']
                     
         # If we still don't have a name, try to extract from title
-        if not location.get('name'):
-            title_element = detail_soup.find('title')
-            if title_element:
-                title_text = title_element.get_text(strip=True)
-                # Remove site name from title
-                title_text = re.sub(r'\s*[-|]\s*.*$', '', title_text)
-                if title_text:
-                    location['name'] = title_text
+        if not location.get('name') and fields.get('title'):
+            location['name'] = fields['title']
+        
+        # Coordinates embedded in the page make geocoding the address unnecessary
+        if 'coordinates' in fields:
+            method, location['latitude'], location['longitude'] = fields['coordinates']
+            location['coordinate_source'] = method
+            metrics.coordinate_method(method)
     
     def _get_next_page_url(self, soup, current_url):
         """Get the URL of the next page if pagination exists."""
@@ -303,7 +400,7 @@ class Scraper:
             return urljoin(current_url, next_link['href'])
         return None
     
-    def scrape_locations(self, url, max_pages=5, enrich_data=True):
+    def scrape_locations(self, url, max_pages=5, enrich_data=True, journal=None):
         """
         Scrape location data from the given URL.
         
@@ -312,6 +409,8 @@ class Scraper:
             max_pages (int): Maximum number of pages to scrape if pagination exists.
             enrich_data (bool): Whether to scrape additional data from each location's detail page.
                                 Setting to False improves performance but returns less detailed data.
+            journal (CrawlJournal): Optional journal of enriched locations. Locations already in
+                                    the journal are not fetched again.
             
         Returns:
             list: A list of dictionaries containing location data.
@@ -325,7 +424,7 @@ class Scraper:
         
         # Check if this is a search URL or a direct location URL
         if self._is_search_url(url):
-            return self._scrape_search_results(url, max_pages, enrich_data)
+            return self._scrape_search_results(url, max_pages, enrich_data, journal)
         else:
             # Assume it's a direct location URL
             location = {'url': url}
@@ -338,7 +437,7 @@ class Scraper:
                     location['id'] = match.group(1)
             return [location] if enrich_data and location.get('name') else [location]
     
-    def _scrape_search_results(self, url, max_pages=5, enrich_data=True):
+    def _scrape_search_results(self, url, max_pages=5, enrich_data=True, journal=None):
         """
         Scrape location data from search results.
         
@@ -346,6 +445,7 @@ class Scraper:
             url (str): The URL to scrape
             max_pages (int): Maximum number of pages to scrape
             enrich_data (bool): Whether to fetch additional data from each location's detail page
+            journal (CrawlJournal): Optional journal of already enriched locations
         
         Returns:
             list: A list of location dictionaries
@@ -354,6 +454,8 @@ class Scraper:
         current_url = url
         page_count = 0
         
+        # Each page is only found through the previous page's next link, so
+        # pages are fetched in order rather than concurrently
         while current_url and page_count < max_pages:
             soup = self._make_request(current_url)
             cards = self._extract_location_cards(soup)
@@ -374,10 +476,14 @@ class Scraper:
                     }
                 # Spot panel format (current structure)
                 elif hasattr(card, 'get') and card.get('class') and 'spot_panel' in card.get('class'):
-                    location = self._extract_spot_panel_data(card, enrich_data)
+                    location = self._extract_spot_panel_data(card, enrich_data and journal is None)
                 else:
                     # Fall back to generic extraction
-                    location = self._extract_location_data(card, enrich_data)
+                    location = self._extract_location_data(card, enrich_data and journal is None)
+                
+                # With a journal, enrich here so finished locations are reused on resume
+                if journal is not None and enrich_data and location.get('url'):
+                    location = self._enrich_with_journal(location, journal)
                 
                 # Only add if we got at least a name or ID
                 if location.get('name') or location.get('id'):
@@ -393,6 +499,21 @@ class Scraper:
         
         return all_locations
         
+    def _enrich_with_journal(self, location, journal):
+        """Enrich a location unless the journal already holds its enriched data."""
+        if location['url'] in journal:
+            return journal.get(location['url'])
+        
+        if not location.get('address'):
+            try:
+                self._enrich_location_data(location)
+            except Exception as e:
+                print(f"Error enriching data for {location['name'] or location['id']}: {str(e)}")
+                return location
+        
+        journal.record(location['url'], location)
+        return location
+        
     def _extract_spot_panel_data(self, card, enrich_data=True):
         """
         Extract data from a spot_panel element (current haikyo.info format).
@@ -0,0 +1,249 @@
+"""
+Module for web app state shared by every worker process.
+
+The web apps used to keep job state, results and progress in module
+globals, which only works with a single server process: under a
+multi-process WSGI server, a progress poll handled by another worker saw
+none of it. The apps keep that state in a store instead. The default
+MemoryStateStore holds it in the process, as before; SQLiteStateStore
+holds it in a SQLite file that every worker opens, so any worker can
+answer any request. HAIKYO_STATE selects the store:
+
+    HAIKYO_STATE=sqlite:///var/lib/haikyo/state.db python main.py --production
+
+Values are JSON documents and are stored and returned as copies, so a
+change only takes effect when it is written back with set(), or with
+update() for read-modify-write, which is atomic across threads and
+processes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Environment variable selecting the store: empty or 'memory', or sqlite:///path
+STATE_ENV = 'HAIKYO_STATE'
+
+
+class MemoryStateStore:
+    """
+    State store for a single process, thread-safe.
+    """
+
+    # Visible to other worker processes
+    shared = False
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self._lock = threading.RLock()
+        # Key -> JSON text, so values behave like those of the SQLite store
+        self._values = {}
+
+    def get(self, key, default=None):
+        """
+        Get a value.
+
+        Args:
+            key (str): The key.
+            default: Returned if the key is not set.
+
+        Returns:
+            A copy of the value, or default.
+        """
+        with self._lock:
+            text = self._values.get(key)
+        return default if text is None else json.loads(text)
+
+    def set(self, key, value):
+        """
+        Set a value.
+
+        Args:
+            key (str): The key.
+            value: A JSON-serializable value.
+        """
+        text = json.dumps(value)
+        with self._lock:
+            self._values[key] = text
+
+    def update(self, key, fn, default=None):
+        """
+        Replace a value with fn(value) atomically.
+
+        Args:
+            key (str): The key.
+            fn (callable): Gets the current value (or default), returns the new one.
+            default: Passed to fn if the key is not set.
+
+        Returns:
+            The new value.
+        """
+        with self._lock:
+            value = fn(self.get(key, default))
+            self.set(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        """
+        Remove a value and return it.
+
+        Args:
+            key (str): The key.
+            default: Returned if the key is not set.
+
+        Returns:
+            The removed value, or default.
+        """
+        with self._lock:
+            text = self._values.pop(key, None)
+        return default if text is None else json.loads(text)
+
+
+class SQLiteStateStore:
+    """
+    State store in a SQLite file, shared by processes and thread-safe.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        """
+        Open (and create if needed) the store.
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def _connection(self):
+        """The connection of this process; a forked worker opens its own."""
+        if self._pid != os.getpid():
+            # Autocommit; update() and pop() open their own transactions
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False,
+                                         isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    def _read(self, conn, key):
+        """JSON text of a value, or None."""
+        row = conn.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, conn, key, value):
+        """Store a value."""
+        conn.execute('INSERT INTO state (key, value, updated) VALUES (?, ?, ?) '
+                     'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated',
+                     (key, json.dumps(value), time.time()))
+
+    def get(self, key, default=None):
+        """
+        Get a value.
+
+        Args:
+            key (str): The key.
+            default: Returned if the key is not set.
+
+        Returns:
+            A copy of the value, or default.
+        """
+        with self._lock:
+            text = self._read(self._connection(), key)
+        return default if text is None else json.loads(text)
+
+    def set(self, key, value):
+        """
+        Set a value.
+
+        Args:
+            key (str): The key.
+            value: A JSON-serializable value.
+        """
+        with self._lock:
+            self._write(self._connection(), key, value)
+
+    def update(self, key, fn, default=None):
+        """
+        Replace a value with fn(value) atomically.
+
+        The write lock is taken before the value is read, so concurrent
+        updates from other processes wait rather than get lost.
+
+        Args:
+            key (str): The key.
+            fn (callable): Gets the current value (or default), returns the new one.
+            default: Passed to fn if the key is not set.
+
+        Returns:
+            The new value.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                text = self._read(conn, key)
+                value = fn(default if text is None else json.loads(text))
+                self._write(conn, key, value)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return value
+
+    def pop(self, key, default=None):
+        """
+        Remove a value and return it.
+
+        Args:
+            key (str): The key.
+            default: Returned if the key is not set.
+
+        Returns:
+            The removed value, or default.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                text = self._read(conn, key)
+                conn.execute('DELETE FROM state WHERE key = ?', (key,))
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        return default if text is None else json.loads(text)
+
+
+def open_state_store(spec=None):
+    """
+    Open the state store named by a spec or the HAIKYO_STATE variable.
+
+    Args:
+        spec (str, optional): 'memory' (also empty), or 'sqlite:///path';
+            defaults to the value of HAIKYO_STATE.
+
+    Returns:
+        MemoryStateStore or SQLiteStateStore: The store.
+
+    Raises:
+        ValueError: If the spec names no known store.
+    """
+    spec = os.environ.get(STATE_ENV, '') if spec is None else spec
+    if spec in ('', 'memory'):
+        return MemoryStateStore()
+    if spec.startswith('sqlite:///'):
+        return SQLiteStateStore(spec[len('sqlite:///'):])
+    raise ValueError(f"Unknown state store '{spec}'; use 'memory' or 'sqlite:///path'")
@@ -6,6 +6,9 @@ document.addEventListener('DOMContentLoaded', function() {
             e.preventDefault();
             const searchTerm = document.getElementById('search-term').value.trim();
             const maxLocations = document.getElementById('max-locations').value;
+            const localFirst = document.getElementById('local-first').checked ? '1' : '';
+            const prefecture = document.getElementById('local-prefecture').value.trim();
+            const category = document.getElementById('local-category').value.trim();
             
             if (!searchTerm) {
                 alert('Please enter a search term or URL');
@@ -34,7 +37,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: {
                     'Content-Type': 'application/x-www-form-urlencoded',
                 },
-                body: `search_term=${encodeURIComponent(searchTerm)}&max_locations=${encodeURIComponent(maxLocations)}`
+                body: `search_term=${encodeURIComponent(searchTerm)}&max_locations=${encodeURIComponent(maxLocations)}&local_first=${localFirst}` +
+                      `&prefecture=${encodeURIComponent(prefecture)}&category=${encodeURIComponent(category)}`
             })
             .then(response => response.json())
             .then(data => {
@@ -0,0 +1,281 @@
+"""
+Module for per-job span tracing in the Chrome trace-event format.
+
+A background job records a trace while it runs; every span opened on the
+job's thread (and on worker threads started through propagate()) becomes
+a complete event with its start time and duration. Finished traces are
+kept in memory and can be downloaded as JSON and opened in a trace viewer
+such as chrome://tracing or Perfetto.
+
+Tracing is off unless the HAIKYO_TRACE environment variable is set; when
+it is off, span() returns a shared no-op context manager.
+"""
+
+import os
+import json
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+# Record a trace for every job when HAIKYO_TRACE is set to anything but 0
+ENABLED = os.environ.get('HAIKYO_TRACE', '0') not in ('', '0')
+
+# Number of finished traces kept for download
+MAX_TRACES = 20
+
+_local = threading.local()
+_job_numbers = itertools.count(1)
+
+
+class Trace:
+    """
+    Spans recorded for one job.
+    """
+
+    def __init__(self, job_id, name):
+        """
+        Start an empty trace.
+
+        Args:
+            job_id (str): Unique id of the job.
+            name (str): Job kind, e.g. 'scrape'.
+        """
+        self.job_id = job_id
+        self.name = name
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, started, ended, args=None):
+        """
+        Add a complete span.
+
+        Args:
+            name (str): Span name.
+            started (float): time.perf_counter() at the start of the span.
+            ended (float): time.perf_counter() at the end of the span.
+            args (dict, optional): Extra data shown with the span.
+        """
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': self.name,
+            'ph': 'X',
+            'ts': round((started - self.origin) * 1e6, 1),
+            'dur': round((ended - started) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self.threads.setdefault(thread.ident, thread.name)
+
+    def to_dict(self):
+        """
+        Build the trace-event JSON object.
+
+        Returns:
+            dict: Object with 'traceEvents' and job metadata.
+        """
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        pid = os.getpid()
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                     'args': {'name': f"{self.name} {self.job_id}"}}]
+        metadata.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                         'args': {'name': thread_name}} for tid, thread_name in threads.items())
+        return {
+            'traceEvents': metadata + events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'job_id': self.job_id, 'job': self.name,
+                          'started_at': self.started_at},
+        }
+
+    def to_json(self):
+        """Serialize the trace as JSON text."""
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+
+class TraceStore:
+    """
+    Bounded, thread-safe collection of finished traces.
+    """
+
+    def __init__(self, max_traces=MAX_TRACES):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, trace):
+        """Keep a finished trace, dropping the oldest one if full."""
+        with self._lock:
+            self._traces[trace.job_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, job_id):
+        """
+        Get a trace by job id.
+
+        Returns:
+            Trace: The trace, or None if unknown.
+        """
+        with self._lock:
+            return self._traces.get(job_id)
+
+    def summaries(self):
+        """
+        List the stored traces, newest first.
+
+        Returns:
+            list: Dictionaries with job_id, job, started_at and span count.
+        """
+        with self._lock:
+            traces = list(self._traces.values())
+        return [{'job_id': trace.job_id, 'job': trace.name, 'started_at': trace.started_at,
+                 'spans': len(trace.events)} for trace in reversed(traces)]
+
+
+# Finished traces of this process
+store = TraceStore()
+
+
+def current():
+    """
+    Get the trace being recorded on this thread.
+
+    Returns:
+        Trace: The active trace, or None.
+    """
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def record(name, enabled=None):
+    """
+    Record a trace for the job running on this thread.
+
+    Args:
+        name (str): Job kind, e.g. 'scrape'.
+        enabled (bool, optional): Override the HAIKYO_TRACE setting.
+
+    Yields:
+        Trace: The trace being recorded, or None when tracing is disabled.
+    """
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+
+    job_id = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{next(_job_numbers)}"
+    trace = Trace(job_id, name)
+    previous = current()
+    _local.trace = trace
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.add(name, started, time.perf_counter())
+        _local.trace = previous
+        store.put(trace)
+
+
+class _Span:
+    """Context manager adding one span to a trace."""
+
+    __slots__ = ('trace', 'name', 'args', 'started')
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.trace.add(self.name, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class _NullSpan:
+    """Shared no-op span used when no trace is being recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """
+    Time a block as a span of the current trace.
+
+    Args:
+        name (str): Span name.
+        **args: Extra data shown with the span, e.g. the URL.
+
+    Returns:
+        A context manager; a no-op one when no trace is being recorded.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, args)
+
+
+def add_span(name, started, ended):
+    """
+    Add an already timed span to the current trace, if any.
+
+    Args:
+        name (str): Span name.
+        started (float): time.perf_counter() at the start of the span.
+        ended (float): time.perf_counter() at the end of the span.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(name, started, ended)
+
+
+def propagate(func):
+    """
+    Make a function record into the caller's trace when run on another thread.
+
+    Use it for functions handed to thread pools.
+
+    Args:
+        func (function): The function to wrap.
+
+    Returns:
+        function: The wrapped function, or func itself when not tracing.
+    """
+    trace = current()
+    if trace is None:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = current()
+        _local.trace = trace
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.trace = previous
+    return wrapper